@@ -0,0 +1,108 @@
+""" Same load as benchmarks.api_load, driven through the asyncio clients of
+mee6.aio from as many tasks as api_load has greenlets, to compare both.
+
+    python -m benchmarks.aio_load [--mode send_message] [--tasks 100]
+                                  [--calls 2000] [--channels 20]
+"""
+import aiohttp
+import argparse
+import asyncio
+
+from contextlib import nullcontext
+from time import time
+from mee6.aio import APIClient, RPCClient
+from mee6.aio.discord import DiscordHTTPClient
+from mee6.aio.rpc import RPCHTTPClient
+from mee6.exceptions import APIException, RPCException
+from benchmarks.load import MODES, channel_id, guild_id, standin, stats_url, report
+
+
+class Load:
+    def __init__(self, client, mode, channels):
+        self.client = client
+        self.mode = mode
+        self.channels = channels
+        self.latencies = []
+        self.errors = 0
+
+    async def call(self, i):
+        if self.mode == 'get_guild_member':
+            await self.client.get_guild_member(guild_id(i, self.channels),
+                                               1000 + i)
+        elif self.mode == 'send_webhook_message':
+            channel = channel_id(i, self.channels)
+            webhook_id = 'benchmark:{}'.format(channel)
+            await self.client.send_webhook_message(webhook_id, channel,
+                                                   'Load test message {}'.format(i))
+        else:
+            await self.client.send_message(channel_id(i, self.channels),
+                                           'Load test message {}'.format(i))
+
+    async def run(self, i):
+        start = time()
+        try:
+            await self.call(i)
+        except (APIException, RPCException):
+            self.errors += 1
+            return
+
+        self.latencies.append(time() - start)
+
+
+async def drive(load, tasks, calls):
+    semaphore = asyncio.Semaphore(tasks)
+
+    async def run(i):
+        async with semaphore:
+            await load.run(i)
+
+    await asyncio.gather(*(run(i) for i in range(calls)))
+
+
+async def run(args, base_url):
+    if args.mode == 'get_guild_member':
+        RPCHTTPClient.BASE_URL = base_url
+        client = RPCClient()
+    else:
+        DiscordHTTPClient.BASE_URL = base_url
+        APIClient.TOKEN = APIClient.TOKEN or 'benchmark'
+        client = APIClient()
+    load = Load(client, args.mode, args.channels)
+
+    start = time()
+    await drive(load, args.tasks, args.calls)
+    duration = time() - start
+
+    await client.close()
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(stats_url(base_url)) as r:
+            stats = await r.json()
+
+    return load, duration, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', default='send_message', choices=sorted(MODES))
+    parser.add_argument('--tasks', type=int, default=100)
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--url', help='base url of a running stand-in')
+    args = parser.parse_args()
+
+    if args.url:
+        running = nullcontext(args.url.rstrip('/'))
+    else:
+        running = standin(args.mode, port=args.port, latency=args.latency)
+
+    with running as base_url:
+        load, duration, stats = asyncio.run(run(args, base_url))
+
+    report('asyncio', args.mode, load.latencies, load.errors, duration, stats)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+""" Drives the gevent APIClient or RPCClient against a local stand-in from
+many greenlets and reports the achieved throughput, the 429s incurred and
+the latency percentiles of the calls.
+
+    python -m benchmarks.api_load [--mode send_message] [--greenlets 100]
+                                  [--calls 2000] [--channels 20]
+
+The modes are send_message, send_webhook_message (APIClient, against
+`python -m benchmarks.standins.discord`) and get_guild_member (RPCClient,
+against `python -m benchmarks.standins.rpc`). The stand-in is started in a
+child process unless `--url` points to a running one, `--error-rate` makes
+the RPC stand-in fail that share of the requests. The
+send_webhook_message mode stores webhooks in the redis at REDIS_URL.
+
+`python -m benchmarks.aio_load` runs the same modes with the asyncio clients.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import requests
+
+from contextlib import nullcontext
+from gevent.pool import Pool
+from time import time
+from mee6.discord.api.client import APIClient
+from mee6.discord.api.http import HTTPClient
+from mee6.rpc.client import RPCClient
+from mee6.rpc.http import HTTPClient as RPCHTTPClient
+from mee6.exceptions import APIException, RPCException, CircuitOpenException
+from benchmarks.load import MODES, channel_id, guild_id, standin, stats_url, report
+
+
+class Load:
+    def __init__(self, client, mode, channels):
+        self.client = client
+        self.mode = mode
+        self.channels = channels
+        self.latencies = []
+        self.errors = 0
+        self.rejected = 0
+
+    def call(self, i):
+        if self.mode == 'get_guild_member':
+            self.client.get_guild_member(guild_id(i, self.channels), 1000 + i)
+        elif self.mode == 'send_webhook_message':
+            channel = channel_id(i, self.channels)
+            webhook_id = 'benchmark:{}'.format(channel)
+            self.client.send_webhook_message(webhook_id, channel,
+                                             'Load test message {}'.format(i))
+        else:
+            self.client.send_message(channel_id(i, self.channels),
+                                     'Load test message {}'.format(i))
+
+    def run(self, i):
+        start = time()
+        try:
+            self.call(i)
+        except (APIException, RPCException):
+            self.errors += 1
+            return
+        except CircuitOpenException:
+            self.rejected += 1
+            return
+
+        self.latencies.append(time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', default='send_message', choices=sorted(MODES))
+    parser.add_argument('--greenlets', type=int, default=100)
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.)
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--url', help='base url of a running stand-in')
+    args = parser.parse_args()
+
+    if args.url:
+        running = nullcontext(args.url.rstrip('/'))
+    else:
+        running = standin(args.mode, port=args.port, latency=args.latency,
+                          error_rate=args.error_rate)
+
+    with running as base_url:
+        if args.mode == 'get_guild_member':
+            RPCHTTPClient.BASE_URL = base_url
+            client = RPCClient()
+        else:
+            HTTPClient.BASE_URL = base_url
+            APIClient.TOKEN = APIClient.TOKEN or 'benchmark'
+            client = APIClient()
+        load = Load(client, args.mode, args.channels)
+
+        pool = Pool(args.greenlets)
+        start = time()
+        for i in range(args.calls):
+            pool.spawn(load.run, i)
+        pool.join()
+        duration = time() - start
+
+        stats = requests.get(stats_url(base_url)).json()
+
+    report('gevent', args.mode, load.latencies, load.errors, duration, stats,
+           rejected=load.rejected)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+""" Helpers shared by the client load benchmarks """
+import socket
+import subprocess
+import sys
+import time
+
+from contextlib import contextmanager
+
+
+# Stand-in module, default port and base path of every benchmark mode
+MODES = {'send_message': ('discord', 8500, '/api/v7'),
+         'send_webhook_message': ('discord', 8500, '/api/v7'),
+         'get_guild_member': ('rpc', 8501, '')}
+
+
+def channel_id(i, channels):
+    return 400000000000000000 + i % channels
+
+
+def guild_id(i, channels):
+    return 500000000000000000 + i % channels
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100. * (len(values) - 1))))
+    return values[index]
+
+
+@contextmanager
+def standin(mode, port=None, latency=0.05, error_rate=0.):
+    """ Runs the stand-in of `mode` in a child process, so that it doesn't
+    compete with the client for the event loop. Yields its base url. """
+    module, default_port, path = MODES[mode]
+    port = port or default_port
+
+    args = [sys.executable, '-m', 'benchmarks.standins.' + module,
+            '--port', str(port), '--latency', str(latency)]
+    if error_rate:
+        args += ['--error-rate', str(error_rate)]
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), 0.1).close()
+                break
+            except OSError:
+                if time.time() > deadline or process.poll() is not None:
+                    raise RuntimeError('The {} stand-in did not start'.format(module))
+                time.sleep(0.05)
+
+        yield 'http://127.0.0.1:{}{}'.format(port, path)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def stats_url(base_url):
+    return base_url.rsplit('/api/', 1)[0] + '/_stats'
+
+
+def report(client, mode, latencies, errors, duration, stats, rejected=0):
+    ms = lambda seconds: '{:.1f}ms'.format(seconds * 1000)
+    print('client:        {}'.format(client))
+    print('mode:          {}'.format(mode))
+    print('calls:         {} ok, {} failed in {:.1f}s'.format(len(latencies),
+                                                             errors,
+                                                             duration))
+    print('throughput:    {:.1f} calls/s'.format(len(latencies) / duration))
+    if rejected:
+        print('rejected:      {} by the circuit breakers'.format(rejected))
+    print('requests:      {} ({} 5xx)'.format(stats.get('requests', 0),
+                                            stats.get('503', 0)))
+    print('429s:          {} bucket, {} global'.format(stats.get('429', 0),
+                                                      stats.get('429_global', 0)))
+    print('latency:       p50 {} p90 {} p99 {} max {}'.format(
+        ms(percentile(latencies, 50)), ms(percentile(latencies, 90)),
+        ms(percentile(latencies, 99)), ms(max(latencies or [0]))))
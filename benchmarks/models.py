@@ -0,0 +1,149 @@
+""" Compares the slotted mee6.types models with the modus models they
+replaced, both in construction time and in memory.
+
+    python -m benchmarks.models [--count 10000]
+"""
+import argparse
+import timeit
+import tracemalloc
+
+from modus import Model as ModusModel
+from modus import fields as modus_fields
+
+from mee6.types import Member, Message, Guild
+
+
+# The modus models as they were before mee6.types.model
+class ModusUser(ModusModel):
+    id = modus_fields.Snowflake(required=True)
+    username = modus_fields.String()
+    discriminator = modus_fields.String()
+    avatar = modus_fields.String()
+
+
+class ModusVoiceState(ModusModel):
+    guild_id = modus_fields.Snowflake()
+    channel_id = modus_fields.Snowflake()
+    user_id = modus_fields.Snowflake()
+    session_id = modus_fields.String()
+
+
+class ModusMember(ModusModel):
+    user = modus_fields.ModelField(ModusUser)
+    nick = modus_fields.String()
+    roles = modus_fields.List(modus_fields.Snowflake())
+    joined_at = modus_fields.String()
+    voice_state = modus_fields.ModelField(ModusVoiceState)
+
+
+class ModusMessage(ModusModel):
+    id = modus_fields.Snowflake(required=True)
+    channel_id = modus_fields.Snowflake()
+    content = modus_fields.String()
+    timestamp = modus_fields.String()
+    edited_timestamp = modus_fields.String()
+    author = modus_fields.ModelField(ModusUser)
+    webhook_id = modus_fields.Snowflake()
+
+
+class ModusRole(ModusModel):
+    id = modus_fields.Snowflake(required=True)
+    name = modus_fields.String()
+    color = modus_fields.Integer()
+    permissions = modus_fields.Integer()
+
+
+class ModusChannel(ModusModel):
+    id = modus_fields.Snowflake(required=True)
+    name = modus_fields.String()
+    type = modus_fields.Integer()
+    position = modus_fields.Integer()
+
+
+class ModusGuild(ModusModel):
+    id = modus_fields.Snowflake(required=True)
+    name = modus_fields.String()
+    owner_id = modus_fields.Snowflake()
+    roles = modus_fields.List(modus_fields.ModelField(ModusRole))
+    channels = modus_fields.List(modus_fields.ModelField(ModusChannel))
+
+
+def user_payload(i):
+    return {'id': str(80351110224678912 + i),
+            'username': 'user{}'.format(i),
+            'discriminator': '{:04d}'.format(i % 10000),
+            'avatar': '8342729096ea3675442027381ff50dfe'}
+
+
+def member_payload(i):
+    return {'user': user_payload(i),
+            'nick': 'nick{}'.format(i),
+            'roles': [str(41771983423143936 + r) for r in range(5)],
+            'joined_at': '2015-04-26T06:26:56.936000+00:00',
+            'voice_state': {'guild_id': '41771983423143936',
+                            'channel_id': '127121515262115840',
+                            'user_id': str(80351110224678912 + i),
+                            'session_id': 'abcdef'}}
+
+
+def message_payload(i):
+    return {'id': str(162701077035089920 + i),
+            'channel_id': '131391742183342080',
+            'content': 'Supa Hot',
+            'timestamp': '2016-03-24T23:15:59.605000+00:00',
+            'edited_timestamp': None,
+            'author': user_payload(i),
+            'webhook_id': None}
+
+
+def guild_payload(i):
+    return {'id': str(41771983423143936 + i),
+            'name': 'guild{}'.format(i),
+            'owner_id': '80351110224678912',
+            'roles': [{'id': str(41771983423143936 + r), 'name': 'role',
+                       'color': 0, 'permissions': 104324161} for r in range(50)],
+            'channels': [{'id': str(127121515262115840 + c), 'name': 'chan',
+                          'type': c % 3, 'position': c} for c in range(50)]}
+
+
+CASES = [('Member', member_payload, ModusMember, Member),
+         ('Message', message_payload, ModusMessage, Message),
+         ('Guild', guild_payload, ModusGuild, Guild)]
+
+
+def measure(build, payloads):
+    duration = timeit.timeit(lambda: [build(p) for p in payloads], number=1)
+
+    tracemalloc.start()
+    objects = [build(p) for p in payloads]
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+
+    return duration, memory
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=10000)
+    args = parser.parse_args()
+
+    row = '{:<8} {:<14} {:>12} {:>14}'
+    print(row.format('type', 'implementation', 'us/object', 'bytes/object'))
+    for name, make_payload, modus_cls, cls in CASES:
+        count = args.count if name != 'Guild' else max(1, args.count // 50)
+        payloads = [make_payload(i) for i in range(count)]
+
+        builders = [('modus', lambda p: modus_cls(**p)),
+                    ('slotted', lambda p: cls(**p)),
+                    ('slotted strict', lambda p: cls(strict=True, **p))]
+
+        for implementation, build in builders:
+            duration, memory = measure(build, payloads)
+            print(row.format(name, implementation,
+                             '{:.2f}'.format(duration * 1e6 / count),
+                             memory // count))
+
+
+if __name__ == '__main__':
+    main()
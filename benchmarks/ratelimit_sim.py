@@ -0,0 +1,243 @@
+""" Replays synthetic traffic traces through HTTPClient and the Ratelimit
+implementations on a virtual clock, against a scripted model of Discord's
+buckets. Minutes of traffic are simulated in a fraction of a second.
+
+For each scenario and limiter it reports, per bucket, the requests that
+went through, the 429s incurred, the achieved requests/s and the time spent
+sleeping in the limiter while the bucket actually had room (wasted sleep).
+
+    python -m benchmarks.ratelimit_sim [--scenario burst] [--redis-url URL]
+
+RedisRatelimit is only simulated when a redis url is given, its
+`Ratelimit.*` keys get deleted between runs.
+"""
+import argparse
+import gevent
+import logging
+
+from collections import defaultdict
+from mee6.discord.api.http import HTTPClient
+from mee6.discord.api.ratelimit import LocalRatelimit, RedisRatelimit
+from mee6.discord.api.scheduler import PriorityScheduler
+from mee6.utils.clock import VirtualClock
+
+
+class SimResponse:
+    def __init__(self, status_code, payload, headers):
+        self.status_code = status_code
+        self.payload = payload
+        self.headers = headers
+        self.text = str(payload)
+
+    def json(self):
+        return self.payload
+
+
+class SimBucket:
+    def __init__(self, limit, period, now):
+        self.limit = limit
+        self.period = period
+        self.remaining = limit
+        self.reset_at = now + period
+
+    def refresh(self, now):
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.period
+
+    def available_at(self, now):
+        self.refresh(now)
+        return now if self.remaining else self.reset_at
+
+
+class DiscordModel:
+    """ Scripted model of Discord's rate limits: every route is its own
+    bucket of `limit` requests per `period` seconds, and all the routes share
+    a global bucket of `global_limit` requests per second. """
+
+    def __init__(self, clock, limit=5, period=5, global_limit=50):
+        self.clock = clock
+        self.limit = limit
+        self.period = period
+        self.buckets = {}
+        self.global_bucket = SimBucket(global_limit, 1, clock.time())
+
+    def bucket(self, route):
+        bucket = self.buckets.get(route)
+        if bucket is None:
+            now = self.clock.time()
+            bucket = self.buckets[route] = SimBucket(self.limit, self.period, now)
+        return bucket
+
+    def available_at(self, route):
+        now = self.clock.time()
+        return max(self.bucket(route).available_at(now),
+                   self.global_bucket.available_at(now))
+
+    def handle(self, route):
+        now = self.clock.time()
+
+        self.global_bucket.refresh(now)
+        if not self.global_bucket.remaining:
+            retry_after = self.global_bucket.reset_at - now
+            payload = {'retry_after': int(retry_after * 1000), 'global': True}
+            return SimResponse(429, payload, {'X-RateLimit-Global': 'true'})
+
+        bucket = self.bucket(route)
+        bucket.refresh(now)
+        if not bucket.remaining:
+            retry_after = bucket.reset_at - now
+            payload = {'retry_after': int(retry_after * 1000), 'global': False}
+            return SimResponse(429, payload, {})
+
+        self.global_bucket.remaining -= 1
+        bucket.remaining -= 1
+        headers = {'X-RateLimit-Limit': str(bucket.limit),
+                   'X-RateLimit-Remaining': str(bucket.remaining),
+                   'X-RateLimit-Reset': str(int(bucket.reset_at))}
+        return SimResponse(200, {}, headers)
+
+
+class SimSession:
+    """ Stands for requests.Session in HTTPClient """
+
+    def __init__(self, model, clock, stats, latency):
+        self.model = model
+        self.clock = clock
+        self.stats = stats
+        self.latency = latency
+
+    def request(self, method, url, headers=None, **kwargs):
+        route = url.split('/', 1)[1]
+        self.clock.sleep(self.latency)
+
+        r = self.model.handle(route)
+        stats = self.stats[route]
+        if r.status_code == 429:
+            stats['429s'] += 1
+        else:
+            stats['ok'] += 1
+            stats['last_ok'] = self.clock.time()
+        return r
+
+
+class LimiterClock:
+    """ Clock given to the limiters: sleeps go through the virtual clock and
+    the part of each sleep during which the bucket had room is accounted as
+    wasted. """
+
+    def __init__(self, clock, model, stats):
+        self.clock = clock
+        self.model = model
+        self.stats = stats
+        self.routes = {}
+
+    def time(self):
+        return self.clock.time()
+
+    def sleep(self, seconds):
+        route = self.routes.get(gevent.getcurrent())
+        if route is not None and seconds > 0:
+            start = self.clock.time()
+            available_at = max(start, self.model.available_at(route))
+            wasted = max(0, start + seconds - available_at)
+            self.stats[route]['slept'] += seconds
+            self.stats[route]['wasted_sleep'] += wasted
+
+        self.clock.sleep(seconds)
+
+
+def burst(): return [(0, 'channels/1/messages') for _ in range(50)]
+
+def overload():
+    # 10 requests/s on a bucket allowing 1 request/s
+    return [(i / 10., 'channels/1/messages') for i in range(300)]
+
+def steady():
+    return [(i / 2., 'channels/{}/messages'.format(i % 5)) for i in range(120)]
+
+def fanout():
+    return [(0, 'channels/{}/messages'.format(i)) for i in range(500)]
+
+SCENARIOS = {'burst': burst, 'overload': overload, 'steady': steady,
+             'fanout': fanout}
+
+
+def simulate(trace, make_ratelimit, latency=0.1):
+    clock = VirtualClock()
+    stats = defaultdict(lambda: defaultdict(float))
+    model = DiscordModel(clock)
+    limiter_clock = LimiterClock(clock, model, stats)
+
+    http = HTTPClient('sim',
+                      session=SimSession(model, clock, stats, latency),
+                      ratelimit=make_ratelimit(limiter_clock),
+                      scheduler=PriorityScheduler(clock=limiter_clock))
+    http.BASE_URL = 'sim:'
+
+    def send(at, route):
+        clock.sleep(at)
+        limiter_clock.routes[gevent.getcurrent()] = route
+        stats[route].setdefault('first', clock.time())
+        http.post(route)
+
+    greenlets = [gevent.spawn(send, at, route) for at, route in trace]
+    clock.run(greenlets)
+
+    return stats
+
+
+def report(scenario, limiter, stats):
+    def rate(s):
+        duration = s['last_ok'] - s['first']
+        return s['ok'] / duration if duration > 0 else float(s['ok'])
+
+    total = defaultdict(float)
+    for s in stats.values():
+        for key in ('ok', '429s', 'slept', 'wasted_sleep'):
+            total[key] += s[key]
+    total['first'] = min(s['first'] for s in stats.values())
+    total['last_ok'] = max(s['last_ok'] for s in stats.values())
+
+    rows = sorted(stats.items()) if len(stats) <= 5 else []
+    rows.append(('all {} buckets'.format(len(stats)), total))
+
+    row = '{:<9} {:<15} {:<22} {:>6} {:>6} {:>8} {:>10} {:>12}'
+    for bucket, s in rows:
+        print(row.format(scenario, limiter, bucket, int(s['ok']),
+                         int(s['429s']), '{:.2f}'.format(rate(s)),
+                         '{:.1f}s'.format(s['slept']),
+                         '{:.1f}s'.format(s['wasted_sleep'])))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS),
+                        action='append')
+    parser.add_argument('--redis-url')
+    parser.add_argument('--latency', type=float, default=0.1)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    limiters = [('LocalRatelimit', lambda clock: LocalRatelimit(clock=clock))]
+    if args.redis_url:
+        def redis_ratelimit(clock):
+            ratelimit = RedisRatelimit(args.redis_url, clock=clock)
+            for key in ratelimit.r.scan_iter('Ratelimit.*'):
+                ratelimit.r.delete(key)
+            return ratelimit
+        limiters.append(('RedisRatelimit', redis_ratelimit))
+
+    row = '{:<9} {:<15} {:<22} {:>6} {:>6} {:>8} {:>10} {:>12}'
+    print(row.format('scenario', 'limiter', 'bucket', 'ok', '429s', 'req/s',
+                     'slept', 'wasted'))
+    for scenario in args.scenario or sorted(SCENARIOS):
+        trace = SCENARIOS[scenario]()
+        for name, make_ratelimit in limiters:
+            stats = simulate(trace, make_ratelimit, latency=args.latency)
+            report(scenario, name, stats)
+
+
+if __name__ == '__main__':
+    main()
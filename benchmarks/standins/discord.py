@@ -0,0 +1,208 @@
+""" Local stand-in for the part of the Discord REST API APIClient uses:
+channel messages, webhooks and users/@me.
+
+Rate limits are emulated per bucket and globally, with Discord's headers and
+429 payloads. Every response is delayed by a configurable latency.
+
+    python -m benchmarks.standins.discord [--port 8500] [--latency 0.05]
+"""
+import argparse
+import gevent
+import itertools
+import math
+
+from collections import Counter
+from time import time
+from flask import Flask, jsonify, request
+
+
+class Bucket:
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+        self.remaining = limit
+        self.reset_at = time() + period
+
+    def hit(self):
+        """ Returns the seconds to wait if the bucket is exhausted """
+        now = time()
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.period
+
+        if self.remaining == 0:
+            return self.reset_at - now
+
+        self.remaining -= 1
+        return 0
+
+
+class DiscordStandin:
+    """ `buckets` maps a bucket name to its (limit, period in seconds) """
+
+    BUCKETS = {'messages': (5, 5),
+               'webhooks': (5, 2),
+               'create_webhook': (10, 10),
+               'users': (5, 5)}
+
+    def __init__(self, latency=0.05, global_limit=50, buckets=None):
+        self.latency = latency
+        self.global_limit = global_limit
+        self.bucket_limits = dict(self.BUCKETS)
+        self.bucket_limits.update(buckets or {})
+
+        self.buckets = {}
+        self.global_bucket = Bucket(global_limit, 1)
+        self.ids = itertools.count(300000000000000000)
+        self.webhooks = {}
+        self.messages = {}
+        self.stats = Counter()
+
+        self.app = self.build_app()
+
+    def get_bucket(self, name, major):
+        key = (name, major)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            limit, period = self.bucket_limits[name]
+            bucket = self.buckets[key] = Bucket(limit, period)
+        return bucket
+
+    def respond(self, bucket_name, major, make_payload, status=200):
+        """ `make_payload` is only called once the request passed the rate
+        limits, like Discord doesn't act on rate limited requests """
+        gevent.sleep(self.latency)
+
+        self.stats['requests'] += 1
+
+        retry_after = self.global_bucket.hit()
+        if retry_after:
+            self.stats['429_global'] += 1
+            body = {'message': 'You are being rate limited.',
+                    'retry_after': int(math.ceil(retry_after * 1000)),
+                    'global': True}
+            return jsonify(body), 429, {'X-RateLimit-Global': 'true'}
+
+        bucket = self.get_bucket(bucket_name, major)
+        retry_after = bucket.hit()
+        if retry_after:
+            self.stats['429'] += 1
+            body = {'message': 'You are being rate limited.',
+                    'retry_after': int(math.ceil(retry_after * 1000)),
+                    'global': False}
+            headers = self.ratelimit_headers(bucket)
+            return jsonify(body), 429, headers
+
+        self.stats[status] += 1
+        return jsonify(make_payload()), status, self.ratelimit_headers(bucket)
+
+    def ratelimit_headers(self, bucket):
+        return {'X-RateLimit-Limit': str(bucket.limit),
+                'X-RateLimit-Remaining': str(bucket.remaining),
+                'X-RateLimit-Reset': str(int(math.ceil(bucket.reset_at)))}
+
+    def message_payload(self, channel_id, body, webhook_id=None):
+        author = {'id': webhook_id or '1', 'username': 'Mee6',
+                  'discriminator': '0000', 'avatar': None}
+        message = {'id': str(next(self.ids)),
+                   'channel_id': str(channel_id),
+                   'content': body.get('content', ''),
+                   'timestamp': '2017-06-01T00:00:00.000000+00:00',
+                   'edited_timestamp': None,
+                   'author': author,
+                   'webhook_id': webhook_id}
+        self.messages.setdefault(str(channel_id), []).append(message)
+        return message
+
+    def build_app(self):
+        app = Flask(__name__)
+
+        @app.route('/api/v7/channels/<channel_id>/messages', methods=['POST'])
+        def create_message(channel_id):
+            body = request.json or {}
+            make_payload = lambda: self.message_payload(channel_id, body)
+            return self.respond('messages', channel_id, make_payload)
+
+        @app.route('/api/v7/channels/<channel_id>/messages', methods=['GET'])
+        def get_messages(channel_id):
+            limit = int(request.args.get('limit', 50))
+            messages = self.messages.get(str(channel_id), [])[-limit:]
+            make_payload = lambda: list(reversed(messages))
+            return self.respond('messages', channel_id, make_payload)
+
+        @app.route('/api/v7/channels/<channel_id>/webhooks', methods=['POST'])
+        def create_webhook(channel_id):
+            name = (request.json or {}).get('name')
+
+            def make_payload():
+                webhook = {'id': str(next(self.ids)),
+                           'channel_id': str(channel_id),
+                           'name': name,
+                           'avatar': None,
+                           'token': 'token{}'.format(next(self.ids))}
+                self.webhooks[webhook['id']] = webhook
+                return webhook
+
+            return self.respond('create_webhook', channel_id, make_payload)
+
+        @app.route('/api/v7/webhooks/<webhook_id>/<token>', methods=['POST'])
+        def execute_webhook(webhook_id, token):
+            webhook = self.webhooks.get(webhook_id)
+            if webhook is None or webhook['token'] != token:
+                unknown = {'code': 10015, 'message': 'Unknown Webhook'}
+                return self.respond('webhooks', webhook_id, lambda: unknown,
+                                    status=404)
+
+            body = request.json or {}
+            make_payload = lambda: self.message_payload(webhook['channel_id'],
+                                                        body,
+                                                        webhook_id=webhook_id)
+            return self.respond('webhooks', webhook_id, make_payload)
+
+        @app.route('/api/v7/webhooks/<webhook_id>/<token>', methods=['DELETE'])
+        def delete_webhook(webhook_id, token):
+            def make_payload():
+                self.webhooks.pop(webhook_id, None)
+                return {}
+
+            return self.respond('webhooks', webhook_id, make_payload,
+                                status=204)
+
+        @app.route('/api/v7/users/@me')
+        def current_user():
+            user = {'id': '1', 'username': 'Mee6', 'discriminator': '4876',
+                    'avatar': None}
+            return self.respond('users', '@me', lambda: user)
+
+        @app.route('/_stats')
+        def stats():
+            return jsonify({str(k): v for k, v in self.stats.items()})
+
+        return app
+
+    def serve(self, host='127.0.0.1', port=8500):
+        """ Starts serving in a greenlet, returns the gevent server """
+        from gevent.pywsgi import WSGIServer
+        server = WSGIServer((host, port), self.app, log=None)
+        server.start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8500)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--global-limit', type=int, default=50)
+    args = parser.parse_args()
+
+    standin = DiscordStandin(latency=args.latency,
+                             global_limit=args.global_limit)
+    server = standin.serve(args.host, args.port)
+    print('Discord stand-in listening on http://{}:{}/api/v7'.format(args.host,
+                                                                    args.port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+""" Local stand-in for the shards RPC RPCClient talks to: guilds, their
+members and the voice commands. Guilds and members are generated from their
+ids, every response is delayed by a configurable latency. A share of the
+requests can fail with a 503, after a longer delay, to emulate a degraded
+shard.
+
+    python -m benchmarks.standins.rpc [--port 8501] [--latency 0.01]
+                                      [--error-rate 0]
+"""
+import argparse
+import gevent
+import random
+
+from collections import Counter
+from flask import Flask, jsonify
+
+
+class RPCStandin:
+
+    def __init__(self, latency=0.01, members_per_guild=50, error_rate=0.):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.members_per_guild = members_per_guild
+        self.stats = Counter()
+
+        self.app = self.build_app()
+
+    def respond(self, payload, status=200):
+        self.stats['requests'] += 1
+
+        if random.random() < self.error_rate:
+            gevent.sleep(self.latency * 10)
+            self.stats[503] += 1
+            return jsonify({'message': 'Shard unavailable'}), 503
+
+        gevent.sleep(self.latency)
+        self.stats[status] += 1
+        return jsonify(payload), status
+
+    def guild_payload(self, guild_id):
+        channels = [{'id': str(int(guild_id) + i), 'name': 'channel-{}'.format(i),
+                     'type': 0 if i else 2, 'position': i} for i in range(5)]
+        roles = [{'id': guild_id, 'name': '@everyone', 'color': 0,
+                  'permissions': 104324161}]
+        return {'id': guild_id, 'name': 'Guild {}'.format(guild_id),
+                'owner_id': '1', 'roles': roles, 'channels': channels}
+
+    def member_payload(self, guild_id, member_id):
+        user = {'id': member_id, 'username': 'user{}'.format(member_id),
+                'discriminator': '0001', 'avatar': None}
+        return {'user': user, 'nick': None, 'roles': [guild_id],
+                'joined_at': '2017-06-01T00:00:00.000000+00:00',
+                'voice_state': None}
+
+    def build_app(self):
+        app = Flask(__name__)
+
+        @app.route('/guild/<guild_id>')
+        def guild(guild_id):
+            return self.respond(self.guild_payload(guild_id))
+
+        @app.route('/guild/<guild_id>/members')
+        def members(guild_id):
+            member_ids = [str(int(guild_id) + 1000 + i)
+                          for i in range(self.members_per_guild)]
+            payload = {member_id: self.member_payload(guild_id, member_id)
+                       for member_id in member_ids}
+            return self.respond(payload)
+
+        @app.route('/guild/<guild_id>/members/<member_id>')
+        def member(guild_id, member_id):
+            return self.respond(self.member_payload(guild_id, member_id))
+
+        @app.route('/guild/<guild_id>/voice_connect/<channel_id>')
+        @app.route('/guild/<guild_id>/voice_stop')
+        @app.route('/guild/<guild_id>/voice_disconnect')
+        def voice(guild_id, channel_id=None):
+            return self.respond({})
+
+        @app.route('/guild/<guild_id>/voice_play', methods=['POST'])
+        def voice_play(guild_id):
+            return self.respond({})
+
+        @app.route('/_stats')
+        def stats():
+            return jsonify({str(k): v for k, v in self.stats.items()})
+
+        return app
+
+    def serve(self, host='127.0.0.1', port=8501):
+        """ Starts serving in a greenlet, returns the gevent server """
+        from gevent.pywsgi import WSGIServer
+        server = WSGIServer((host, port), self.app, log=None)
+        server.start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8501)
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--error-rate', type=float, default=0.)
+    args = parser.parse_args()
+
+    standin = RPCStandin(latency=args.latency, error_rate=args.error_rate)
+    server = standin.serve(args.host, args.port)
+    print('RPC stand-in listening on http://{}:{}'.format(args.host, args.port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+""" Local stand-in for the Twitch v5 API Streamers polls: the users lookup by
+login and the live streams, all of them or by channel ids. Users are
+`streamer<i>`, each of them live a share of the time; who is live changes
+every `period` seconds. Every response is delayed by a configurable latency.
+
+    python -m benchmarks.standins.twitch [--port 8502] [--latency 0.05]
+                                         [--users 100000] [--live-ratio 0.05]
+                                         [--period 60]
+
+Point TWITCH_API_URL to http://127.0.0.1:8502/kraken to poll it.
+"""
+import argparse
+import gevent
+import random
+import re
+import time
+
+from collections import Counter
+from flask import Flask, jsonify, request
+
+
+class TwitchStandin:
+
+    login_rx = re.compile(r'^streamer(\d+)$')
+
+    def __init__(self, latency=0.05, users=100000, live_ratio=0.05, period=60):
+        self.latency = latency
+        self.users = users
+        self.live_ratio = live_ratio
+        self.period = period
+        self.stats = Counter()
+        self._live = (None, [])
+
+        self.app = self.build_app()
+
+    def respond(self, payload):
+        self.stats['requests'] += 1
+        gevent.sleep(self.latency)
+        return jsonify(payload)
+
+    def user_id(self, i):
+        return str(1000 + i)
+
+    def is_live(self, i):
+        epoch = int(time.time() / self.period)
+        return random.Random(i * 7919 + epoch).random() < self.live_ratio
+
+    def live_users(self):
+        """ Every live user, computed once per period """
+        epoch = int(time.time() / self.period)
+        if self._live[0] != epoch:
+            self._live = (epoch, [i for i in range(self.users) if self.is_live(i)])
+        return self._live[1]
+
+    def user_payload(self, i):
+        return {'_id': self.user_id(i), 'name': 'streamer{}'.format(i),
+                'display_name': 'Streamer{}'.format(i)}
+
+    def stream_payload(self, i):
+        name = 'streamer{}'.format(i)
+        channel = {'_id': self.user_id(i),
+                   'name': name,
+                   'display_name': 'Streamer{}'.format(i),
+                   'status': 'Stream of {}'.format(name),
+                   'url': 'https://www.twitch.tv/' + name,
+                   'logo': 'https://static-cdn.jtvnw.net/' + name + '.png'}
+        epoch = int(time.time() / self.period)
+        return {'_id': i * 100000 + epoch,
+                'game': 'Overwatch',
+                'viewers': i % 5000,
+                'preview': {'medium': 'https://static-cdn.jtvnw.net/previews/' + name + '.jpg'},
+                'channel': channel}
+
+    def build_app(self):
+        app = Flask(__name__)
+
+        @app.route('/kraken/users')
+        def users():
+            logins = request.args.get('login', '').split(',')[:100]
+            matches = [self.login_rx.match(login) for login in logins]
+            indexes = [int(m.group(1)) for m in matches if m]
+            found = [self.user_payload(i) for i in indexes if i < self.users]
+            return self.respond({'_total': len(found), 'users': found})
+
+        @app.route('/kraken/streams/')
+        def streams():
+            limit = min(int(request.args.get('limit', 25)), 100)
+            channels = request.args.get('channel')
+            if channels:
+                indexes = [int(c) - 1000 for c in channels.split(',')[:100]]
+                live = [i for i in indexes
+                        if 0 <= i < self.users and self.is_live(i)]
+            else:
+                live = self.live_users()
+
+            offset = int(request.args.get('offset', 0))
+            page = [self.stream_payload(i) for i in live[offset:offset + limit]]
+            return self.respond({'_total': len(live), 'streams': page})
+
+        @app.route('/_stats')
+        def stats():
+            return jsonify({str(k): v for k, v in self.stats.items()})
+
+        return app
+
+    def serve(self, host='127.0.0.1', port=8502):
+        """ Starts serving in a greenlet, returns the gevent server """
+        from gevent.pywsgi import WSGIServer
+        server = WSGIServer((host, port), self.app, log=None)
+        server.start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--live-ratio', type=float, default=0.05)
+    parser.add_argument('--period', type=int, default=60)
+    args = parser.parse_args()
+
+    standin = TwitchStandin(latency=args.latency, users=args.users,
+                            live_ratio=args.live_ratio, period=args.period)
+    server = standin.serve(args.host, args.port)
+    print('Twitch stand-in listening on http://{}:{}'.format(args.host, args.port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
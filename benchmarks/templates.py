@@ -0,0 +1,80 @@
+""" Compares building and encoding a stream announcement per guild, like
+Streamers used to, with rendering a MessageTemplate built once per stream.
+
+    python -m benchmarks.templates [--guilds 5000]
+"""
+import argparse
+import timeit
+
+from mee6.discord.api.template import MessageTemplate
+from mee6.types import MessageEmbed
+from mee6.utils import json
+
+
+STREAM = {'_id': 25000000000,
+          'game': 'Overwatch',
+          'viewers': 12345,
+          'preview': {'medium': 'https://static-cdn.jtvnw.net/previews-ttv/live_user_streamer-320x180.jpg'},
+          'channel': {'name': 'streamer',
+                      'display_name': 'Streamer',
+                      'status': 'Ranked grind, road to top 500',
+                      'url': 'https://www.twitch.tv/streamer',
+                      'logo': 'https://static-cdn.jtvnw.net/jtv_user_pictures/streamer-profile_image-300x300.png'}}
+
+MESSAGE = 'Hey @everyone! {streamer} is now live on {link} ! Go check it out 😉!'
+
+
+def make_embed(stream):
+    channel = stream['channel']
+
+    embed = MessageEmbed()
+    embed.color = 0x6441A4
+    embed.title = channel['status']
+    embed.url = channel['url']
+    embed.author_name = channel['display_name']
+    embed.author_icon_url = channel['logo']
+    embed.author_url = channel['url']
+    embed.thumbnail_url = channel['logo']
+    embed.thumbnail_proxy_url = channel['logo']
+    embed.thumbnail_width, embed.thumbnail_height = 100, 100
+    embed.image_url = stream['preview']['medium']
+    embed.footer_text = 'Twitch.tv'
+    embed.add_field('Played Game', stream['game'], True)
+    embed.add_field('Viewers', stream['viewers'], True)
+    return embed
+
+
+def content(embed, i):
+    message = MESSAGE.replace('{streamer}', embed.author_name)
+    return message.replace('{link}', embed.url) + ' #{}'.format(i)
+
+
+def per_guild(guilds):
+    for i in range(guilds):
+        embed = make_embed(STREAM)
+        body = {'content': content(embed, i), 'embed': embed.get_dict()}
+        json.dumps(body)
+
+
+def templated(guilds):
+    embed = make_embed(STREAM)
+    template = MessageTemplate([embed])
+    for i in range(guilds):
+        template.render(content(embed, i))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--guilds', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, fn in (('per guild', per_guild), ('template', templated)):
+        best = min(timeit.repeat(lambda: fn(args.guilds), number=1,
+                                 repeat=args.repeat))
+        print('{:<10} {:8.1f}ms for {} guilds ({:.1f}us per guild)'.format(
+            name, best * 1000, args.guilds, best * 1e6 / args.guilds))
+
+
+if __name__ == '__main__':
+    main()
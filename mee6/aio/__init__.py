@@ -0,0 +1,4 @@
+""" asyncio versions of the Discord and RPC clients, for services running
+without gevent. They need the `aio` extra (aiohttp). """
+from mee6.aio.discord import APIClient
+from mee6.aio.rpc import RPCClient
@@ -0,0 +1,308 @@
+import asyncio
+import os
+import redis
+
+from functools import partial
+from mee6.aio.http import HTTPClient
+from mee6.aio.singleflight import SingleFlight
+from mee6.discord.api.http import HTTPClient as _HTTPClient
+from mee6.discord.api.client import APIClient as _APIClient
+from mee6.discord.api.ratelimit import LocalRatelimit, RedisRatelimit
+from mee6.discord.api.scheduler import PriorityScheduler, ANNOUNCEMENT, BACKGROUND
+from mee6.discord.api.webhooks import WebhookRegistry
+from mee6.discord.api.destinations import DeadDestinations
+from mee6.discord.api.template import WEBHOOK_USERNAME, WEBHOOK_AVATAR_URL
+from mee6.types import Message, Webhook, User
+from mee6.exceptions import APIException
+from mee6.utils import real_dict
+
+
+def run_blocking(fn, *args):
+    """ Runs a blocking call, like a redis one, in the loop's default
+    executor """
+    return asyncio.get_running_loop().run_in_executor(None, partial(fn, *args))
+
+
+class DiscordHTTPClient(HTTPClient):
+    """ asyncio counterpart of mee6.discord.api.http.HTTPClient, sharing its
+    configuration, its Ratelimit and its PriorityScheduler. The calls to a
+    RedisRatelimit run in the default executor. """
+
+    BASE_URL = _HTTPClient.BASE_URL
+    RATELIMIT_REDIS_URL = _HTTPClient.RATELIMIT_REDIS_URL
+    HTTP_POOL_SIZE = _HTTPClient.HTTP_POOL_SIZE
+    METRIC = 'api_request_duration'
+
+    def __init__(self, token, session=None, ratelimit=None, scheduler=None):
+        super(DiscordHTTPClient, self).__init__(session=session)
+        self.token = token
+
+        if ratelimit is not None:
+            self.ratelimit = ratelimit
+        elif self.RATELIMIT_REDIS_URL:
+            self.ratelimit = RedisRatelimit(self.RATELIMIT_REDIS_URL)
+        else:
+            self.ratelimit = LocalRatelimit()
+
+        self.scheduler = scheduler or PriorityScheduler()
+
+    async def call_ratelimit(self, method, *args):
+        fn = getattr(self.ratelimit, method)
+        if isinstance(self.ratelimit, RedisRatelimit):
+            return await run_blocking(fn, *args)
+        return fn(*args)
+
+    async def acquire(self, priority):
+        start = self.scheduler.clock.time()
+
+        wait = self.scheduler.try_acquire(priority)
+        if wait:
+            self.scheduler.waiting[priority] += 1
+            try:
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = self.scheduler.try_acquire(priority)
+            finally:
+                self.scheduler.waiting[priority] -= 1
+
+        self.scheduler.report_wait(priority, self.scheduler.clock.time() - start)
+
+    async def check(self, route):
+        sleep_time = await self.call_ratelimit('get_wait', route)
+        if sleep_time is None: return
+
+        await asyncio.sleep(sleep_time)
+        await self.call_ratelimit('clear', route)
+
+    async def __call__(self, method, route, auth=True, priority=None, **kwargs):
+        priority = priority or ANNOUNCEMENT
+
+        while True:
+            await self.acquire(priority)
+            await self.check(route)
+
+            headers = dict()
+            if auth:
+                headers['Authorization'] = 'Bot ' + self.token
+
+            r = await self.request(method, route, {'priority': priority},
+                                   headers=headers, **kwargs)
+
+            await self.call_ratelimit('update', route, r)
+
+            if r.status_code < 400:
+                return r
+
+            if r.status_code != 429:
+                raise APIException(r)
+
+            await asyncio.sleep(await self.call_ratelimit('handle_429', route, r))
+
+
+class APIClient:
+    """ asyncio counterpart of mee6.discord.api.client.APIClient with the
+    same methods, as coroutines. Message coalescing (queue_message) is left
+    to the gevent client.
+
+    The webhook registry keeps using the blocking redis client, its lookups
+    run in the loop's default executor. """
+
+    TOKEN = _APIClient.TOKEN
+    WEBHOOK_POOL_SIZE = _APIClient.WEBHOOK_POOL_SIZE
+    WEBHOOK_RETRIES = _APIClient.WEBHOOK_RETRIES
+    CACHE_TTLS = _APIClient.CACHE_TTLS
+
+    def __init__(self, cache_ttls=None, session=None):
+        redis_url = os.getenv('REDIS_URL', 'redis://localhost')
+
+        self.http = DiscordHTTPClient(self.TOKEN, session=session)
+        self.db = redis.from_url(redis_url, decode_responses=True)
+        self.webhooks = WebhookRegistry(self.db, self.WEBHOOK_POOL_SIZE)
+        self.flights = SingleFlight()
+        self.dead = DeadDestinations()
+
+        self.cache_ttls = dict(self.CACHE_TTLS)
+        self.cache_ttls.update(cache_ttls or {})
+
+    async def close(self):
+        await self.http.close()
+
+    def _run(self, fn, *args):
+        return run_blocking(fn, *args)
+
+    async def create_webhook(self, webhook_id, channel_id, slot=0,
+                             priority=None):
+        path = 'channels/{}/webhooks'.format(channel_id)
+        body = {'name': 'Mee6 Webhook'}
+        try:
+            r = await self.http.post(path, json=body, priority=priority)
+        except APIException as e:
+            self.dead.mark('webhooks', channel_id, e.status_code)
+            self.dead.mark_channel(channel_id, e)
+            raise e
+
+        webhook = Webhook(**r.json())
+
+        registered = await self._run(self.webhooks.add, webhook_id, slot,
+                                     webhook)
+        if registered.id != webhook.id:
+            # Another process created this slot first
+            await self.delete_webhook(webhook, priority=BACKGROUND)
+
+        return registered
+
+    async def delete_webhook(self, webhook, priority=None):
+        path = 'webhooks/{0.id}/{0.token}'.format(webhook)
+        await self.http.delete(path, auth=False, priority=priority)
+
+    async def get_webhook(self, webhook_id, slot=0):
+        webhook = self.webhooks.webhooks.get((webhook_id, slot))
+        if webhook is not None:
+            return webhook
+
+        key = ('get_webhook', webhook_id, slot)
+        get = lambda: self._run(self.webhooks.get, webhook_id, slot)
+        return await self.flights.do(key, get)
+
+    async def reset_webhook(self, webhook_id, slot=0):
+        webhook = await self.get_webhook(webhook_id, slot)
+        if webhook is not None:
+            await self._run(self.webhooks.invalidate, webhook_id, slot, webhook)
+
+    async def create_pooled_webhook(self, webhook_id, channel_id, slot,
+                                    priority):
+        key = ('create_webhook', webhook_id, slot)
+        create = lambda: self.create_webhook(webhook_id, channel_id, slot,
+                                             priority=priority)
+        return await self.flights.do(key, create)
+
+    get_webhook_route = _APIClient.get_webhook_route
+
+    async def pick_webhook(self, webhook_id, channel_id, priority=None):
+        """ See mee6.discord.api.client.APIClient.pick_webhook """
+        if self.webhooks.pool_size == 1:
+            webhook = await self.get_webhook(webhook_id, 0)
+            if webhook is None:
+                webhook = await self.create_pooled_webhook(webhook_id,
+                                                           channel_id, 0,
+                                                           priority)
+            return 0, webhook
+
+        # Loads the pool from redis before rotation() reads it
+        for slot in range(self.webhooks.pool_size):
+            await self.get_webhook(webhook_id, slot)
+
+        earliest = None
+        for slot in self.webhooks.rotation(webhook_id):
+            webhook = self.webhooks.webhooks.get((webhook_id, slot))
+            if webhook is None:
+                return slot, await self.create_pooled_webhook(webhook_id,
+                                                              channel_id, slot,
+                                                              priority)
+
+            route = self.get_webhook_route(webhook)
+            reset = await self.http.call_ratelimit('get_reset', route)
+            if reset is None:
+                return slot, webhook
+
+            if earliest is None or reset < earliest[0]:
+                earliest = (reset, slot, webhook)
+
+        return earliest[1], earliest[2]
+
+    async def execute_webhook(self, webhook, message_content, username=None,
+                              avatar_url=None, embeds=None, priority=None):
+        path = self.get_webhook_route(webhook)
+
+        username = username or WEBHOOK_USERNAME
+        avatar_url = avatar_url or WEBHOOK_AVATAR_URL
+
+        body = {'content': message_content,
+                'username': username,
+                'avatar_url': avatar_url}
+        if embeds:
+            body['embeds'] = [embed.get_dict() for embed in embeds]
+
+        r = await self.http.post(path, auth=False, json=body, priority=priority)
+
+        return Message(**r.json())
+
+    async def send_webhook_message(self, webhook_id, channel_id,
+                                   message_content, embeds=None,
+                                   priority=None):
+        self.dead.check('webhooks', channel_id)
+
+        for attempt in range(self.WEBHOOK_RETRIES + 1):
+            slot, webhook = await self.pick_webhook(webhook_id, channel_id,
+                                                    priority=priority)
+
+            try:
+                message = await self.execute_webhook(webhook, message_content,
+                                                     embeds=embeds,
+                                                     priority=priority)
+            except APIException as e:
+                if e.status_code != 404 or attempt == self.WEBHOOK_RETRIES:
+                    raise e
+
+                # The webhook got deleted, forget it and retry with a new one
+                await self._run(self.webhooks.invalidate, webhook_id, slot,
+                                webhook)
+                continue
+
+            # The channel exists, even if a send to it was refused
+            self.dead.revive('channel', channel_id)
+            return message
+
+    async def get_channel_messages(self, channel_id, limit=None, around=None,
+                                   before=None, after=None, priority=None):
+        path = '/channels/{}/messages'.format(channel_id)
+
+        params = real_dict({'limit': limit,
+                            'around': around,
+                            'before': before,
+                            'after': after})
+
+        async def get_messages():
+            self.dead.check('channel', channel_id)
+            try:
+                r = await self.http.get(path, params=params, priority=priority)
+            except APIException as e:
+                self.dead.mark_channel(channel_id, e)
+                raise e
+
+            return [Message(**message) for message in r.json()]
+
+        key = ('get_channel_messages', channel_id, limit, around, before, after)
+        ttl = self.cache_ttls.get('get_channel_messages', 0)
+        return await self.flights.do(key, get_messages, ttl=ttl)
+
+    async def get_current_user(self, priority=None):
+        path = '/users/@me'
+
+        async def get_user():
+            r = await self.http.get(path, priority=priority)
+            return User(**r.json())
+
+        ttl = self.cache_ttls.get('get_current_user', 0)
+        return await self.flights.do(('get_current_user',), get_user, ttl=ttl)
+
+    async def send_message(self, channel_id, message_content, embed=None,
+                           embeds=None, priority=None):
+        self.dead.check('channel', channel_id)
+
+        path = 'channels/{}/messages'.format(channel_id)
+        body = {'content': message_content}
+
+        embeds = ([embed] if embed else []) + list(embeds or [])
+        if len(embeds) == 1:
+            body['embed'] = embeds[0].get_dict()
+        elif embeds:
+            body['embeds'] = [e.get_dict() for e in embeds]
+
+        try:
+            r = await self.http.post(path, json=body, priority=priority)
+        except APIException as e:
+            self.dead.mark_channel(channel_id, e)
+            raise e
+
+        return Message(**r.json())
@@ -0,0 +1,81 @@
+import aiohttp
+import asyncio
+import json
+import re
+
+from mee6.utils import Logger, statsd
+
+
+rx = re.compile(r'^[0-9]*$')
+
+
+class Response:
+    """ Body and metadata of a finished request, with the attributes of
+    requests' responses the exceptions and the Ratelimit rely on """
+
+    def __init__(self, status_code, headers, text):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class HTTPClient(Logger):
+    """ Base of the asyncio HTTP clients. Requests go through a single
+    aiohttp session, and its pool of keep-alive connections, created in the
+    running loop on first use. """
+
+    BASE_URL = None
+    HTTP_POOL_SIZE = 100
+    METRIC = 'request_duration'
+
+    def __init__(self, session=None):
+        self._session = session
+
+    @property
+    def session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.HTTP_POOL_SIZE)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def build_url(self, route): return self.BASE_URL + '/' + route.lstrip('/')
+
+    def build_metric_type(self, method, route):
+        route = route.split('?')[0]
+        route_splitted = route.split('/')
+        route_splitted = [part for part in route_splitted if len(part) < 15]
+        parts = [method] + [part for part in route_splitted if not rx.match(part)]
+        return '_'.join(parts)
+
+    async def request(self, method, route, tags, **kwargs):
+        loop = asyncio.get_running_loop()
+
+        start = loop.time()
+        async with self.session.request(method, self.build_url(route),
+                                        **kwargs) as r:
+            text = await r.text()
+        duration = loop.time() - start
+
+        tags = dict(tags, request_type=self.build_metric_type(method, route))
+        statsd.timing(self.METRIC, duration * 1000,
+                      tags=['{}:{}'.format(k, v) for k, v in tags.items()])
+
+        return Response(r.status, r.headers, text)
+
+    def get(self, route, **kwargs): return self('GET', route, **kwargs)
+
+    def post(self, route, **kwargs): return self('POST', route, **kwargs)
+
+    def put(self, route, **kwargs): return self('PUT', route, **kwargs)
+
+    def patch(self, route, **kwargs): return self('PATCH', route, **kwargs)
+
+    def delete(self, route, **kwargs): return self('DELETE', route, **kwargs)
@@ -0,0 +1,100 @@
+from mee6.aio.http import HTTPClient
+from mee6.rpc.http import HTTPClient as _HTTPClient
+from mee6.exceptions import RPCException
+from mee6.types import Guild, Member
+from mee6.utils import get
+
+
+class RPCHTTPClient(HTTPClient):
+    """ asyncio counterpart of mee6.rpc.http.HTTPClient """
+
+    BASE_URL = _HTTPClient.BASE_URL
+    METRIC = 'rpc_request_duration'
+
+    async def __call__(self, method, route, **kwargs):
+        r = await self.request(method, route, {}, **kwargs)
+
+        if r.status_code < 400:
+            return r
+
+        raise RPCException(r)
+
+
+class RPCClient:
+    """ asyncio counterpart of mee6.rpc.client.RPCClient with the same
+    methods, as coroutines """
+
+    def __init__(self, session=None):
+        self.http = RPCHTTPClient(session=session)
+
+    async def close(self):
+        await self.http.close()
+
+    async def call(self, method, path, **kwargs):
+        """ Returns None if the shards answered 404 """
+        try:
+            return await self.http(method, path, **kwargs)
+        except RPCException as e:
+            if e.status_code == 404:
+                return None
+            raise e
+
+    async def get_guild(self, guild):
+        guild_id = get(guild, 'id', guild)
+        path = 'guild/{}'.format(guild_id)
+
+        r = await self.call('GET', path)
+        if r is None:
+            return None
+
+        return Guild(**r.json())
+
+    async def get_guild_members(self, guild):
+        guild_id = get(guild, 'id', guild)
+        path = 'guild/{}/members'.format(guild_id)
+
+        r = await self.call('GET', path)
+        if r is None:
+            return None
+
+        return [Member(**m) for m in r.json().values()]
+
+    async def get_guild_member(self, guild, member):
+        guild_id = get(guild, 'id', guild)
+        member_id = get(member, 'id', member)
+        path = 'guild/{}/members/{}'.format(guild_id, member_id)
+
+        r = await self.call('GET', path)
+        if r is None:
+            return None
+
+        return Member(**r.json())
+
+    async def voice_connect(self, guild, channel):
+        guild_id = get(guild, 'id', guild)
+        channel_id = get(channel, 'id', channel)
+        path = 'guild/{}/voice_connect/{}'.format(guild_id, channel_id)
+
+        r = await self.call('GET', path)
+        return True if r is not None else None
+
+    async def voice_play(self, guild, url):
+        guild_id = get(guild, 'id', guild)
+        path = 'guild/{}/voice_play'.format(guild_id)
+
+        r = await self.call('POST', path, json={'url': url})
+        return True if r is not None else None
+
+    async def voice_stop(self, guild):
+        guild_id = get(guild, 'id', guild)
+        path = 'guild/{}/voice_stop'.format(guild_id)
+
+        r = await self.call('GET', path)
+        return True if r is not None else None
+
+    async def voice_disconnect(self, guild):
+        guild_id = get(guild, 'id', guild)
+        path = 'guild/{}/voice_disconnect'.format(guild_id)
+
+        r = await self.call('GET', path)
+        return True if r is not None else None
@@ -0,0 +1,45 @@
+import asyncio
+
+from time import time
+from mee6.discord.api.singleflight import SingleFlight as _SingleFlight
+
+
+def _retrieve(task):
+    # A failure nobody waited for isn't logged
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight(_SingleFlight):
+    """ SingleFlight for coroutines: `fn` returns an awaitable, run in a task
+    of its own that the callers of the key in flight await. A cancelled
+    caller stops waiting but the call goes on for the others. """
+
+    async def do(self, key, fn, ttl=0):
+        cached = self.cache.get(key)
+        if cached is not None:
+            expires_at, result = cached
+            if expires_at > time():
+                return result
+            del self.cache[key]
+
+        call = self.calls.get(key)
+        if call is None:
+            call = self.calls[key] = asyncio.ensure_future(self._call(key, fn,
+                                                                      ttl))
+            call.add_done_callback(_retrieve)
+
+        return await asyncio.shield(call)
+
+    async def _call(self, key, fn, ttl):
+        try:
+            result = await fn()
+        finally:
+            del self.calls[key]
+
+        if ttl:
+            if len(self.cache) >= self.MAX_CACHED:
+                self.prune()
+            self.cache[key] = (time() + ttl, result)
+
+        return result
@@ -0,0 +1,354 @@
+import gevent
+import importlib
+import os
+import redis
+import socket
+import uuid
+
+from time import time
+from mee6.discord import send_message, send_webhook_message, ANNOUNCEMENT
+from mee6.exceptions import APIException
+from mee6.utils import Logger, json, get, statsd, timed
+
+
+# Queues the announcement ARGV[1] on KEYS[1], unless the dedup key KEYS[2] is
+# set. It's then set for ARGV[2] seconds. Announcements without a dedup key
+# only pass KEYS[1].
+PUT_SCRIPT = """
+if KEYS[2] and not redis.call('SET', KEYS[2], 1, 'EX', ARGV[2], 'NX') then
+    return 0
+end
+redis.call('LPUSH', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Moves the announcement from the processing list to the delayed set, to be
+# queued again once ARGV[3] (timestamp) is reached
+RETRY_SCRIPT = """
+redis.call('LREM', KEYS[1], 1, ARGV[1])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[2])
+"""
+
+# Moves the announcement from the processing list to the failed list, which
+# keeps the ARGV[2] latest failures
+FAIL_SCRIPT = """
+redis.call('LREM', KEYS[1], 1, ARGV[1])
+redis.call('LPUSH', KEYS[2], ARGV[1])
+redis.call('LTRIM', KEYS[2], 0, ARGV[2] - 1)
+"""
+
+# Queues at most ARGV[2] delayed announcements that are due at ARGV[1]. They
+# are pushed at the head of the queue, where senders pop from.
+PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, data in ipairs(due) do
+    redis.call('ZREM', KEYS[1], data)
+    redis.call('RPUSH', KEYS[2], data)
+end
+return #due
+"""
+
+# Queues back everything a dead sender was processing
+RECOVER_SCRIPT = """
+local count = 0
+while redis.call('RPOPLPUSH', KEYS[1], KEYS[2]) do
+    count = count + 1
+end
+return count
+"""
+
+
+class StoredEmbed:
+    """ Embed serialized when the announcement was queued """
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def get_dict(self):
+        return self.data
+
+
+class AnnouncementQueue(Logger):
+    """ Durable queue of the announcements plugins send, delivered by the
+    sender workers (`mee6.cli senders`) which can run in other processes.
+
+    Senders move the announcements they pop to a processing list of their
+    own (BRPOPLPUSH) until they are delivered. The lists of senders whose
+    heartbeat expired are queued back, so that a crash doesn't lose them.
+    Failed deliveries are retried with an exponential backoff. Announcements
+    can carry a dedup key, the same key is only queued once per DEDUP_TTL.
+    """
+
+    # Set it to have plugins use the queue instead of sending inline
+    ENABLED = bool(os.getenv('ANNOUNCEMENT_QUEUE'))
+    DEDUP_TTL = int(os.getenv('ANNOUNCEMENT_DEDUP_TTL', 86400))
+    MAX_ATTEMPTS = 5
+    # Seconds before the first retry, doubled on each attempt
+    RETRY_DELAY = 5
+    MAX_FAILED = 1000
+    HEARTBEAT_TTL = 30
+
+    QUEUE = 'announcements.queue'
+    DELAYED = 'announcements.delayed'
+    FAILED = 'announcements.failed'
+    SENDERS = 'announcements.senders'
+
+    def __init__(self, redis_url=None):
+        redis_url = redis_url or os.getenv('REDIS_URL', 'redis://localhost')
+        self.db = redis.from_url(redis_url, decode_responses=True)
+
+        self._put = self.db.register_script(PUT_SCRIPT)
+        self._retry = self.db.register_script(RETRY_SCRIPT)
+        self._fail = self.db.register_script(FAIL_SCRIPT)
+        self._promote = self.db.register_script(PROMOTE_SCRIPT)
+        self._recover = self.db.register_script(RECOVER_SCRIPT)
+
+    def processing_key(self, sender_id):
+        return 'announcements.processing.{}'.format(sender_id)
+
+    def heartbeat_key(self, sender_id):
+        return 'announcements.sender.{}'.format(sender_id)
+
+    def put(self, plugin, guild_id, channel_id, content, embeds=None,
+            webhook_id=None, key=None, template=None):
+        """ Queues an announcement, returns False if one with the same `key`
+        was already queued. With a MessageTemplate, the rendered body is
+        queued instead of the content and the embeds. Checking the key and
+        queuing is atomic. """
+        announcement = {'id': uuid.uuid4().hex,
+                        'plugin': plugin.id,
+                        'guild_id': str(guild_id),
+                        'channel_id': str(channel_id),
+                        'webhook_id': webhook_id,
+                        'key': key,
+                        'attempts': 0,
+                        'queued_at': time()}
+        if template is not None:
+            announcement['body'] = template.render(content,
+                                                   webhook=bool(webhook_id))
+        else:
+            announcement['content'] = content
+            announcement['embeds'] = [embed.get_dict() for embed in embeds or []]
+
+        keys = [self.QUEUE]
+        if key is not None:
+            keys.append('announcements.dedup.{}'.format(key))
+        if not self._put(keys=keys, args=[json.dumps(announcement),
+                                          self.DEDUP_TTL]):
+            statsd.increment('announcements.duplicates',
+                             tags=['plugin:' + plugin.id])
+            return False
+
+        statsd.increment('announcements.queued', tags=['plugin:' + plugin.id])
+        return True
+
+    def pop(self, sender_id, timeout=5):
+        """ Returns the raw announcement now processed by `sender_id`, None
+        after `timeout` seconds without any """
+        return self.db.brpoplpush(self.QUEUE, self.processing_key(sender_id),
+                                  timeout)
+
+    def ack(self, sender_id, data):
+        self.db.execute_command('LREM', self.processing_key(sender_id), 1, data)
+
+    def retry(self, sender_id, data, announcement):
+        """ Schedules another attempt, returns False once MAX_ATTEMPTS is
+        reached and the announcement moved to the failed list """
+        announcement['attempts'] += 1
+        if announcement['attempts'] >= self.MAX_ATTEMPTS:
+            self.fail(sender_id, data)
+            return False
+
+        delay = self.RETRY_DELAY * 2 ** (announcement['attempts'] - 1)
+        self._retry(keys=[self.processing_key(sender_id), self.DELAYED],
+                    args=[data, json.dumps(announcement), time() + delay])
+        return True
+
+    def fail(self, sender_id, data):
+        """ Moves the raw announcement to the failed list """
+        self._fail(keys=[self.processing_key(sender_id), self.FAILED],
+                   args=[data, self.MAX_FAILED])
+
+    def promote(self, limit=1000):
+        return self._promote(keys=[self.DELAYED, self.QUEUE],
+                             args=[time(), limit])
+
+    def heartbeat(self, sender_id):
+        self.db.set(self.heartbeat_key(sender_id), 1, ex=self.HEARTBEAT_TTL)
+        self.db.sadd(self.SENDERS, sender_id)
+
+    def leave(self, sender_id):
+        self._recover(keys=[self.processing_key(sender_id), self.QUEUE])
+        self.db.delete(self.heartbeat_key(sender_id))
+        self.db.srem(self.SENDERS, sender_id)
+
+    def recover(self):
+        """ Queues back the announcements of the senders that stopped
+        heartbeating, returns how many """
+        recovered = 0
+        for sender_id in self.db.smembers(self.SENDERS):
+            if self.db.exists(self.heartbeat_key(sender_id)):
+                continue
+
+            keys = [self.processing_key(sender_id), self.QUEUE]
+            recovered += self._recover(keys=keys)
+            self.db.srem(self.SENDERS, sender_id)
+
+        if recovered:
+            self.log('Recovered {} announcements'.format(recovered))
+            statsd.increment('announcements.recovered', recovered)
+
+        return recovered
+
+    def report(self):
+        statsd.gauge('announcements.queue_size', self.db.llen(self.QUEUE))
+        statsd.gauge('announcements.delayed_size', self.db.zcard(self.DELAYED))
+
+
+class Sender(Logger):
+    """ Pool of greenlets delivering the queued announcements. They share a
+    processing list, a sender is one process. """
+
+    SENDERS_COUNT = int(os.getenv('ANNOUNCEMENT_SENDERS', 20))
+    # Don't retry requests Discord rejected as such
+    PERMANENT_STATUS_CODES = (400, 401, 403, 404)
+
+    def __init__(self, queue=None):
+        self.queue = queue or AnnouncementQueue()
+        self.id = '{}:{}:{}'.format(socket.gethostname(), os.getpid(),
+                                    uuid.uuid4().hex[:8])
+        self.plugins = {}
+
+    def get_plugin(self, plugin_id):
+        plugin = self.plugins.get(plugin_id)
+        if plugin is None:
+            module = importlib.import_module('mee6.plugins.' + plugin_id)
+            plugin_class = get(module, plugin_id.capitalize())
+            plugin = self.plugins[plugin_id] = plugin_class(in_bot=False)
+        return plugin
+
+    def deliver(self, announcement):
+        body = announcement.get('body')
+        content = announcement.get('content')
+        embeds = [StoredEmbed(embed) for embed in announcement.get('embeds', [])]
+
+        tags = {'plugin': announcement['plugin']}
+        with timed('announcements.delivery_duration', tags=tags):
+            if announcement['webhook_id']:
+                send_webhook_message(announcement['webhook_id'],
+                                     announcement['channel_id'],
+                                     content,
+                                     embeds=embeds,
+                                     priority=ANNOUNCEMENT,
+                                     body=body)
+            else:
+                send_message(announcement['channel_id'],
+                             content,
+                             embeds=embeds,
+                             priority=ANNOUNCEMENT,
+                             body=body)
+
+    def handle(self, data):
+        try:
+            announcement = json.loads(data)
+        except ValueError as e:
+            self.log('Undecodable announcement {!r}: {}'.format(data, e))
+            self.queue.fail(self.id, data)
+            statsd.increment('announcements.failed')
+            return
+
+        lag = time() - announcement['queued_at']
+        tags = ['plugin:' + announcement['plugin']]
+        statsd.timing('announcements.lag', lag * 1000, tags=tags)
+
+        try:
+            self.deliver(announcement)
+        except APIException as e:
+            self.log('Got Api exception {} {}'.format(e.status_code, e.payload))
+            if e.status_code in self.PERMANENT_STATUS_CODES:
+                self.queue.ack(self.id, data)
+                statsd.increment('announcements.rejected', tags=tags)
+
+                # Unauthorized or channel not found
+                if e.status_code in (403, 404):
+                    guild_id = announcement['guild_id']
+                    self.log('Disabling {} for {}'.format(announcement['plugin'],
+                                                          guild_id))
+                    self.get_plugin(announcement['plugin']).disable(guild_id)
+                return
+
+            self.handle_failure(data, announcement, tags)
+        except Exception as e:
+            self.log('Failed to deliver announcement {}: {}'.format(announcement['id'], e))
+            self.handle_failure(data, announcement, tags)
+        else:
+            self.queue.ack(self.id, data)
+            statsd.increment('announcements.delivered', tags=tags)
+
+    def handle_failure(self, data, announcement, tags):
+        if self.queue.retry(self.id, data, announcement):
+            statsd.increment('announcements.retried', tags=tags)
+        else:
+            statsd.increment('announcements.failed', tags=tags)
+
+    def consume(self):
+        while True:
+            try:
+                data = self.queue.pop(self.id)
+            except redis.RedisError as e:
+                self.log('Redis error {}'.format(e))
+                gevent.sleep(1)
+                continue
+
+            if data is None:
+                continue
+
+            try:
+                self.handle(data)
+            except redis.RedisError as e:
+                self.log('Redis error {}'.format(e))
+                gevent.sleep(1)
+            except Exception as e:
+                # A malformed entry would crash every sender it's handed to
+                self.log('Failed to handle announcement {}: {}'.format(data, e))
+                statsd.increment('announcements.failed')
+                try:
+                    self.queue.fail(self.id, data)
+                except redis.RedisError as e:
+                    self.log('Redis error {}'.format(e))
+
+    def maintain(self):
+        """ Keeps the sender alive, queues the due retries and takes over
+        the announcements of dead senders """
+        last_recovery = 0
+        while True:
+            try:
+                self.queue.heartbeat(self.id)
+                self.queue.promote()
+                self.queue.report()
+
+                if time() - last_recovery > self.queue.HEARTBEAT_TTL:
+                    self.queue.recover()
+                    last_recovery = time()
+            except redis.RedisError as e:
+                self.log('Redis error {}'.format(e))
+
+            gevent.sleep(1)
+
+    def run(self, count=None):
+        count = count or self.SENDERS_COUNT
+        self.queue.heartbeat(self.id)
+        self.log('Sender {} spawning {} consumers'.format(self.id, count))
+
+        greenlets = [gevent.spawn(self.maintain)]
+        greenlets += [gevent.spawn(self.consume) for _ in range(count)]
+        try:
+            gevent.joinall(greenlets, raise_error=True)
+        finally:
+            gevent.killall(greenlets)
+            self.queue.leave(self.id)
+
+
+queue = AnnouncementQueue()
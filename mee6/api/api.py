@@ -1,9 +1,14 @@
 from mee6.utils import get_plugins, get
+from mee6.types import Model
+from mee6.exceptions import ValidationError as TypeValidationError
 from flask import Flask, request, jsonify, abort
 from modus.exceptions import ValidationError
 
 app = Flask(__name__)
 
+# The dashboard validates every payload it builds types from
+Model.strict = True
+
 plugins = get_plugins(in_bot=False)
 
 def get_plugin_or_abort(gid, pid):
@@ -22,6 +27,10 @@ def get_plugin_command_or_abort(plugin, command_name):
 
     return command
 
+@app.errorhandler(TypeValidationError)
+def handle_type_validation_error(e):
+    return jsonify({'errors': e.errors}), 400
+
 @app.route('/')
 def root():
     return jsonify({'hello': 'world'})
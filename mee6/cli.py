@@ -27,6 +27,39 @@ def worker(plugins):
 
     mee6_worker.run(*plugins)
 
+@cli.command('senders')
+@click.option('--count', type=int, help='Concurrent deliveries')
+def senders(count):
+    from mee6.announcements import Sender
+    Sender().run(count)
+
+@cli.command('reddit-poller')
+def reddit_poller():
+    from mee6.plugins.reddit import Reddit
+    reddit = Reddit()
+    reddit.sharded = True
+    reddit.run()
+
+@cli.command('reddit-announcer')
+def reddit_announcer():
+    from mee6.plugins.reddit import ShardAnnouncer
+    ShardAnnouncer().run()
+
+@cli.command('indexes')
+@click.argument('plugins', nargs=-1)
+@click.option('--fix', is_flag=True, help='Repair the drifted entries')
+@click.option('--batch-size', type=int, help='Keys per pipelined batch')
+def indexes(plugins, fix, batch_size):
+    from mee6.indexes import IndexVerifier
+    for plugin_name in plugins:
+        plugin = get(mee6.plugins, plugin_name.capitalize())(in_bot=False)
+        stats = IndexVerifier(plugin, fix=fix, batch_size=batch_size).run()
+        click.echo('{}: {} configs, {} index entries, {} index sets, '
+                   '{} missing, {} stale, {} of disabled guilds'.format(
+                       plugin.id, stats['configs'], stats['entries'],
+                       stats['indexes'], stats['missing'], stats['stale'],
+                       stats['disabled']))
+
 @cli.command('api')
 def api():
     from mee6.api.api import app
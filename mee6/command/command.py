@@ -2,9 +2,10 @@ import re
 import traceback
 import json
 
-from mee6.utils import get
+from mee6.utils import get, timed
 from mee6.rpc import get_guild_member
 from mee6.command.utils import build_regex
+from mee6.command.cooldown import CooldownEngine
 from mee6.command import Response
 from mee6.utils.redis import GroupKeys, PrefixedRedis
 from functools import wraps
@@ -14,13 +15,22 @@ from modus.exceptions import FieldValidationError
 
 
 class CommandContext:
-    def __init__(self, guild, message):
+    """ Everything resolved once per command execution. The member is only
+    fetched from the shards the first time `author` is accessed. """
+
+    _unresolved = object()
+
+    def __init__(self, guild, message, config=None):
         self.guild = guild
         self.message = message
+        self.config = config
+        self._author = self._unresolved
 
     @property
     def author(self):
-        return get_guild_member(self.guild.id, self.message.author.id)
+        if self._author is self._unresolved:
+            self._author = get_guild_member(self.guild.id, self.message.author.id)
+        return self._author
 
 
 class CommandMatch:
@@ -100,6 +110,7 @@ class Command:
         self.command_db = PrefixedRedis(plugin.db, self.id + '.')
         self.config_db = GroupKeys(self.id + '.config', self.command_db,
                                    cache=plugin.in_bot)
+        self.cooldowns = CooldownEngine(self.command_db)
 
     def default_config(self, guild):
         guild_id = get(guild, 'id', guild)
@@ -144,17 +155,33 @@ class Command:
         guild_id = get(guild, 'id', guild)
         self.config_db.delete('config.{}'.format(guild_id))
 
-    def check_permission(self, ctx):
-        member_permissions = ctx.author.get_permissions(ctx.guild)
+    def run_check(self, check_name, check, ctx):
+        tags = {'command': self.id, 'check': check_name}
+        with timed('command_check_duration', tags=tags):
+            return check(ctx)
+
+    def check_enabled(self, ctx):
+        return ctx.config.enabled
 
-        if ( member_permissions >> 5 & 1 ) or ( member_permissions >> 3 & 1):
-            return True
+    def check_owner(self, ctx):
+        owner_id = ctx.guild.owner_id
+        if owner_id is None:
+            return False
 
-        if int(ctx.author.id) == int(ctx.guild.owner_id):
-            return True
+        return int(ctx.message.author.id) == int(owner_id)
 
-        config = self.get_config(ctx.guild)
-        allowed_roles = config.allowed_roles
+    def check_admin(self, ctx):
+        if ctx.author is None:
+            return False
+
+        member_permissions = ctx.author.get_permissions(ctx.guild)
+        return bool(( member_permissions >> 5 & 1 ) or ( member_permissions >> 3 & 1))
+
+    def check_roles(self, ctx):
+        if ctx.author is None:
+            return False
+
+        allowed_roles = ctx.config.allowed_roles
         for role in ctx.author.roles:
             role_id = get(role, 'id', role)
             if role_id in allowed_roles:
@@ -162,30 +189,43 @@ class Command:
 
         return False
 
-    def check_enabled(self, ctx):
-        config = self.get_config(ctx.guild)
-        return config.enabled
+    def check_permission(self, ctx):
+        return (self.check_owner(ctx) or self.check_admin(ctx) or
+                self.check_roles(ctx))
 
-    def check_cooldown(self, ctx):
-        config = self.get_config(ctx.guild)
+    def get_cooldowns(self, ctx):
+        cooldowns = []
 
-        global_cooldown = config.global_cooldown
+        global_cooldown = ctx.config.global_cooldown
         if global_cooldown > -1:
             key = 'cooldown.{}'.format(ctx.guild.id)
-            cd_check = self.command_db.get(key)
-            if cb_check:
-                return False
+            cooldowns.append((key, global_cooldown))
 
-            self.command_db.setex(key, 1, global_cooldown)
+        personal_cooldown = ctx.config.personal_cooldown
+        if personal_cooldown > -1:
+            key = 'cooldown.{}.{}'.format(ctx.guild.id, ctx.message.author.id)
+            cooldowns.append((key, personal_cooldown))
 
-        personal_cooldown = config.personal_cooldown
-        if global_cooldown > -1:
-            key = 'cooldown.{}.{}'.format(ctx.guild.id, ctx.author.id)
-            cd_check = self.command_db.get(key)
-            if cb_check:
-                return False
+        return cooldowns
 
-            self.command_db.setex(key, 1, personal_cooldown)
+    def check_cooldown_cache(self, ctx):
+        keys = [key for key, _ in self.get_cooldowns(ctx)]
+        return not self.cooldowns.is_cooling(*keys)
+
+    def check_cooldown(self, ctx):
+        return self.cooldowns.acquire(self.get_cooldowns(ctx))
+
+    def check(self, ctx):
+        # Cheapest checks first, so that most rejections happen before any
+        # remote call.
+        checks = (('enabled', self.check_enabled),
+                  ('cooldown_cache', self.check_cooldown_cache),
+                  ('permission', self.check_permission),
+                  ('cooldown', self.check_cooldown))
+
+        for check_name, check in checks:
+            if not self.run_check(check_name, check, ctx):
+                return False
 
         return True
 
@@ -201,15 +241,9 @@ class Command:
         if match is None:
             return
 
-        ctx = CommandContext(guild, message)
-
-        if not self.check_permission(ctx):
-            return
-
-        if not self.check_enabled(ctx):
-            return
+        ctx = CommandContext(guild, message, self.get_config(guild))
 
-        if not self.check_cooldown(ctx):
+        if not self.check(ctx):
             return
 
         if not self.after_check(self, ctx):
@@ -0,0 +1,90 @@
+from time import time
+
+from mee6.utils import statsd
+
+
+# Checks every key and arms all of them only if none is cooling down.
+# Returns {index, pttl} of the first key still cooling down (1-based), or
+# {0, 0} when the cooldowns were armed.
+ACQUIRE_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    local ttl = redis.call('PTTL', key)
+    if ttl > 0 then
+        return {i, ttl}
+    end
+end
+
+for i, key in ipairs(KEYS) do
+    redis.call('SET', key, 1, 'EX', ARGV[i])
+end
+
+return {0, 0}
+"""
+
+
+class CooldownEngine:
+    """ Atomic cooldowns backed by redis.
+
+    All the cooldowns of an invocation are checked and armed in a single
+    round trip. Keys known to be cooling down are remembered locally until
+    they expire so that spammed commands are rejected without hitting redis.
+    """
+
+    def __init__(self, db, max_cached_keys=10000):
+        self.db = db
+        self.max_cached_keys = max_cached_keys
+        self._cooling = {}
+        self._script = db.rdb.register_script(ACQUIRE_SCRIPT)
+
+    def _remember(self, key, expires_at):
+        if len(self._cooling) >= self.max_cached_keys:
+            self.prune()
+        self._cooling[key] = expires_at
+
+    def prune(self):
+        now = time()
+        self._cooling = {k: exp for k, exp in self._cooling.items() if exp > now}
+
+        # Still full of live keys, start from scratch
+        if len(self._cooling) >= self.max_cached_keys:
+            self._cooling = {}
+
+    def is_cooling(self, *keys):
+        now = time()
+        for key in keys:
+            expires_at = self._cooling.get(key)
+            if expires_at is None:
+                continue
+
+            if expires_at > now:
+                return True
+
+            del self._cooling[key]
+
+        return False
+
+    def acquire(self, cooldowns):
+        """ Takes a list of (key, seconds) tuples. Returns True if none of the
+        keys was cooling down, in which case all of them got armed. """
+        if not cooldowns:
+            return True
+
+        keys = [key for key, _ in cooldowns]
+        if self.is_cooling(*keys):
+            statsd.increment('cooldowns.rejected', tags=['source:local'])
+            return False
+
+        full_keys = [self.db.pre + key for key in keys]
+        durations = [seconds for _, seconds in cooldowns]
+        index, ttl = self._script(keys=full_keys, args=durations)
+
+        now = time()
+        if index:
+            self._remember(keys[index - 1], now + ttl / 1000.)
+            statsd.increment('cooldowns.rejected', tags=['source:redis'])
+            return False
+
+        for key, seconds in cooldowns:
+            self._remember(key, now + seconds)
+
+        return True
@@ -1,5 +1,5 @@
 from mee6.utils import get
-from mee6.discord import send_message
+from mee6.discord import queue_message, INTERACTIVE
 
 
 class Response:
@@ -28,4 +28,5 @@ class Response:
     def send(self, guild, channel):
         guild_id = get(guild, 'id', guild)
         channel_id = get(channel, 'id', channel)
-        return send_message(channel_id, self.message, embed=self.embed)
+        return queue_message(channel_id, self.message, embed=self.embed,
+                             priority=INTERACTIVE).get()
@@ -1,7 +1,13 @@
 from mee6.discord.api.client import APIClient
+from mee6.discord.api.scheduler import INTERACTIVE, ANNOUNCEMENT, BACKGROUND
+from mee6.discord.api.template import MessageTemplate
 client_api = APIClient()
 
 send_message = client_api.send_message
 send_webhook_message = client_api.send_webhook_message
+send_template = client_api.send_template
+send_bodies = client_api.send_bodies
 get_channel_messages = client_api.get_channel_messages
 get_current_user = client_api.get_current_user
+queue_message = client_api.queue_message
+queue_webhook_message = client_api.queue_webhook_message
@@ -1,81 +1,177 @@
 import os
 import redis
 
+from gevent.event import AsyncResult
+from gevent.pool import Pool
 from mee6.discord.api.http import HTTPClient
+from mee6.discord.api.outbound import OutboundQueue
+from mee6.discord.api.webhooks import WebhookRegistry
+from mee6.discord.api.scheduler import BACKGROUND
+from mee6.discord.api.singleflight import SingleFlight
+from mee6.discord.api.destinations import DeadDestinations
+from mee6.discord.api.template import WEBHOOK_USERNAME, WEBHOOK_AVATAR_URL
 from mee6.types import Channel, Guild, Message, Webhook, User
 from mee6.exceptions import APIException
 from mee6.utils import real_dict
 
-class WebhookStorage:
-
-    def __init__(self):
-        redis_url = os.getenv('REDIS_URL', 'redis://localhost')
-        self.db = redis.from_url(redis_url, decode_responses=True)
-
 class APIClient:
 
     TOKEN = os.getenv('TOKEN')
+    # Seconds during which messages to the same destination are coalesced,
+    # coalescing is disabled if unset
+    COALESCE_WINDOW = os.getenv('COALESCE_WINDOW')
+    # Webhooks a channel can be posted through, used in turn
+    WEBHOOK_POOL_SIZE = int(os.getenv('WEBHOOK_POOL_SIZE', 1))
+    # Attempts at sending through a fresh webhook after a 404
+    WEBHOOK_RETRIES = 2
+    # Seconds the result of an idempotent GET is reused for, per endpoint.
+    # Identical GETs in flight are always collapsed.
+    CACHE_TTLS = {'get_channel_messages': 0,
+                  'get_current_user': 60}
+    # Concurrent requests of a send_bodies or send_template call
+    BULK_CONCURRENCY = int(os.getenv('BULK_CONCURRENCY', 50))
+    JSON_HEADERS = {'Content-Type': 'application/json'}
 
-    def __init__(self):
+    def __init__(self, coalesce_window=None, cache_ttls=None):
         redis_url = os.getenv('REDIS_URL', 'redis://localhost')
 
         self.http = HTTPClient(self.TOKEN)
         self.db = redis.from_url(redis_url, decode_responses=True)
+        self.webhooks = WebhookRegistry(self.db, self.WEBHOOK_POOL_SIZE)
+        self.flights = SingleFlight()
+        self.dead = DeadDestinations()
+
+        self.cache_ttls = dict(self.CACHE_TTLS)
+        self.cache_ttls.update(cache_ttls or {})
 
-    def create_webhook(self, webhook_id, channel_id):
+        coalesce_window = coalesce_window or self.COALESCE_WINDOW
+        if coalesce_window:
+            self.outbound = OutboundQueue(self, float(coalesce_window))
+        else:
+            self.outbound = None
+
+    def create_webhook(self, webhook_id, channel_id, slot=0, priority=None):
         path = 'channels/{}/webhooks'.format(channel_id)
         body = {'name': 'Mee6 Webhook'}
-        r = self.http.post(path, json=body)
+        try:
+            r = self.http.post(path, json=body, priority=priority)
+        except APIException as e:
+            self.dead.mark('webhooks', channel_id, e.status_code)
+            self.dead.mark_channel(channel_id, e)
+            raise e
+
         webhook = Webhook(**r.json())
 
-        self.db.set('webhooks.{}'.format(webhook_id),
-                    '{0.id}.{0.token}'.format(webhook))
+        registered = self.webhooks.add(webhook_id, slot, webhook)
+        if registered.id != webhook.id:
+            # Another process created this slot first
+            self.delete_webhook(webhook, priority=BACKGROUND)
+
+        return registered
 
-        return webhook
+    def delete_webhook(self, webhook, priority=None):
+        path = 'webhooks/{0.id}/{0.token}'.format(webhook)
+        self.http.delete(path, auth=False, priority=priority)
 
-    def get_webhook(self, webhook_id):
-        data = self.db.get('webhooks.{}'.format(webhook_id))
-        if not data:
-            return None
+    def get_webhook(self, webhook_id, slot=0):
+        key = ('get_webhook', webhook_id, slot)
+        return self.flights.do(key, lambda: self.webhooks.get(webhook_id, slot))
 
-        id, token = data.split('.')
-        return Webhook(id=id, token=token)
+    def reset_webhook(self, webhook_id, slot=0):
+        webhook = self.webhooks.get(webhook_id, slot)
+        if webhook is not None:
+            self.webhooks.invalidate(webhook_id, slot, webhook)
 
-    def reset_webhook(self, webhook_id):
-        self.db.delete('webhooks.{}'.format(webhook_id))
+    def create_pooled_webhook(self, webhook_id, channel_id, slot, priority):
+        # Greenlets missing the same slot share a single creation
+        key = ('create_webhook', webhook_id, slot)
+        create = lambda: self.create_webhook(webhook_id, channel_id, slot,
+                                             priority=priority)
+        return self.flights.do(key, create)
 
+    def get_webhook_route(self, webhook):
+        return 'webhooks/{0.id}/{0.token}?wait=true'.format(webhook)
+
+    def pick_webhook(self, webhook_id, channel_id, priority=None):
+        """ Returns the (slot, webhook) to send through. Webhooks are used in
+        turn, skipping those whose bucket is exhausted. A new webhook is only
+        added to the pool when all the existing ones are rate limited. With
+        a single webhook, its bucket isn't looked up. """
+        if self.webhooks.pool_size == 1:
+            webhook = self.get_webhook(webhook_id, 0)
+            if webhook is None:
+                webhook = self.create_pooled_webhook(webhook_id, channel_id, 0,
+                                                     priority)
+            return 0, webhook
+
+        earliest = None
+        for slot in self.webhooks.rotation(webhook_id):
+            webhook = self.get_webhook(webhook_id, slot)
+            if webhook is None:
+                return slot, self.create_pooled_webhook(webhook_id, channel_id,
+                                                        slot, priority)
+
+            route = self.get_webhook_route(webhook)
+            reset = self.http.ratelimit.get_reset(route)
+            if reset is None:
+                return slot, webhook
+
+            if earliest is None or reset < earliest[0]:
+                earliest = (reset, slot, webhook)
+
+        return earliest[1], earliest[2]
 
     def execute_webhook(self, webhook, message_content, username=None,
-                        avatar_url=None):
-        path = 'webhooks/{0.id}/{0.token}?wait=true'.format(webhook)
+                        avatar_url=None, embeds=None, priority=None,
+                        body=None):
+        path = self.get_webhook_route(webhook)
 
-        username = username or 'Mee6'
-        avatar_url = avatar_url or 'https://i.imgur.com/qCe8hGX.png'
+        if body is not None:
+            r = self.http.post(path, auth=False, data=body,
+                               headers=self.JSON_HEADERS, priority=priority)
+            return Message(**r.json())
+
+        username = username or WEBHOOK_USERNAME
+        avatar_url = avatar_url or WEBHOOK_AVATAR_URL
 
         body = {'content': message_content,
                 'username': username,
                 'avatar_url': avatar_url}
+        if embeds:
+            body['embeds'] = [embed.get_dict() for embed in embeds]
 
-        r = self.http.post(path, auth=False, json=body)
+        r = self.http.post(path, auth=False, json=body, priority=priority)
 
         return Message(**r.json())
 
-    def send_webhook_message(self, webhook_id, channel_id, message_content):
-        webhook = self.get_webhook(webhook_id)
-        if webhook is None:
-            webhook = self.create_webhook(webhook_id, channel_id)
+    def send_webhook_message(self, webhook_id, channel_id, message_content,
+                             embeds=None, priority=None, body=None):
+        """ `body` is a JSON body rendered by a MessageTemplate, it replaces
+        the content and the embeds """
+        self.dead.check('webhooks', channel_id)
 
-        try:
-            return self.execute_webhook(webhook, message_content)
-        except APIException as e:
-            if e.status_code == 404:
-                self.reset_webhook(webhook_id)
-                return self.send_webhook_message(webhook_id, channel_id, message_content)
-            else:
-                raise e
+        for attempt in range(self.WEBHOOK_RETRIES + 1):
+            slot, webhook = self.pick_webhook(webhook_id, channel_id,
+                                              priority=priority)
+
+            try:
+                message = self.execute_webhook(webhook, message_content,
+                                               embeds=embeds, priority=priority,
+                                               body=body)
+            except APIException as e:
+                if e.status_code != 404 or attempt == self.WEBHOOK_RETRIES:
+                    raise e
+
+                # The webhook got deleted, forget it and retry with a new one
+                self.webhooks.invalidate(webhook_id, slot, webhook)
+                continue
+
+            # The channel exists, even if a send to it was refused
+            self.dead.revive('channel', channel_id)
+            return message
 
     def get_channel_messages(self, channel_id, limit=None, around=None,
-                             before=None, after=None):
+                             before=None, after=None, priority=None):
         path = '/channels/{}/messages'.format(channel_id)
 
         params = real_dict({'limit': limit,
@@ -83,22 +179,109 @@ class APIClient:
                             'before': before,
                             'after': after})
 
-        r = self.http.get(path, params=params)
+        def get_messages():
+            self.dead.check('channel', channel_id)
+            try:
+                r = self.http.get(path, params=params, priority=priority)
+            except APIException as e:
+                self.dead.mark_channel(channel_id, e)
+                raise e
 
-        return [Message(**message) for message in r.json()]
+            return [Message(**message) for message in r.json()]
 
-    def get_current_user(self):
+        key = ('get_channel_messages', channel_id, limit, around, before, after)
+        ttl = self.cache_ttls.get('get_channel_messages', 0)
+        return self.flights.do(key, get_messages, ttl=ttl)
+
+    def get_current_user(self, priority=None):
         path = '/users/@me'
-        r = self.http.get(path)
-        return User(**r.json())
 
-    def send_message(self, channel_id, message_content, embed=None):
+        def get_user():
+            r = self.http.get(path, priority=priority)
+            return User(**r.json())
+
+        ttl = self.cache_ttls.get('get_current_user', 0)
+        return self.flights.do(('get_current_user',), get_user, ttl=ttl)
+
+    def send_message(self, channel_id, message_content, embed=None,
+                     embeds=None, priority=None, body=None):
+        """ `body` is a JSON body rendered by a MessageTemplate, it replaces
+        the content and the embeds """
+        self.dead.check('channel', channel_id)
+
         path = 'channels/{}/messages'.format(channel_id)
-        body = {'content': message_content}
-        if embed:
-            body['embed'] = embed.get_dict()
 
-        r = self.http.post(path, json=body)
+        if body is not None:
+            kwargs = {'data': body, 'headers': self.JSON_HEADERS}
+        else:
+            body = {'content': message_content}
+
+            embeds = ([embed] if embed else []) + list(embeds or [])
+            if len(embeds) == 1:
+                body['embed'] = embeds[0].get_dict()
+            elif embeds:
+                body['embeds'] = [e.get_dict() for e in embeds]
+
+            kwargs = {'json': body}
+
+        try:
+            r = self.http.post(path, priority=priority, **kwargs)
+        except APIException as e:
+            self.dead.mark_channel(channel_id, e)
+            raise e
 
         return Message(**r.json())
 
+    def send_bodies(self, messages, priority=None):
+        """ Sends pre-rendered messages concurrently. `messages` are
+        (channel_id, body) pairs, see MessageTemplate. Returns, in the same
+        order, the sent Message or the exception raised for each. """
+        def send(message):
+            channel_id, body = message
+            try:
+                return self.send_message(channel_id, None, body=body,
+                                         priority=priority)
+            except Exception as e:
+                return e
+
+        messages = list(messages)
+        pool = Pool(min(self.BULK_CONCURRENCY, max(1, len(messages))))
+        return list(pool.imap(send, messages))
+
+    def send_template(self, template, destinations, priority=None):
+        """ Sends a MessageTemplate to many channels, `destinations` are
+        (channel_id, content) pairs. See send_bodies. """
+        messages = [(channel_id, template.render(content))
+                    for channel_id, content in destinations]
+        return self.send_bodies(messages, priority=priority)
+
+    def _queue(self, destination, send, message_content, embed=None):
+        if self.outbound is not None:
+            return self.outbound.put(destination, message_content, embed=embed)
+
+        result = AsyncResult()
+        try:
+            result.set(send())
+        except Exception as e:
+            result.set_exception(e)
+        return result
+
+    def queue_message(self, channel_id, message_content, embed=None,
+                      priority=None):
+        """ Like send_message but returns an AsyncResult, the message might be
+        merged with others sent to the same channel if coalescing is enabled """
+        destination = ('channel', channel_id, priority)
+        send = lambda: self.send_message(channel_id, message_content,
+                                         embed=embed, priority=priority)
+        return self._queue(destination, send, message_content, embed=embed)
+
+    def queue_webhook_message(self, webhook_id, channel_id, message_content,
+                              priority=None):
+        """ Like send_webhook_message but returns an AsyncResult, see
+        queue_message """
+        destination = ('webhook', webhook_id, channel_id, priority)
+        send = lambda: self.send_webhook_message(webhook_id, channel_id,
+                                                 message_content,
+                                                 priority=priority)
+        return self._queue(destination, send, message_content)
+
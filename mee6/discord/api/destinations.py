@@ -0,0 +1,60 @@
+import os
+
+from time import time
+from mee6.exceptions import DeadDestinationException
+from mee6.utils import statsd
+
+
+class DeadDestinations:
+    """ Negative cache of the destinations Discord answered 403 or 404 for.
+    Sends to them are rejected locally until the entry expires, so that they
+    don't count against Discord's invalid requests limit. """
+
+    TTL = int(os.getenv('DEAD_DESTINATION_TTL', 600))
+    STATUS_CODES = (403, 404)
+    # Discord error codes of a channel that is gone or out of reach, a 403
+    # with another code is about the message (embeds, mentions...)
+    CHANNEL_ERROR_CODES = (10003, 50001)
+    MAX_ENTRIES = 100000
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or self.TTL
+        self.dead = {}
+
+    def prune(self):
+        now = time()
+        self.dead = {k: v for k, v in self.dead.items() if v[0] > now}
+
+    def mark(self, kind, destination_id, status_code):
+        if status_code not in self.STATUS_CODES:
+            return
+
+        if len(self.dead) >= self.MAX_ENTRIES:
+            self.prune()
+
+        key = (kind, str(destination_id))
+        self.dead[key] = (time() + self.ttl, status_code)
+        statsd.increment('api.dead_destinations', tags=['destination_type:' + kind])
+
+    def mark_channel(self, channel_id, e):
+        """ Marks the channel dead if the APIException `e` means it's
+        gone or out of reach """
+        if e.status_code == 404 or e.error_code in self.CHANNEL_ERROR_CODES:
+            self.mark('channel', channel_id, e.status_code)
+
+    def revive(self, kind, destination_id):
+        self.dead.pop((kind, str(destination_id)), None)
+
+    def check(self, kind, destination_id):
+        key = (kind, str(destination_id))
+        entry = self.dead.get(key)
+        if entry is None:
+            return
+
+        expires_at, status_code = entry
+        if expires_at <= time():
+            del self.dead[key]
+            return
+
+        statsd.increment('api.suppressed_sends', tags=['destination_type:' + kind])
+        raise DeadDestinationException(kind, destination_id, status_code)
@@ -1,13 +1,15 @@
 import requests
 import logging
-import gevent
 import os
 import re
 
+from requests.adapters import HTTPAdapter
 from mee6.utils import Logger
 from mee6.discord.api.ratelimit import LocalRatelimit, RedisRatelimit
+from mee6.discord.api.scheduler import PriorityScheduler, ANNOUNCEMENT
 from mee6.exceptions import APIException
 from mee6.utils import timed
+from mee6.utils.breaker import CircuitBreakers
 
 logging.getLogger('requests').setLevel(logging.WARNING)
 
@@ -15,18 +17,36 @@ rx = re.compile(r'^[0-9]*$')
 
 class HTTPClient(Logger):
 
-    BASE_URL = 'https://discordapp.com/api/v7'
+    BASE_URL = os.getenv('DISCORD_API_URL', 'https://discordapp.com/api/v7')
     RATELIMIT_REDIS_URL = os.getenv('RATELIMIT_REDIS_URL')
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 100))
+    TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 10))
+    # Seconds above which a response slows the routes concurrency down
+    LATENCY_TARGET = float(os.getenv('API_LATENCY_TARGET', 1))
 
-    def __init__(self, token):
+    def __init__(self, token, session=None, ratelimit=None, scheduler=None,
+                 breakers=None):
         self.token = token
 
-        if self.RATELIMIT_REDIS_URL:
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.HTTP_POOL_SIZE,
+                                  pool_maxsize=self.HTTP_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+
+        if ratelimit is not None:
+            self.ratelimit = ratelimit
+        elif self.RATELIMIT_REDIS_URL:
             self.ratelimit = RedisRatelimit(self.RATELIMIT_REDIS_URL)
         else:
             self.ratelimit = LocalRatelimit()
 
-    def build_url(self, route): return self.BASE_URL + '/' + route
+        self.scheduler = scheduler or PriorityScheduler()
+        self.breakers = breakers or CircuitBreakers('api', self.LATENCY_TARGET)
+
+    def build_url(self, route): return self.BASE_URL + '/' + route.lstrip('/')
 
     def build_metric_type(self, method, route):
         route = route.split('?')[0]
@@ -35,18 +55,33 @@ class HTTPClient(Logger):
         parts = [method] + [part for part in route_splitted if not rx.match(part)]
         return '_'.join(parts)
 
-    def __call__(self, method, route, auth=True, **kwargs):
+    def __call__(self, method, route, auth=True, priority=None, **kwargs):
         url = self.build_url(route)
 
+        priority = priority or ANNOUNCEMENT
+        self.scheduler.acquire(priority)
         self.ratelimit.check(route)
 
-        headers = dict()
+        headers = dict(kwargs.pop('headers', None) or {})
         if auth:
             headers['Authorization'] = 'Bot ' + self.token
 
-        tags = {'request_type': self.build_metric_type(method, route)}
-        with timed('api_request_duration', tags=tags):
-            r = requests.request(method, url, headers=headers, **kwargs)
+        kwargs.setdefault('timeout', self.TIMEOUT)
+
+        tags = {'request_type': self.build_metric_type(method, route),
+                'priority': priority}
+        breaker = self.breakers.get(tags['request_type'])
+        probe = breaker.acquire()
+        start = self.breakers.clock.time()
+        success, latency = False, None
+        try:
+            with timed('api_request_duration', tags=tags):
+                r = self.session.request(method, url, headers=headers, **kwargs)
+            success = r.status_code < 500
+            latency = self.breakers.clock.time() - start
+        finally:
+            # Also frees the slot when a timeout or a kill interrupts it
+            breaker.release(success, latency, probe=probe)
 
         self.ratelimit.update(route, r)
 
@@ -57,8 +92,9 @@ class HTTPClient(Logger):
             raise APIException(r)
 
         if r.status_code == 429:
-            gevent.sleep(self.ratelimit.handle_429(route, r))
-            return self.__call__(method, route, **kwargs)
+            self.ratelimit.clock.sleep(self.ratelimit.handle_429(route, r))
+            return self.__call__(method, route, auth=auth, priority=priority,
+                                 **kwargs)
         else:
             raise APIException(r)
 
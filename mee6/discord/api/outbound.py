@@ -0,0 +1,101 @@
+import gevent
+
+from gevent.event import AsyncResult
+from mee6.utils import Logger, statsd
+
+
+MAX_CONTENT_LENGTH = 2000
+MAX_EMBEDS = 10
+
+
+class OutboundMessage:
+    def __init__(self, content, embed=None):
+        self.content = content or ''
+        self.embed = embed
+        self.result = AsyncResult()
+
+
+class OutboundQueue(Logger):
+    """ Coalesces the messages sent to the same destination within `window`
+    seconds. Their contents are joined up to the 2000 characters limit and
+    their embeds are sent together, up to 10 per request. Every queued message
+    gets an AsyncResult resolved with the message it ended up in. """
+
+    separator = '\n'
+
+    def __init__(self, client, window):
+        self.client = client
+        self.window = window
+        self.pending = {}
+
+    def put(self, destination, content, embed=None):
+        """ `destination` is either ('channel', channel_id, priority) or
+        ('webhook', webhook_id, channel_id, priority) """
+        message = OutboundMessage(content, embed)
+
+        pending = self.pending.get(destination)
+        if pending is None:
+            pending = self.pending[destination] = []
+            gevent.spawn_later(self.window, self.flush, destination)
+
+        pending.append(message)
+        return message.result
+
+    def pack(self, messages):
+        batches = []
+        batch, length, embeds = [], 0, 0
+
+        for message in messages:
+            added_length = len(message.content)
+            if batch and message.content:
+                added_length += len(self.separator)
+            added_embeds = 1 if message.embed else 0
+
+            if batch and (length + added_length > MAX_CONTENT_LENGTH or
+                          embeds + added_embeds > MAX_EMBEDS):
+                batches.append(batch)
+                batch, length, embeds = [], 0, 0
+                added_length = len(message.content)
+
+            batch.append(message)
+            length += added_length
+            embeds += added_embeds
+
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    def flush(self, destination):
+        messages = self.pending.pop(destination, [])
+        batches = self.pack(messages)
+
+        tags = ['destination_type:' + destination[0]]
+        statsd.histogram('outbound.coalesced_messages', len(messages), tags=tags)
+        statsd.increment('outbound.requests', len(batches), tags=tags)
+
+        for batch in batches:
+            self.send(destination, batch)
+
+    def send(self, destination, batch):
+        content = self.separator.join(m.content for m in batch if m.content)
+        embeds = [m.embed for m in batch if m.embed]
+
+        try:
+            if destination[0] == 'webhook':
+                _, webhook_id, channel_id, priority = destination
+                sent = self.client.send_webhook_message(webhook_id, channel_id,
+                                                        content, embeds=embeds,
+                                                        priority=priority)
+            else:
+                _, channel_id, priority = destination
+                sent = self.client.send_message(channel_id, content,
+                                                embeds=embeds,
+                                                priority=priority)
+        except Exception as e:
+            for message in batch:
+                message.result.set_exception(e)
+            return
+
+        for message in batch:
+            message.result.set(sent)
@@ -1,15 +1,15 @@
-import gevent
 import redis
-import time
 import math
 
 from mee6.utils import Logger
+from mee6.utils.clock import Clock
 from gevent.lock import Semaphore
 
 class Ratelimit(Logger):
 
-    def __init__(self):
+    def __init__(self, clock=None):
         self._lock = Semaphore()
+        self.clock = clock or Clock()
 
     def get_route(route):
         raise NotImplemented
@@ -20,20 +20,41 @@ class Ratelimit(Logger):
     def del_route(route):
         raise NotImplemented
 
-    def check(self, route):
+    def get_reset(self, route):
+        """ Returns when the route bucket resets if it is currently exhausted,
+        None otherwise. """
+        with self._lock:
+            reset = self.get_route(route) or self.get_route('global')
+
+        if reset is None or reset <= self.clock.time():
+            return None
+
+        return reset
+
+    def get_wait(self, route):
+        """ Returns how long to wait before hitting the route, None if it
+        isn't rate limited. Call `clear` once waited. """
         with self._lock:
             reset = self.get_route(route) or self.get_route('global')
 
-        if not reset: return
+        if not reset: return None
 
-        sleep_time = math.floor(max(0, reset - time.time()))
+        sleep_time = math.floor(max(0, reset - self.clock.time()))
         self.log('Bucket {} full, waiting {}s'.format(route, sleep_time))
-        gevent.sleep(sleep_time + 0.1)
+        return sleep_time + 0.1
 
+    def clear(self, route):
         with self._lock:
             self.del_route(route)
             self.del_route('global')
 
+    def check(self, route):
+        sleep_time = self.get_wait(route)
+        if sleep_time is None: return
+
+        self.clock.sleep(sleep_time)
+        self.clear(route)
+
         return
 
     def update(self, route, r):
@@ -48,19 +69,19 @@ class Ratelimit(Logger):
         retry_after = math.ceil(payload['retry_after'] / 1000.)
         if payload['global']:
             with self._lock:
-                self.set_route('global', math.ceil(time.time() + retry_after))
+                self.set_route('global', math.ceil(self.clock.time() + retry_after))
             self.log('Received 429: Bucket {} [GLOBAL RATELIMIT], waiting {}s'.format(route, retry_after))
         else:
             with self._lock:
-                self.set_route(route, math.ceil(time.time() + retry_after))
+                self.set_route(route, math.ceil(self.clock.time() + retry_after))
             self.log('Received 429: Bucket {} full, waiting {}s'.format(route,
                                                                        retry_after))
         return retry_after
 
 class LocalRatelimit(Ratelimit):
-    def __init__(self):
+    def __init__(self, clock=None):
         self.routes = {}
-        super(LocalRatelimit, self).__init__()
+        super(LocalRatelimit, self).__init__(clock=clock)
 
     def get_route(self, route):
         return self.routes.get(route)
@@ -69,12 +90,12 @@ class LocalRatelimit(Ratelimit):
         self.routes[route] = reset
 
     def del_route(self, route):
-        del self.routes[route]
+        self.routes.pop(route, None)
 
 class RedisRatelimit(Ratelimit):
-    def __init__(self, redis_url):
+    def __init__(self, redis_url, clock=None):
         self.r = redis.from_url(redis_url, decode_responses=True)
-        super(RedisRatelimit, self).__init__()
+        super(RedisRatelimit, self).__init__(clock=clock)
 
     def get_route(self, route):
         reset = self.r.get('Ratelimit.{}'.format(route))
@@ -0,0 +1,112 @@
+import os
+
+from mee6.utils import Logger, statsd
+from mee6.utils.clock import Clock
+
+
+# Priority classes, from the most to the least urgent
+INTERACTIVE = 'interactive'
+ANNOUNCEMENT = 'announcement'
+BACKGROUND = 'background'
+
+PRIORITIES = (INTERACTIVE, ANNOUNCEMENT, BACKGROUND)
+
+
+class PriorityScheduler(Logger):
+    """ Shares the global request budget between priority classes.
+
+    The budget is a token bucket refilled at `rate` requests per second. Each
+    class must leave a reserve of tokens to the classes above it: interactive
+    traffic can use the whole bucket, announcements everything but the
+    interactive reserve, and background traffic what's left above both
+    reserves. A class also waits as long as a more urgent one is waiting.
+
+    So that a steady flow of urgent requests doesn't starve the others, a
+    request waiting for AGING seconds is promoted to the next class, up to
+    announcements: the interactive reserve stays untouched.
+
+    The bucket is per process, it isn't shared through redis: when several
+    processes send with the same token, API_GLOBAL_RATE must be set to the
+    share of the global rate limit of each one.
+    """
+
+    GLOBAL_RATE = float(os.getenv('API_GLOBAL_RATE', 50))
+    # Share of the bucket reserved to the interactive traffic
+    INTERACTIVE_RESERVE = 0.2
+    # Share of the bucket background traffic leaves untouched
+    BACKGROUND_RESERVE = 0.5
+    # Seconds of waiting after which a request is promoted to the next class
+    AGING = float(os.getenv('API_SCHEDULER_AGING', 5))
+
+    def __init__(self, rate=None, clock=None):
+        self.clock = clock or Clock()
+        self.rate = rate or self.GLOBAL_RATE
+        self.tokens = self.rate
+        self.updated_at = self.clock.time()
+
+        self.reserves = {INTERACTIVE: 0,
+                         ANNOUNCEMENT: self.rate * self.INTERACTIVE_RESERVE,
+                         BACKGROUND: self.rate * self.BACKGROUND_RESERVE}
+        self.waiting = {priority: 0 for priority in PRIORITIES}
+
+    def refill(self):
+        now = self.clock.time()
+        elapsed = now - self.updated_at
+        self.tokens = min(self.rate, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def more_urgent_waiting(self, priority):
+        rank = PRIORITIES.index(priority)
+        return any(self.waiting[p] for p in PRIORITIES[:rank])
+
+    def can_acquire(self, priority):
+        if self.more_urgent_waiting(priority):
+            return False
+
+        return self.tokens - 1 >= self.reserves[priority]
+
+    def promote(self, priority, waited):
+        """ Returns the class a request of `priority` which waited `waited`
+        seconds is scheduled as """
+        rank = PRIORITIES.index(priority)
+        promotions = int(waited / self.AGING)
+        return PRIORITIES[max(rank - promotions, min(rank, 1))]
+
+    def try_acquire(self, priority):
+        """ Takes a token if the class can, returns 0 then. Otherwise returns
+        how long to wait before trying again. """
+        self.refill()
+        if self.can_acquire(priority):
+            self.tokens -= 1
+            return 0
+
+        missing = self.reserves[priority] + 1 - self.tokens
+        return max(missing / self.rate, 0.005)
+
+    def report_wait(self, priority, wait):
+        tags = ['priority:' + priority]
+        statsd.timing('api_scheduler_wait', wait * 1000, tags=tags)
+
+    def acquire(self, priority=ANNOUNCEMENT):
+        start = self.clock.time()
+
+        wait = self.try_acquire(priority)
+        if wait:
+            scheduled_as = priority
+            self.waiting[scheduled_as] += 1
+            try:
+                while wait:
+                    self.clock.sleep(wait)
+
+                    promoted = self.promote(priority,
+                                            self.clock.time() - start)
+                    if promoted != scheduled_as:
+                        self.waiting[scheduled_as] -= 1
+                        self.waiting[promoted] += 1
+                        scheduled_as = promoted
+
+                    wait = self.try_acquire(scheduled_as)
+            finally:
+                self.waiting[scheduled_as] -= 1
+
+        self.report_wait(priority, self.clock.time() - start)
@@ -0,0 +1,60 @@
+from gevent.event import AsyncResult
+from time import time
+
+
+class InterruptedCall(Exception):
+    """ Raised to the callers waiting for a call that was killed or timed
+    out in the caller doing it """
+
+
+class SingleFlight:
+    """ Collapses identical calls: while a call for a key is in flight, other
+    callers for that key wait for its result instead of doing the call again.
+    Results can also be kept for `ttl` seconds once the call is done. """
+
+    MAX_CACHED = 10000
+
+    def __init__(self):
+        self.calls = {}
+        self.cache = {}
+
+    def prune(self):
+        now = time()
+        self.cache = {k: v for k, v in self.cache.items() if v[0] > now}
+
+        # Still full of live results, start from scratch
+        if len(self.cache) >= self.MAX_CACHED:
+            self.cache = {}
+
+    def do(self, key, fn, ttl=0):
+        cached = self.cache.get(key)
+        if cached is not None:
+            expires_at, result = cached
+            if expires_at > time():
+                return result
+            del self.cache[key]
+
+        call = self.calls.get(key)
+        if call is not None:
+            return call.get()
+
+        call = self.calls[key] = AsyncResult()
+        try:
+            result = fn()
+        except Exception as e:
+            call.set_exception(e)
+            raise
+        finally:
+            del self.calls[key]
+            # GreenletExit, gevent.Timeout...
+            if not call.ready():
+                call.set_exception(InterruptedCall(key))
+
+        call.set(result)
+
+        if ttl:
+            if len(self.cache) >= self.MAX_CACHED:
+                self.prune()
+            self.cache[key] = (time() + ttl, result)
+
+        return result
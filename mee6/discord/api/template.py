@@ -0,0 +1,41 @@
+from mee6.utils import json
+
+
+WEBHOOK_USERNAME = 'Mee6'
+WEBHOOK_AVATAR_URL = 'https://i.imgur.com/qCe8hGX.png'
+
+
+class MessageTemplate:
+    """ Message sent to many destinations where only the content differs,
+    like a stream announcement. The embeds are serialized once, the JSON body
+    of every destination is spliced from the encoded parts. """
+
+    def __init__(self, embeds=None, encoded=None):
+        if encoded is None:
+            encoded = [json.dumps(embed.get_dict()) for embed in embeds or []]
+        self.encoded = encoded
+
+        if len(encoded) == 1:
+            self._channel_tail = ', "embed": ' + encoded[0] + '}'
+        elif encoded:
+            self._channel_tail = ', "embeds": [' + ', '.join(encoded) + ']}'
+        else:
+            self._channel_tail = '}'
+
+        webhook_tail = {'username': WEBHOOK_USERNAME,
+                        'avatar_url': WEBHOOK_AVATAR_URL}
+        self._webhook_tail = ', ' + json.dumps(webhook_tail)[1:-1]
+        if encoded:
+            self._webhook_tail += ', "embeds": [' + ', '.join(encoded) + ']'
+        self._webhook_tail += '}'
+
+    @classmethod
+    def join(cls, templates):
+        """ Template with the embeds of all the `templates`, in order, without
+        serializing them again """
+        return cls(encoded=[part for t in templates for part in t.encoded])
+
+    def render(self, content, webhook=False):
+        """ Returns the JSON body of the message for a channel, or a webhook """
+        tail = self._webhook_tail if webhook else self._channel_tail
+        return '{"content": ' + json.dumps(content) + tail
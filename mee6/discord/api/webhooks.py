@@ -0,0 +1,96 @@
+from time import time
+
+from mee6.types import Webhook
+from mee6.utils import Logger
+
+
+# Deletes KEYS[1] if it still holds the webhook ARGV[1]
+INVALIDATE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class WebhookRegistry(Logger):
+    """ Process-local registry of the webhooks used to post in channels, with
+    redis as backing store.
+
+    A `webhook_id` (ex: 'timers:<channel_id>') maps to a pool of up to
+    `pool_size` webhooks. Slot 0 is stored under `webhooks.<webhook_id>` and
+    the other slots under `webhooks.<webhook_id>.<slot>`.
+    """
+
+    # Seconds during which a slot found empty in redis isn't looked up again
+    MISS_TTL = 60
+
+    def __init__(self, db, pool_size=1):
+        self.db = db
+        self.pool_size = max(1, pool_size)
+        self.webhooks = {}
+        self.misses = {}
+        self.cursors = {}
+        self._invalidate = db.register_script(INVALIDATE_SCRIPT)
+
+    def key(self, webhook_id, slot):
+        if slot == 0:
+            return 'webhooks.{}'.format(webhook_id)
+        return 'webhooks.{}.{}'.format(webhook_id, slot)
+
+    def _decode(self, data):
+        id, token = data.split('.')
+        return Webhook(id=id, token=token)
+
+    def _encode(self, webhook):
+        return '{0.id}.{0.token}'.format(webhook)
+
+    def get(self, webhook_id, slot=0):
+        webhook = self.webhooks.get((webhook_id, slot))
+        if webhook is not None:
+            return webhook
+
+        if self.misses.get((webhook_id, slot), 0) > time():
+            return None
+
+        data = self.db.get(self.key(webhook_id, slot))
+        if not data:
+            self.misses[(webhook_id, slot)] = time() + self.MISS_TTL
+            return None
+
+        webhook = self._decode(data)
+        self.webhooks[(webhook_id, slot)] = webhook
+        return webhook
+
+    def add(self, webhook_id, slot, webhook):
+        """ Registers a freshly created webhook. If another process registered
+        one for that slot in the meantime, that one is kept and returned. """
+        key = self.key(webhook_id, slot)
+        if not self.db.set(key, self._encode(webhook), nx=True):
+            data = self.db.get(key)
+            if data:
+                webhook = self._decode(data)
+
+        self.misses.pop((webhook_id, slot), None)
+        self.webhooks[(webhook_id, slot)] = webhook
+        return webhook
+
+    def invalidate(self, webhook_id, slot, webhook):
+        self.webhooks.pop((webhook_id, slot), None)
+
+        # Don't drop a webhook another process has already replaced
+        self._invalidate(keys=[self.key(webhook_id, slot)],
+                         args=[self._encode(webhook)])
+
+    def rotation(self, webhook_id):
+        """ Slots in the order they should be tried: the existing webhooks,
+        round-robin, then the empty slots. """
+        slots = range(self.pool_size)
+        existing = [slot for slot in slots if self.get(webhook_id, slot)]
+        missing = [slot for slot in slots if slot not in existing]
+
+        if existing:
+            cursor = self.cursors.get(webhook_id, 0) % len(existing)
+            self.cursors[webhook_id] = cursor + 1
+            existing = existing[cursor:] + existing[:cursor]
+
+        return existing + missing
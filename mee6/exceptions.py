@@ -26,3 +26,39 @@ class RPCException(Exception):
 
         super(RPCException, self).__init__(msg)
 
+
+class ValidationError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+
+        super(ValidationError, self).__init__(errors)
+
+
+class DeadDestinationException(APIException):
+    """ Raised without any request when the destination is known to be
+    missing or forbidden """
+
+    def __init__(self, kind, destination_id, status_code):
+        msg = 'Destination {} {} is dead status_code={}'.format(kind,
+                                                                destination_id,
+                                                                status_code)
+        self.destination = (kind, destination_id)
+        self.payload = ''
+        self.status_code = status_code
+        self.error_code = None
+        self.error_message = None
+
+        Exception.__init__(self, msg)
+
+
+class CircuitOpenException(Exception):
+    """ Raised without any request when the route family is failing or
+    saturated """
+
+    def __init__(self, route, reason, retry_after=None):
+        msg = 'Circuit {} rejected the request reason={}'.format(route, reason)
+        self.route = route
+        self.reason = reason
+        self.retry_after = retry_after
+
+        super(CircuitOpenException, self).__init__(msg)
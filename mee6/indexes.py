@@ -0,0 +1,126 @@
+from collections import Counter
+from mee6.utils import Logger, statsd
+
+
+class IndexVerifier(Logger):
+    """ Checks the reverse indexes of a plugin (the sets of get_config_indexes)
+    against the stored configs, and repairs them with `fix`.
+
+    Configs and index sets are streamed with SCAN/SSCAN and checked in
+    pipelined batches of `batch_size`, memory doesn't grow with the number
+    of guilds. A guild patched during the run might be reported as drifted.
+
+    The sets only index the guilds the plugin is enabled for, the entries
+    of disabled guilds are drift too: they're counted apart and removed by
+    `fix`, and their configs aren't checked for missing entries.
+    """
+
+    BATCH_SIZE = 1000
+    # Batches between two progress logs
+    REPORT_EVERY = 100
+
+    def __init__(self, plugin, fix=False, batch_size=None):
+        self.plugin = plugin
+        self.db = plugin.db
+        self.fix = fix
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.stats = Counter()
+
+    def batches(self, iterator):
+        batch = []
+        for item in iterator:
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def run(self):
+        """ Returns the drift statistics """
+        self.log('Checking the {} indexes{}'.format(
+            self.plugin.id, ' (fixing)' if self.fix else ''))
+
+        self.check_missing()
+        self.check_stale()
+
+        tags = ['plugin:' + self.plugin.id]
+        for stat in ('missing', 'stale', 'disabled'):
+            statsd.gauge('indexes.' + stat, self.stats[stat], tags=tags)
+
+        return self.stats
+
+    def report(self, batches_count):
+        if batches_count % self.REPORT_EVERY == 0:
+            self.log('{} {}'.format(self.plugin.id, dict(self.stats)))
+
+    def get_enabled(self, guilds_ids):
+        """ Returns whether the plugin is enabled for each guild """
+        guilds_key = 'plugin.{}.guilds'.format(self.plugin.name)
+        pipe = self.db.pipeline(transaction=False)
+        for guild_id in guilds_ids:
+            pipe.sismember(guilds_key, guild_id)
+        return pipe.execute()
+
+    def check_missing(self):
+        """ Index entries the configs of enabled guilds have but the sets
+        don't """
+        pattern = 'plugin.{}.config.*'.format(self.plugin.id)
+        keys_iter = self.db.scan_iter(pattern, count=self.batch_size)
+        for i, keys in enumerate(self.batches(keys_iter), 1):
+            guilds_ids = [key.split('.')[-1] for key in keys]
+            guilds_ids = [guild_id for guild_id, enabled
+                          in zip(guilds_ids, self.get_enabled(guilds_ids))
+                          if enabled]
+
+            entries = []
+            for guild_id, config in self.plugin.get_configs(guilds_ids):
+                for key in self.plugin.get_config_indexes(guild_id, config):
+                    entries.append((key, guild_id))
+
+            pipe = self.db.pipeline(transaction=False)
+            for key, guild_id in entries:
+                pipe.sismember(key, guild_id)
+            missing = [entry for entry, is_member in zip(entries, pipe.execute())
+                       if not is_member]
+
+            if self.fix and missing:
+                pipe = self.db.pipeline(transaction=False)
+                for key, guild_id in missing:
+                    pipe.sadd(key, guild_id)
+                pipe.execute()
+
+            self.stats['configs'] += len(keys)
+            self.stats['entries'] += len(entries)
+            self.stats['missing'] += len(missing)
+            self.report(i)
+
+    def check_stale(self):
+        """ Index entries the configs don't have anymore, and the entries of
+        guilds the plugin is disabled for """
+        i = 0
+        for pattern in self.plugin.get_index_patterns():
+            for index_key in self.db.scan_iter(pattern, count=self.batch_size):
+                self.stats['indexes'] += 1
+
+                members_iter = self.db.sscan_iter(index_key,
+                                                  count=self.batch_size)
+                for guilds_ids in self.batches(members_iter):
+                    configs = self.plugin.get_configs(guilds_ids)
+                    stale = [guild_id for guild_id, config in configs
+                             if index_key not in
+                             self.plugin.get_config_indexes(guild_id, config)]
+
+                    disabled = [guild_id for guild_id, enabled
+                                in zip(guilds_ids,
+                                       self.get_enabled(guilds_ids))
+                                if not enabled and guild_id not in stale]
+
+                    if self.fix and (stale or disabled):
+                        self.db.srem(index_key, *(stale + disabled))
+
+                    self.stats['stale'] += len(stale)
+                    self.stats['disabled'] += len(disabled)
+                    i += 1
+                    self.report(i)
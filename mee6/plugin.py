@@ -5,7 +5,11 @@ import mee6.types
 import inspect
 
 from mee6.types import Guild
-from mee6.utils import Logger, get, json
+from mee6.utils import Logger, chunk, get, json
+from mee6.announcements import queue as announcement_queue
+from mee6.discord import (send_webhook_message, send_message, queue_message,
+                          send_bodies)
+from mee6.exceptions import APIException
 from mee6.utils.redis import GroupKeys, PrefixedRedis
 from mee6.command import Command
 
@@ -69,6 +73,10 @@ class Plugin(Logger):
         for command in self.commands:
             command.execute(guild, message)
 
+    def on_enable(self, guild): pass
+
+    def on_disable(self, guild): pass
+
     def on_guild_join(self, guild): pass
 
     def on_guild_leave(self, guild): pass
@@ -92,19 +100,42 @@ class Plugin(Logger):
 
     def get_guilds(self):
         guilds = self.db.smembers('plugin.{}.guilds'.format(self.name))
-        guilds = [guild for guild in guilds if self.db.sismember('servers', guild)]
 
-        return [self._make_guild({'id': id}) for id in guilds]
+        enabled = []
+        for guilds_chunk in chunk(guilds, 1000):
+            pipe = self.db.pipeline(transaction=False)
+            for guild_id in guilds_chunk:
+                pipe.sismember('servers', guild_id)
+            is_members = pipe.execute()
+            enabled += [g for g, m in zip(guilds_chunk, is_members) if m]
+
+        return [self._make_guild({'id': id}) for id in enabled]
 
     def enable(self, guild):
+        """ Enables the plugin and indexes the guild's config, the reverse
+        indexes only hold enabled guilds """
         guild_id = get(guild, 'id', guild)
-        self.db.sadd('plugins:{}'.format(guild_id), self.name)
-        self.db.sadd('plugin.{}.guilds'.format(self.name), guild_id)
+        indexes = self.get_config_indexes(guild_id, self.get_config(guild_id))
+
+        pipe = self.db.pipeline()
+        pipe.sadd('plugins:{}'.format(guild_id), self.name)
+        pipe.sadd('plugin.{}.guilds'.format(self.name), guild_id)
+        for key in indexes:
+            pipe.sadd(key, guild_id)
+        pipe.execute()
+        self.config_db.publish(['enable', str(guild_id)])
 
     def disable(self, guild):
         guild_id = get(guild, 'id', guild)
-        self.db.srem('plugins:{}'.format(guild_id), self.name)
-        self.db.srem('plugin.{}.guilds'.format(self.name), guild_id)
+        indexes = self.get_config_indexes(guild_id, self.get_config(guild_id))
+
+        pipe = self.db.pipeline()
+        pipe.srem('plugins:{}'.format(guild_id), self.name)
+        pipe.srem('plugin.{}.guilds'.format(self.name), guild_id)
+        for key in indexes:
+            pipe.srem(key, guild_id)
+        pipe.execute()
+        self.config_db.publish(['disable', str(guild_id)])
 
     def check_guild(self, guild):
         guild_id = get(guild, 'id', guild)
@@ -115,6 +146,72 @@ class Plugin(Logger):
         plugins = self.db.smembers('plugins:{}'.format(guild_id))
         return self.name in plugins
 
+    def send_announcement(self, guild, channel_id, content, embeds=None,
+                          webhook_id=None, key=None):
+        """ Sends an announcement, through the durable queue if enabled.
+        `key` identifies the announcement, it isn't queued twice. Returns
+        whether it was sent or queued. The plugin is disabled for the guild if
+        Discord answers 403 or 404. """
+        guild_id = get(guild, 'id', guild)
+        embeds = embeds or []
+
+        if announcement_queue.ENABLED:
+            return announcement_queue.put(self, guild_id, channel_id, content,
+                                          embeds=embeds, webhook_id=webhook_id,
+                                          key=key)
+
+        try:
+            if webhook_id:
+                send_webhook_message(webhook_id, channel_id, content,
+                                     embeds=embeds)
+            elif len(embeds) > 1:
+                send_message(channel_id, content, embeds=embeds)
+            else:
+                embed = embeds[0] if embeds else None
+                queue_message(channel_id, content, embed=embed).get()
+        except APIException as e:
+            self.handle_announcement_error(guild_id, e)
+            return False
+
+        return True
+
+    def send_announcements(self, announcements):
+        """ Sends announcements rendered from MessageTemplates, in bulk.
+        `announcements` are (guild, channel_id, content, key, template)
+        tuples, see send_announcement. Returns whether each was sent or
+        queued. """
+        if announcement_queue.ENABLED:
+            return [announcement_queue.put(self, get(guild, 'id', guild),
+                                           channel_id, content, key=key,
+                                           template=template)
+                    for guild, channel_id, content, key, template in announcements]
+
+        messages = [(channel_id, template.render(content))
+                    for _, channel_id, content, _, template in announcements]
+        results = send_bodies(messages)
+
+        sent = []
+        for announcement, result in zip(announcements, results):
+            if isinstance(result, APIException):
+                self.handle_announcement_error(get(announcement[0], 'id',
+                                                   announcement[0]), result)
+            elif isinstance(result, Exception):
+                self.log('Failed to announce to {}: {}'.format(announcement[1],
+                                                               result))
+            sent.append(not isinstance(result, Exception))
+
+        return sent
+
+    def handle_announcement_error(self, guild_id, e):
+        self.log('Got Api exception {} {} {}'.format(e.status_code,
+                                                     e.error_code,
+                                                     e.payload))
+
+        # Unauthorized or channel not found
+        if e.status_code in (403, 404):
+            self.log('Disabling plugin for {}'.format(guild_id))
+            self.disable(guild_id)
+
     def _make_guild(self, guild_payload):
         guild = Guild(**guild_payload)
         guild.db = self.db
@@ -136,6 +233,11 @@ class Plugin(Logger):
 
             self.on_config_change(guild, config)
 
+        if op in ('enable', 'disable'):
+            guild = self._make_guild({'id': int(payload[1])})
+            listener = self.on_enable if op == 'enable' else self.on_disable
+            listener(guild)
+
     def get_config(self, guild):
         guild_id = get(guild, 'id', guild)
 
@@ -149,31 +251,84 @@ class Plugin(Logger):
 
         return config
 
+    def get_configs(self, guilds_ids):
+        """ Yields the (guild_id, config) of many guilds, fetched in
+        pipelined batches """
+        for guilds_chunk in chunk(guilds_ids, 1000):
+            pipe = self.db.pipeline(transaction=False)
+            for guild_id in guilds_chunk:
+                pipe.get('plugin.{}.config.{}'.format(self.id, guild_id))
+
+            for guild_id, raw_config in zip(guilds_chunk, pipe.execute()):
+                if raw_config:
+                    config = json.loads(raw_config)
+                else:
+                    config = self.get_default_config(guild_id)
+                yield guild_id, config
+
     def get_default_config(self, guild_id):
         default_config = {}
         return default_config
 
     def patch_config(self, guild, new_config):
+        """ Applies the keys of `new_config` to the guild's config. The config
+        and the reverse indexes of get_config_indexes are updated in one
+        transaction, retried if another patch of the guild got in between;
+        only the index keys that changed are written. """
         guild_id = get(guild, 'id', guild)
+        config_key = 'config.{}'.format(guild_id)
+        redis_key = 'plugin.{}.{}'.format(self.id, config_key)
 
-        old_config = self.get_config(guild_id)
-
-        # pre-hook
-        self.before_config_patch(guild_id, old_config, new_config)
-
-        config = {k: new_config.get(k, old_config[k]) for k in old_config.keys()}
-
-        # validation
-        config = self.validate_config(guild_id, config)
-
-        self.config_db.set('config.{}'.format(guild_id),
-                           json.dumps(config))
+        with self.db.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(redis_key)
+                    raw_config = pipe.get(redis_key)
+                    if raw_config:
+                        old_config = json.loads(raw_config)
+                    else:
+                        old_config = self.get_default_config(guild_id)
+
+                    # pre-hook
+                    self.before_config_patch(guild_id, old_config, new_config)
+
+                    config = {k: new_config.get(k, old_config[k]) for k in old_config.keys()}
+
+                    # validation
+                    config = self.validate_config(guild_id, config)
+
+                    old_indexes = self.get_config_indexes(guild_id, old_config)
+                    new_indexes = self.get_config_indexes(guild_id, config)
+
+                    raw_config = json.dumps(config)
+                    pipe.multi()
+                    pipe.set(redis_key, raw_config)
+                    for key in old_indexes - new_indexes:
+                        pipe.srem(key, guild_id)
+                    for key in new_indexes - old_indexes:
+                        pipe.sadd(key, guild_id)
+                    pipe.execute()
+                    break
+                except redis.WatchError:
+                    continue
+
+        self.config_db.publish(['s', config_key, raw_config])
 
         # post-hook
         self.after_config_patch(guild_id, config)
 
         return config
 
+    def get_config_indexes(self, guild_id, config):
+        """ Returns the keys of the sets indexing the guild by what its
+        `config` follows, like plugin.reddit.subreddit.<name>.guilds """
+        return set()
+
+    def get_index_patterns(self):
+        """ Returns the SCAN patterns matching the sets of
+        get_config_indexes """
+        return []
+
     def before_config_patch(self, guild_id, old_config, new_config): pass
     def after_config_patch(self, guild_id, config): pass
     def validate_config(self, guild_id, config): return config
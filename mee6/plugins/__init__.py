@@ -4,4 +4,4 @@ from mee6.plugins.timers import Timers
 #from mee6.plugins.dummy import Dummy
 from mee6.plugins.music import Music
 from mee6.plugins.utils import Utils
-from mee6.plugins.debug import Debug
+#from mee6.plugins.debug import Debug
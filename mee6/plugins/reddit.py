@@ -1,15 +1,18 @@
 import gevent
-import gevent.queue
+import math
+import redis
 import requests
 import os
 import re
+import socket
+import uuid
+import zlib
 
-from collections import defaultdict
-from itertools import groupby
+from collections import defaultdict, deque
+from gevent.pool import Pool
 from mee6 import Plugin
-from mee6.utils import chunk, int2base
-from mee6.exceptions import APIException
-from mee6.discord import send_message, send_webhook_message
+from mee6.utils import Logger, chunk, int2base, json, statsd
+from mee6.utils.index import ReverseIndex
 from mee6.types import Guild
 from time import time
 
@@ -18,17 +21,131 @@ MESSAGE_FORMAT = "`New post from /r/{subreddit}`\n\n"\
                  "**Link** {link}\n"\
                  "**Thread** {thread} \n\n"
 
+# Subreddits are spread on this many shards, it must be the same for the
+# poller and every announcer
+SHARDS = int(os.getenv('REDDIT_SHARDS', 64))
+
+# Renews the lease ARGV[1] holds on KEYS[1] for ARGV[2] seconds
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Releases the lease ARGV[1] holds on KEYS[1]
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS are (shard list, processing list) pairs. Moves the oldest batch of
+# the first non empty shard list to its processing list, returns the index
+# of the pair and the batch.
+POP_SCRIPT = """
+for i = 1, #KEYS, 2 do
+    local data = redis.call('RPOPLPUSH', KEYS[i], KEYS[i + 1])
+    if data then
+        return {(i + 1) / 2, data}
+    end
+end
+return nil
+"""
+
+# Replaces the batch ARGV[1] of the processing list KEYS[1] by ARGV[2], queued
+# again on the shard list KEYS[2]
+REQUEUE_SCRIPT = """
+redis.call('LREM', KEYS[1], 1, ARGV[1])
+redis.call('LPUSH', KEYS[2], ARGV[2])
+"""
+
+# Moves the batch ARGV[1] from the processing list KEYS[1] to the failed list
+# KEYS[2], which keeps the ARGV[2] latest failures
+FAIL_SCRIPT = """
+redis.call('LREM', KEYS[1], 1, ARGV[1])
+redis.call('LPUSH', KEYS[2], ARGV[1])
+redis.call('LTRIM', KEYS[2], 0, ARGV[2] - 1)
+"""
+
+# Queues back, in order, the batches left in the processing list KEYS[1]
+RECOVER_SCRIPT = """
+local count = 0
+local data = redis.call('LPOP', KEYS[1])
+while data do
+    redis.call('RPUSH', KEYS[2], data)
+    count = count + 1
+    data = redis.call('LPOP', KEYS[1])
+end
+return count
+"""
+
+
+def get_shard(subreddit):
+    return zlib.crc32(subreddit.lower().encode('utf-8')) % SHARDS
+
+
+def shard_key(shard):
+    return 'plugin.reddit.shard.{}'.format(shard)
+
 class Reddit(Plugin):
 
     id = "reddit"
     name = "Reddit"
     description = "Get posts from your favourite subreddits directly to your Discord server"
 
-    sender_queue = gevent.queue.Queue()
-    sender_worker_instance = None
-
     last_post_id = None
 
+    # Ids asked per /api/info request
+    WINDOW_SIZE = 100
+    # Upper bound of the windows fetched concurrently per tick
+    MAX_WINDOWS = int(os.getenv('REDDIT_MAX_WINDOWS', 8))
+    # Seconds between two lookups of the newest post on /r/all
+    HEAD_INTERVAL = 10
+
+    windows = 1
+    head_post_id = None
+    head_checked_at = 0
+
+    # Seconds between two rebuilds of the followers index, which drop the
+    # guilds the bot left
+    INDEX_REFRESH = int(os.getenv('REDDIT_INDEX_REFRESH', 600))
+
+    # Subreddits to the {guild_id: announcement_channel} following them
+    followers = None
+    index_built_at = 0
+    # Changes received while the index is rebuilt
+    index_updates = None
+
+    # Ticks during which the followed posts are gathered before being
+    # announced, to send fewer and fuller messages
+    AGGREGATION_TICKS = int(os.getenv('REDDIT_AGGREGATION_TICKS', 1))
+
+    pending_posts = None
+    pending_ticks = 0
+
+    # Cursor checkpointed so that a restart resumes where we stopped
+    CURSOR_KEY = 'last_post_id'
+    # A restart catches up at most this many posts
+    MAX_CATCH_UP = int(os.getenv('REDDIT_MAX_CATCH_UP', 500000))
+    # Windows fetched concurrently per tick while catching up
+    CATCH_UP_WINDOWS = int(os.getenv('REDDIT_CATCH_UP_WINDOWS', 16))
+    ANNOUNCE_CONCURRENCY = int(os.getenv('REDDIT_ANNOUNCE_CONCURRENCY', 50))
+
+    # Cursors of the ticks, in order, with the greenlets announcing them
+    announcing_ticks = None
+
+    announce_pool = Pool(ANNOUNCE_CONCURRENCY)
+
+    # If set, the poller publishes the posts to the announcers of their
+    # shard instead of announcing them (`mee6.cli reddit-poller`)
+    sharded = False
+    # Announcer side, the shards whose subreddits are indexed (all if None)
+    shards = None
+    # Batches kept per shard while no announcer pops them
+    MAX_SHARD_BACKLOG = 10000
+
     access_token = None
     access_token_expires_at = None
     user_agent = 'linux:mee6:v0.0.1 (by /u/cookkkie)'
@@ -40,15 +157,100 @@ class Reddit(Plugin):
                           'announcement_channel': guild_id}
         return default_config
 
-    def before_config_patch(self, guild_id, old_config, new_config):
-        for subreddit in old_config['subreddits']:
-            key = 'plugin.{}.subreddit.{}.guilds'.format(self.id, subreddit)
-            self.db.srem(key, guild_id)
-
-    def after_config_patch(self, guild_id, config):
-        for subreddit in config['subreddits']:
-            key = 'plugin.{}.subreddit.{}.guilds'.format(self.id, subreddit)
-            self.db.sadd(key, guild_id)
+    def get_config_indexes(self, guild_id, config):
+        return {'plugin.{}.subreddit.{}.guilds'.format(self.id, subreddit)
+                for subreddit in config['subreddits']}
+
+    def get_index_patterns(self):
+        return ['plugin.{}.subreddit.*.guilds'.format(self.id)]
+
+    def build_index(self):
+        """ Indexes the subreddits the enabled guilds follow """
+        self.index_updates = []
+
+        followers = ReverseIndex()
+        guilds_ids = [guild.id for guild in self.get_guilds()]
+        for guild_id, config in self.get_configs(guilds_ids):
+            self.index_guild(followers, guild_id, config)
+
+        for guild_id, config in self.index_updates:
+            self.index_guild(followers, guild_id, config)
+
+        self.followers = followers
+        self.index_updates = None
+        self.index_built_at = time()
+
+        self.log('Indexed {} subreddits followed by {} guilds'.format(
+            len(followers), len(guilds_ids)))
+        statsd.gauge('reddit.followed_subreddits', len(followers))
+
+    def index_shards(self, shards):
+        """ Adds the subreddits of `shards` to the index. Their followers are
+        read from the subreddits' guilds sets instead of every config. """
+        self.index_updates = []
+
+        guilds_ids = set()
+        pattern = 'plugin.{}.subreddit.*.guilds'.format(self.id)
+        for key in self.db.scan_iter(pattern, count=1000):
+            if get_shard(key.split('.')[3]) in shards:
+                guilds_ids.update(self.db.smembers(key))
+
+        guilds_key = 'plugin.{}.guilds'.format(self.name)
+        enabled = []
+        for guilds_chunk in chunk(list(guilds_ids), 1000):
+            pipe = self.db.pipeline(transaction=False)
+            for guild_id in guilds_chunk:
+                pipe.sismember(guilds_key, guild_id)
+                pipe.sismember('servers', guild_id)
+            flags = pipe.execute()
+            enabled += [guild_id for guild_id, is_enabled, is_member
+                        in zip(guilds_chunk, flags[::2], flags[1::2])
+                        if is_enabled and is_member]
+
+        for guild_id, config in self.get_configs(enabled):
+            self.index_guild(self.followers, guild_id, config)
+
+        for guild_id, config in self.index_updates:
+            self.index_guild(self.followers, guild_id, config)
+        self.index_updates = None
+
+        self.log('Indexed {} shards followed by {} guilds'.format(
+            len(shards), len(enabled)))
+        statsd.gauge('reddit.followed_subreddits', len(self.followers))
+
+    def unindex_shards(self, shards):
+        for subreddit in list(self.followers):
+            if get_shard(subreddit) in shards:
+                self.followers.remove_key(subreddit)
+
+    def index_guild(self, followers, guild_id, config):
+        """ Indexes the subreddits of the guild, removes it if `config` is
+        None """
+        if config is None:
+            followers.remove(guild_id)
+        else:
+            subreddits = [subreddit for subreddit in config['subreddits']
+                          if self.shards is None or
+                          get_shard(subreddit) in self.shards]
+            followers.set(guild_id, subreddits,
+                          config.get('announcement_channel'))
+
+    def update_index(self, guild_id, config):
+        if self.followers is not None:
+            self.index_guild(self.followers, guild_id, config)
+
+        if self.index_updates is not None:
+            self.index_updates.append((guild_id, config))
+
+    def on_config_change(self, guild, config):
+        if self.check_guild(guild):
+            self.update_index(guild.id, config)
+
+    def on_enable(self, guild):
+        self.update_index(guild.id, guild.config)
+
+    def on_disable(self, guild):
+        self.update_index(guild.id, None)
 
     def validate_config(self, guild_id, config):
         valid_subreddits = []
@@ -103,13 +305,12 @@ class Reddit(Plugin):
 
         return r
 
-    def get_new_posts(self, last_post_id):
-        last_post_id = int(last_post_id, base=36)
-        forward_ids = (last_post_id + 1 + i for i in range(0, 100))
-        forward_ids = map(lambda id: 't3_' + int2base(id, 36), forward_ids)
+    def get_window(self, start):
+        """ Posts among the WINDOW_SIZE ids from `start` """
+        ids = ('t3_' + int2base(start + i, 36) for i in range(self.WINDOW_SIZE))
 
         url = "https://oauth.reddit.com/api/info"
-        params = {'id': ','.join(forward_ids),
+        params = {'id': ','.join(ids),
                   'raw_json': 1}
         r = self.make_request(url, params=params)
         result = r.json()
@@ -120,7 +321,63 @@ class Reddit(Plugin):
         # Only get subreddit posts
         posts = filter(lambda p: p.get('subreddit'), posts)
 
-        return list(posts)
+        return sorted(posts, key=lambda p: int(p['id'], base=36))
+
+    def get_new_posts(self, last_post_id, windows=1):
+        """ Fetches `windows` consecutive windows of ids after last_post_id
+        concurrently, returns the posts of each window """
+        start = int(last_post_id, base=36) + 1
+        jobs = [gevent.spawn(self.get_window, start + i * self.WINDOW_SIZE)
+                for i in range(windows)]
+        gevent.joinall(jobs, raise_error=True)
+        return [job.value for job in jobs]
+
+    def update_head(self):
+        if time() - self.head_checked_at < self.HEAD_INTERVAL:
+            return
+
+        self.head_post_id = self.get_last_post_id()
+        self.head_checked_at = time()
+
+    def get_lag(self):
+        """ Ids between the cursor and the newest post on /r/all """
+        if self.head_post_id is None:
+            return None
+        lag = int(self.head_post_id, base=36) - int(self.last_post_id, base=36)
+        return max(0, lag)
+
+    def advance(self, windows_posts):
+        """ Moves the cursor past the fetched windows, returns the posts """
+        posts = [post for window in windows_posts for post in window]
+        if posts:
+            self.last_post_id = posts[-1]['id']
+            return posts
+
+        # Nothing in any window although newer posts exist: skip the gap
+        span = len(windows_posts) * self.WINDOW_SIZE
+        lag = self.get_lag()
+        if lag is not None and lag > span:
+            cursor = int(self.last_post_id, base=36) + span
+            self.last_post_id = int2base(cursor, 36)
+            self.log('Skipped {} empty ids'.format(span))
+
+        return posts
+
+    def adapt_windows(self, windows_posts):
+        """ Doubles the windows while we're behind, the last window being
+        non-empty means there might be more posts after it. Shrinks them one
+        at a time once caught up. """
+        lag = self.get_lag()
+        span = self.windows * self.WINDOW_SIZE
+
+        if windows_posts[-1] or (lag is not None and lag > span):
+            self.windows = min(self.MAX_WINDOWS, self.windows * 2)
+        elif self.windows > 1:
+            self.windows -= 1
+
+        statsd.gauge('reddit.windows', self.windows)
+        if lag is not None:
+            statsd.gauge('reddit.lag', lag)
 
     def get_last_post_id(self):
         url = 'https://oauth.reddit.com/r/all/new'
@@ -131,44 +388,208 @@ class Reddit(Plugin):
     @Plugin.loop(sleep_time=1)
     def loop(self):
         if not self.last_post_id:
-            self.last_post_id = self.get_last_post_id()
-            self.log('Last subreddit post ID ' + self.last_post_id)
+            self.resume()
+
+        if time() - self.index_built_at > self.INDEX_REFRESH:
+            self.build_index()
+
+        self.update_head()
+
+        lag = self.get_lag()
+        if lag is not None and lag > self.MAX_WINDOWS * self.WINDOW_SIZE:
+            self.catch_up()
+
+        windows_posts = self.tick(self.windows)
+        self.adapt_windows(windows_posts)
 
-        posts = self.get_new_posts(self.last_post_id)
+    def resume(self):
+        """ Starts from the checkpointed cursor, at most MAX_CATCH_UP ids
+        behind the newest post """
+        self.head_post_id = self.get_last_post_id()
+        self.head_checked_at = time()
 
-        self.log('Got {} new posts'.format(len(posts)))
+        checkpoint = self.plugin_db.get(self.CURSOR_KEY)
+        if checkpoint is None:
+            self.last_post_id = self.head_post_id
+            self.log('Last subreddit post ID ' + self.last_post_id)
+            return
+
+        self.last_post_id = checkpoint
+        lag = self.get_lag()
+        if lag > self.MAX_CATCH_UP:
+            cursor = int(self.head_post_id, base=36) - self.MAX_CATCH_UP
+            self.last_post_id = int2base(cursor, 36)
+            self.log('Skipping {} posts older than the catch-up limit'.format(
+                lag - self.MAX_CATCH_UP))
+
+        self.log('Resuming from post ID {}, {} behind'.format(self.last_post_id,
+                                                             self.get_lag()))
+
+    def checkpoint(self):
+        """ Saves the cursor of the latest tick whose announcements, and
+        the ones of the ticks before it, are done """
+        cursor = None
+        while self.announcing_ticks:
+            tick_cursor, greenlets = self.announcing_ticks[0]
+            if not all(greenlet.ready() for greenlet in greenlets):
+                break
+            cursor = tick_cursor
+            self.announcing_ticks.popleft()
+
+        if cursor is not None:
+            self.plugin_db.set(self.CURSOR_KEY, cursor)
+
+    def catch_up(self):
+        """ Drains the backlog with CATCH_UP_WINDOWS windows per tick, the
+        announcements of a tick being sent before fetching the next one """
+        start = int(self.last_post_id, base=36)
+        total = self.get_lag()
+        started_at = reported_at = time()
+        self.log('Catching up {} posts'.format(total))
+
+        while True:
+            self.update_head()
+            lag = self.get_lag()
+            statsd.gauge('reddit.catch_up_remaining', lag)
+            if lag <= self.MAX_WINDOWS * self.WINDOW_SIZE:
+                break
+
+            self.tick(self.CATCH_UP_WINDOWS)
+            self.announce_pool.join()
+
+            if time() - reported_at > 10:
+                done = int(self.last_post_id, base=36) - start
+                rate = done / (time() - started_at)
+                eta = lag / rate if rate > 0 else float('inf')
+                self.log('Catching up: {}/{} posts ({:.0%}), {:.0f} posts/s,'
+                         ' ~{:.0f}s left'.format(done, total,
+                                                 done / max(total, 1), rate,
+                                                 eta))
+                reported_at = time()
+
+        self.windows = self.MAX_WINDOWS
+        self.log('Caught up in {:.0f}s'.format(time() - started_at))
+
+    def tick(self, windows):
+        """ Fetches `windows` windows of new posts and announces the followed
+        ones. Returns the posts of each window. """
+        windows_posts = self.get_new_posts(self.last_post_id, windows)
+        posts = self.advance(windows_posts)
 
         if len(posts) > 0:
-            last_post = posts[-1]
-            self.last_post_id = last_post['id']
+            delay = time() - posts[-1].get('created_utc', time())
+            statsd.timing('reddit.post_delay', delay * 1000)
+
+        # Most posts are from subreddits nobody follows
+        new_posts_count = len(posts)
+        posts = [p for p in posts if p['subreddit'].lower() in self.followers]
+
+        self.log('Got {} new posts ({} followed) in {} windows'.format(
+            new_posts_count, len(posts), len(windows_posts)))
+        statsd.increment('reddit.followed_posts', len(posts))
+
+        batches = self.aggregate(posts)
+        greenlets = []
+        if self.sharded:
+            self.publish(batches)
+        else:
+            for subreddit, subreddit_posts in batches.items():
+                greenlets.append(self.announce_pool.spawn(self.announce,
+                                                          subreddit,
+                                                          subreddit_posts))
+
+        if self.announcing_ticks is None:
+            self.announcing_ticks = deque()
+
+        # Gathered posts would be lost if we restarted from there
+        if self.pending_ticks == 0:
+            self.announcing_ticks.append((self.last_post_id, greenlets))
+        self.checkpoint()
+
+        return windows_posts
+
+    def publish(self, batches):
+        """ Pushes the batches of posts to the list of their shard """
+        if not batches:
+            return
+
+        pipe = self.db.pipeline(transaction=False)
+        for subreddit, subreddit_posts in batches.items():
+            fields = ('id', 'subreddit', 'title', 'author', 'url', 'permalink')
+            posts = [{f: post[f] for f in fields} for post in subreddit_posts]
+            data = json.dumps({'subreddit': subreddit, 'posts': posts})
+
+            key = shard_key(get_shard(subreddit))
+            pipe.lpush(key, data)
+            pipe.ltrim(key, 0, self.MAX_SHARD_BACKLOG - 1)
+        lengths = pipe.execute()[::2]
+
+        statsd.increment('reddit.published_batches', len(batches))
+
+        trimmed = sum(max(0, length - self.MAX_SHARD_BACKLOG)
+                      for length in lengths)
+        if trimmed:
+            self.log('Dropped the {} oldest batches of lagging shards'.format(
+                trimmed))
+            statsd.increment('reddit.trimmed_batches', trimmed)
+
+    def aggregate(self, posts):
+        """ Gathers the posts by subreddit, in id order. Returns them once
+        AGGREGATION_TICKS ticks are gathered, an empty dict before. """
+        if self.pending_posts is None:
+            self.pending_posts = defaultdict(list)
+
+        for post in posts:
+            self.pending_posts[post['subreddit'].lower()].append(post)
+
+        self.pending_ticks += 1
+        if self.pending_ticks < self.AGGREGATION_TICKS:
+            return {}
+
+        batches = self.pending_posts
+        self.pending_posts = defaultdict(list)
+        self.pending_ticks = 0
 
-        grouped_posts = groupby(posts, lambda p: p['subreddit'])
-        for subreddit, subreddit_posts in grouped_posts:
-            gevent.spawn(self.announce, subreddit, list(subreddit_posts))
+        if batches:
+            statsd.histogram('reddit.posts_per_batch',
+                             sum(map(len, batches.values())) / len(batches))
+        return batches
 
-    def announce(self, subreddit, subreddit_posts):
+    def announce(self, subreddit, subreddit_posts, guilds_ids=None):
+        """ Announces the posts to the guilds following the subreddit, or to
+        the ones of `guilds_ids` only. Returns the ids of the guilds it
+        failed for. """
         subreddit = subreddit.lower()
-        key = 'plugin.{}.subreddit.{}.guilds'.format(self.id, subreddit)
-        guilds_ids = self.db.smembers(key)
-        for guild_id in guilds_ids:
-            if not self.check_guild(guild_id): continue
+        messages = self.pack_posts(subreddit_posts)
 
+        followers = list(self.followers.get(subreddit).items())
+        if guilds_ids is not None:
+            guilds_ids = set(guilds_ids)
+            followers = [follower for follower in followers
+                         if follower[0] in guilds_ids]
+
+        failed = []
+        for guild_id, announcement_channel in followers:
             self.log('Announcing /r/{} posts to {}'.format(subreddit,
                                                                 guild_id))
 
             guild = Guild(id=guild_id, plugin=self)
             try:
-                self.announce_posts(guild, subreddit_posts)
-            except APIException as e:
-                self.log('Got Api exception {} {}'.format(e.status_code, e.payload))
+                sent = self.announce_posts(guild, messages,
+                                           announcement_channel)
+            except Exception as e:
+                self.log('Failed to announce /r/{} posts to {}: {}'.format(
+                    subreddit, guild_id, e))
+                sent = False
+
+            if not sent:
+                failed.append(guild_id)
 
-                # Disabling the plugin in case of an error
-                # Unauthorized or channel not found
-                if e.status_code in (403, 404):
-                    self.log('Disabling plugin for {}'.format(guild.id))
-                    self.disable(guild)
+        return failed
 
-    def announce_posts(self, guild, posts):
+    def pack_posts(self, posts):
+        """ Returns the messages of at most 2000 characters announcing the
+        posts, with the id of their last post """
         messages = []
         for post in posts:
             message = MESSAGE_FORMAT.format(subreddit=post['subreddit'],
@@ -179,17 +600,242 @@ class Reddit(Plugin):
             message = message.replace('@everyone', '@ everyone')
 
             if len(messages) == 0:
-                messages.append(message)
+                messages.append((message, post['id']))
             else:
-                if len(messages[-1] + message) > 2000:
-                    messages.append(message)
+                if len(messages[-1][0] + message) > 2000:
+                    messages.append((message, post['id']))
                 else:
-                    messages[-1] += message
+                    messages[-1] = (messages[-1][0] + message, post['id'])
 
-        announcement_channel = guild.config.get('announcement_channel')
+        return messages
 
+    def announce_posts(self, guild, messages, announcement_channel):
         webhook_id = 'reddit_announcement:{}'.format(announcement_channel)
         channel_id = announcement_channel or guild.id
-        for message in messages:
-            send_webhook_message(webhook_id, channel_id, message)
-
+        for message, post_id in messages:
+            key = 'reddit:{}:{}'.format(guild.id, post_id)
+            if not self.send_announcement(guild, channel_id, message,
+                                          webhook_id=webhook_id, key=key):
+                return False
+        return True
+
+
+class ShardAnnouncer(Logger):
+    """ Announces the posts the poller published for the shards it owns.
+
+    Announcers share the SHARDS evenly: each one holds a lease on its shards,
+    renewed every LEASE_TTL / 3 seconds, and takes free shards or releases
+    some when announcers join or leave. Only the subreddits of its shards are
+    indexed, a shard is consumed once they are.
+
+    Popped batches stay in the processing list of their shard until they
+    are announced. The next owner of the shard queues them back, a crash or
+    a handoff announces them again rather than losing them. The guilds a
+    batch couldn't be sent to are retried, MAX_ATTEMPTS times at most.
+    """
+
+    LEASE_TTL = 15
+    ANNOUNCERS = 'plugin.reddit.announcers'
+    # Batches which failed MAX_ATTEMPTS times, the MAX_FAILED latest are kept
+    FAILED = 'plugin.reddit.failed'
+    MAX_ATTEMPTS = 5
+    MAX_FAILED = 1000
+    # Seconds before the first retry, doubled on each attempt
+    RETRY_DELAY = 5
+    # Seconds between two pops while every shard is empty
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, plugin=None):
+        self.plugin = plugin or Reddit()
+        self.plugin.shards = set()
+        self.db = self.plugin.db
+        self.id = '{}:{}:{}'.format(socket.gethostname(), os.getpid(),
+                                    uuid.uuid4().hex[:8])
+
+        # Shards leased, and the ones indexed which consume pops
+        self.shards = set()
+        self.ready = set()
+        self.pops = 0
+
+        self._renew = self.db.register_script(RENEW_SCRIPT)
+        self._release = self.db.register_script(RELEASE_SCRIPT)
+        self._pop = self.db.register_script(POP_SCRIPT)
+        self._recover = self.db.register_script(RECOVER_SCRIPT)
+        self._requeue = self.db.register_script(REQUEUE_SCRIPT)
+        self._fail = self.db.register_script(FAIL_SCRIPT)
+
+    def lease_key(self, shard):
+        return shard_key(shard) + '.lease'
+
+    def processing_key(self, shard):
+        return shard_key(shard) + '.processing'
+
+    def get_announcers_count(self):
+        """ Heartbeats the announcer, returns how many are alive """
+        now = time()
+        pipe = self.db.pipeline(transaction=False)
+        pipe.execute_command('ZADD', self.ANNOUNCERS, now + self.LEASE_TTL,
+                             self.id)
+        pipe.zremrangebyscore(self.ANNOUNCERS, '-inf', now)
+        pipe.zcard(self.ANNOUNCERS)
+        return pipe.execute()[-1]
+
+    def balance(self):
+        """ Renews the leases, then takes or releases shards to own its
+        share of them. Returns whether the owned shards changed. """
+        shards = set(self.shards)
+        target = int(math.ceil(SHARDS / self.get_announcers_count()))
+
+        for shard in list(shards):
+            if not self._renew(keys=[self.lease_key(shard)],
+                               args=[self.id, self.LEASE_TTL]):
+                self.log('Lost the lease of shard {}'.format(shard))
+                shards.discard(shard)
+
+        while len(shards) > target:
+            shard = shards.pop()
+            self._release(keys=[self.lease_key(shard)], args=[self.id])
+
+        for shard in range(SHARDS):
+            if len(shards) >= target:
+                break
+            if shard in shards:
+                continue
+            if self.db.set(self.lease_key(shard), self.id, ex=self.LEASE_TTL,
+                           nx=True):
+                shards.add(shard)
+
+        if shards == self.shards:
+            return False
+
+        self.log('Owning {} shards'.format(len(shards)))
+        self.shards = shards
+        return True
+
+    def update_shards(self, rebuild=False):
+        """ Stops consuming the shards it lost, indexes the new ones and
+        queues back what their previous owner was announcing before
+        consuming them """
+        added = self.shards - self.ready
+        removed = self.ready - self.shards
+        self.ready -= removed
+        self.plugin.shards = set(self.shards)
+
+        if rebuild or self.plugin.followers is None:
+            self.plugin.build_index()
+        else:
+            if removed:
+                self.plugin.unindex_shards(removed)
+            if added:
+                self.plugin.index_shards(added)
+
+        for shard in added:
+            recovered = self._recover(keys=[self.processing_key(shard),
+                                            shard_key(shard)])
+            if recovered:
+                self.log('Recovered {} batches of shard {}'.format(recovered,
+                                                                   shard))
+        self.ready |= added
+
+    def maintain(self):
+        while True:
+            try:
+                changed = self.balance()
+                stale = (time() - self.plugin.index_built_at >
+                         self.plugin.INDEX_REFRESH)
+                if changed or stale:
+                    self.update_shards(rebuild=stale)
+
+                statsd.gauge('reddit.owned_shards', len(self.ready),
+                             tags=['announcer:' + self.id])
+                for shard in self.ready:
+                    statsd.gauge('reddit.shard_backlog',
+                                 self.db.llen(shard_key(shard)),
+                                 tags=['shard:{}'.format(shard)])
+            except redis.RedisError as e:
+                self.log('Redis error {}'.format(e))
+
+            gevent.sleep(self.LEASE_TTL / 3.)
+
+    def pop(self):
+        """ Returns the shard and the batch popped from the ready shards,
+        starting from a different one each time, (None, None) if they are
+        all empty """
+        shards = sorted(self.ready)
+        if not shards:
+            return None, None
+
+        self.pops += 1
+        start = self.pops % len(shards)
+        shards = shards[start:] + shards[:start]
+
+        keys = []
+        for shard in shards:
+            keys += [shard_key(shard), self.processing_key(shard)]
+
+        popped = self._pop(keys=keys)
+        if popped is None:
+            return None, None
+        return shards[int(popped[0]) - 1], popped[1]
+
+    def announce(self, shard, data):
+        """ Announces a batch and acks it. The guilds it failed for are
+        retried with an exponential backoff, the batch staying in the
+        processing list meanwhile, until MAX_ATTEMPTS. """
+        try:
+            batch = json.loads(data)
+            failed = self.plugin.announce(batch['subreddit'], batch['posts'],
+                                          batch.get('guilds'))
+        except Exception as e:
+            self.log('Failed to announce batch of shard {}: {}'.format(shard,
+                                                                       e))
+            self.fail(shard, data)
+            return
+
+        if not failed:
+            self.db.execute_command('LREM', self.processing_key(shard), 1,
+                                    data)
+            return
+
+        attempts = batch.get('attempts', 0) + 1
+        if attempts >= self.MAX_ATTEMPTS:
+            self.fail(shard, data)
+            return
+
+        retry = dict(batch, guilds=failed, attempts=attempts)
+        delay = self.RETRY_DELAY * 2 ** (attempts - 1)
+        gevent.spawn_later(delay, self._requeue,
+                           keys=[self.processing_key(shard), shard_key(shard)],
+                           args=[data, json.dumps(retry)])
+        statsd.increment('reddit.retried_batches')
+
+    def fail(self, shard, data):
+        self._fail(keys=[self.processing_key(shard), self.FAILED],
+                   args=[data, self.MAX_FAILED])
+        statsd.increment('reddit.failed_batches')
+
+    def consume(self):
+        while True:
+            try:
+                shard, data = self.pop()
+            except redis.RedisError as e:
+                self.log('Redis error {}'.format(e))
+                gevent.sleep(1)
+                continue
+
+            if data is None:
+                gevent.sleep(self.POLL_INTERVAL)
+                continue
+
+            self.plugin.announce_pool.spawn(self.announce, shard, data)
+
+    def run(self):
+        self.log('Announcer {} joining'.format(self.id))
+        greenlets = [gevent.spawn(self.maintain), gevent.spawn(self.consume)]
+        try:
+            gevent.joinall(greenlets, raise_error=True)
+        finally:
+            gevent.killall(greenlets)
+            for shard in self.shards:
+                self._release(keys=[self.lease_key(shard)], args=[self.id])
+            self.db.zrem(self.ANNOUNCERS, self.id)
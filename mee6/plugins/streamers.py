@@ -3,11 +3,68 @@ import re
 import requests
 import gevent
 
+from gevent.pool import Pool
 from mee6 import Plugin
-from mee6.discord import send_message
+from mee6.discord import MessageTemplate
+from mee6.discord.api.outbound import MAX_CONTENT_LENGTH, MAX_EMBEDS
 from mee6.types import MessageEmbed, Guild
-from mee6.exceptions import APIException
-from mee6.utils import timed
+from mee6.utils import chunk, statsd, timed
+from mee6.utils.index import ReverseIndex
+from mee6.utils.pool import InstrumentedPool
+from time import time
+
+
+class LiveStreams:
+    """ Ids of the streams of a platform that were live at the previous
+    pass, checkpointed in redis as a comma separated list """
+
+    def __init__(self, db, key):
+        self.db = db
+        self.key = key
+        self.previous = None
+        self.current = set()
+
+    def load(self):
+        if self.previous is None:
+            raw = self.db.get(self.key)
+            self.previous = set(raw.split(',')) if raw else set()
+
+    def diff(self, streams, get_id):
+        """ Records the `streams` of the current pass, returns the ones
+        that weren't live at the previous pass """
+        self.load()
+
+        went_live = []
+        for stream in streams:
+            stream_id = str(get_id(stream))
+            if stream_id not in self.previous and stream_id not in self.current:
+                went_live.append(stream)
+            self.current.add(stream_id)
+
+        return went_live
+
+    def retry(self, streams_ids):
+        """ Leaves streams out of the current pass, they go live again at
+        the next one """
+        self.current -= set(streams_ids)
+
+    def commit(self, complete=True):
+        """ Ends the pass, returns the ids of the streams that went live and
+        of the ones that went offline. If some streams couldn't be fetched,
+        the pass isn't `complete` and none of the previous ones went
+        offline. """
+        self.load()
+        went_live = self.current - self.previous
+        if complete:
+            went_offline = self.previous - self.current
+            self.previous = self.current
+        else:
+            went_offline = set()
+            self.previous = self.previous | self.current
+        self.current = set()
+        self.db.set(self.key, ','.join(self.previous))
+
+        return went_live, went_offline
 
 
 class Streamers(Plugin):
@@ -17,36 +74,107 @@ class Streamers(Plugin):
     description = "Get notified when your favourite twitch or hitbox streamer go live"
 
     twitch_client_id = os.getenv('TWITCH_CLIENT_ID')
+    TWITCH_API_URL = os.getenv('TWITCH_API_URL', 'https://api.twitch.tv/kraken')
+    # Page through every live stream instead of polling the followed ones
+    TWITCH_FULL_SCAN = bool(os.getenv('TWITCH_FULL_SCAN'))
+    # Concurrent requests of a pass over the followed streamers
+    TWITCH_CONCURRENCY = int(os.getenv('TWITCH_CONCURRENCY', 10))
+    # Seconds between the start of two passes
+    TWITCH_POLL_INTERVAL = float(os.getenv('TWITCH_POLL_INTERVAL', 10))
+
+    # Seconds between two rebuilds of the followed streamers index
+    INDEX_REFRESH = 3600
+
+    # Twitch streamers to the {guild_id: None} following them
+    twitch_followers = None
+    # Changes received while the index is rebuilt
+    index_updates = None
+    index_built_at = 0
+    # Logins to their Twitch user id, None if there's no such user
+    twitch_users = None
+
+    # Seconds a guild remembers the streams it announced, in case the live
+    # streams checkpoint is lost
+    ANNOUNCED_TTL = 3 * 86400
+
+    live_streams = None
+
+    # Streams whose guilds are looked up and announcements collected
+    # concurrently, for both platforms
+    FANOUT_CONCURRENCY = int(os.getenv('STREAMERS_FANOUT_CONCURRENCY', 100))
+
+    fanout_pool = InstrumentedPool(FANOUT_CONCURRENCY, 'streamers.fanout')
 
     streamer_rx = re.compile(r'^[a-z0-9_]{3,25}$')
 
     @Plugin.loop(sleep_time=0)
     def hitbox_loop(self):
         with timed('hitbox_live_delay'):
+            live = self.get_live_streams('hitbox')
+            pending = {}
+            jobs = []
             offset = 0
+            complete = True
             while 1:
                 streams = self.get_hitbox_streams(offset=offset)
+                if streams is None:
+                    complete = False
+                    break
                 if len(streams) == 0:
                     break
 
-                for stream in streams:
-                    gevent.spawn(self.handle_hitbox_stream, stream)
+                for stream in live.diff(streams, lambda s: s['media_id']):
+                    jobs.append(self.fanout_pool.spawn(self.handle_hitbox_stream,
+                                                       stream, pending))
 
                 offset += 100
 
                 gevent.sleep(1)
 
+            gevent.joinall(jobs)
+            self.announce_pending('hitbox', pending)
+            self.commit_live_streams('hitbox', complete)
+
+    def get_live_streams(self, platform):
+        if self.live_streams is None:
+            self.live_streams = {}
+
+        live = self.live_streams.get(platform)
+        if live is None:
+            key = 'live_{}_streams'.format(platform)
+            live = self.live_streams[platform] = LiveStreams(self.plugin_db, key)
+        return live
+
+    def commit_live_streams(self, platform, complete=True):
+        live = self.get_live_streams(platform)
+        went_live, went_offline = live.commit(complete)
+
+        self.log('[{}] {} streams went live, {} went offline{}'.format(
+            platform.capitalize(), len(went_live), len(went_offline),
+            '' if complete else ' (incomplete pass)'))
+        tags = ['platform:' + platform]
+        if not complete:
+            statsd.increment('streamers.incomplete_passes', tags=tags)
+        statsd.increment('streamers.went_live', len(went_live), tags=tags)
+        statsd.increment('streamers.went_offline', len(went_offline), tags=tags)
+
     def get_hitbox_streams(self, offset=0):
+        """ Returns a page of live streams, None if it couldn't be fetched """
         url = 'https://api.hitbox.tv/media/live/list.json'
         params = {'offset': offset,
                   'limit': 100}
-        r = requests.get(url, params)
+        try:
+            r = requests.get(url, params, timeout=10)
+        except requests.RequestException as e:
+            self.log('[Hitbox] Couldn\'t fetch streams ({})'.format(e))
+            return None
+
         if r.status_code != 200:
-            return []
+            return None
 
         data = r.json()
         if data.get('success', True) == False:
-            return []
+            return None
 
         livestreams = data['livestream']
         self.log('[Hitbox] Got {} streams ' \
@@ -54,27 +182,18 @@ class Streamers(Plugin):
 
         return livestreams
 
-    def handle_hitbox_stream(self, stream):
+    def handle_hitbox_stream(self, stream, pending):
         streamer = stream['media_name']
         key = 'plugin.{}.hitbox_streamer.{}.guilds'.format(self.id, streamer)
         guilds_ids = self.db.smembers(key)
-        for guild_id in guilds_ids:
-            if not self.check_guild(guild_id):
-                continue
-
-            guild = Guild(id=guild_id, plugin=self)
-            try:
-                self.announce_hitbox(guild, stream)
-            except Exception as e:
-                self.log('[Hitbox] An Exception occured announcing stream {}, guild' \
-                         ' {} {}'.format(streamer, guild.id, e))
-
-    def announce_hitbox(self, guild, stream):
-        stream_id = stream['media_id']
-        check = guild.storage.sismember('announced_hitbox_streams', stream_id)
-        if check:
+        if not guilds_ids:
             return
 
+        embed = self.make_hitbox_embed(stream)
+        self.collect_stream('hitbox', stream['media_id'], embed, guilds_ids,
+                            pending)
+
+    def make_hitbox_embed(self, stream):
         channel = stream['channel']
 
         embed = MessageEmbed()
@@ -100,61 +219,297 @@ class Streamers(Plugin):
 
         embed.add_field('Viewers', stream['category_viewers'] or 0, True)
 
-        message = guild.config['announcement_message']
-        message = message.replace('{streamer}', embed.author_name)
-        message = message.replace('{link}', embed.url)
+        return embed
 
-        self.log('[Hitbox] Announcing {} to {}'.format(embed.author_name, guild.id))
-        try:
-            send_message(guild.config['announcement_channel'], message, embed=embed)
-            guild.storage.sadd('announced_hitbox_streams', stream_id)
-        except APIException as e:
-            self.log('[Hitbox] An error occured {} {} {}'.format(e.status_code,
-                                                                 e.error_code,
-                                                                 e.payload))
-            if e.status_code in (403, 404):
-                self.log('[Hitbox] Disabling plugin for {}'.format(guild.id))
-                self.disable(guild)
+    def collect_stream(self, platform, stream_id, embed, guilds_ids, pending):
+        """ Adds the stream to the announcements `pending` for the guilds
+        that haven't seen it yet, by (guild id, announcement channel). The
+        embed is serialized once for all of them. """
+        storage_key = 'announced_{}'.format(platform)
+        legacy_key = 'announced_{}_streams'.format(platform)
+        tag = '[{}]'.format(platform.capitalize())
+
+        template = None
+        for guild_id in guilds_ids:
+            try:
+                if not self.check_guild(guild_id):
+                    continue
+
+                guild = Guild(id=guild_id, plugin=self)
+                if guild.storage.zscore(storage_key, stream_id) is not None:
+                    continue
+                if guild.storage.sismember(legacy_key, stream_id):
+                    continue
+
+                config = guild.config
+                message = config['announcement_message']
+                message = message.replace('{streamer}', embed.author_name)
+                message = message.replace('{link}', embed.url)
+
+                if template is None:
+                    template = MessageTemplate([embed])
+
+                channel_id = str(config['announcement_channel'])
+                _, items = pending.setdefault((guild.id, channel_id), (guild, []))
+                # A stream can show up on two pages of the same pass
+                if any(item[0] == stream_id for item in items):
+                    continue
+                items.append((stream_id, message, template))
+            except Exception as e:
+                self.log('{} An Exception occured announcing stream {}, guild' \
+                         ' {} {}'.format(tag, embed.author_name, guild_id, e))
+
+    def pack_announcements(self, items):
+        """ Splits the (stream_id, message, template) of a channel in
+        messages of at most 10 embeds and 2000 characters """
+        batches = []
+        batch, length = [], 0
+
+        for item in items:
+            added_length = len(item[1]) + (1 if batch else 0)
+            if batch and (len(batch) == MAX_EMBEDS or
+                          length + added_length > MAX_CONTENT_LENGTH):
+                batches.append(batch)
+                batch, length = [], 0
+                added_length = len(item[1])
+
+            batch.append(item)
+            length += added_length
+
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    def announce_pending(self, platform, pending):
+        """ Announces the streams that went live during the pass, with one
+        message per announcement channel holding up to 10 of them """
+        storage_key = 'announced_{}'.format(platform)
+        # The sets the announced streams were kept in didn't expire
+        legacy_key = 'announced_{}_streams'.format(platform)
+
+        announcements = []
+        streams_ids = []
+        for (guild_id, channel_id), (guild, items) in pending.items():
+            for batch in self.pack_announcements(items):
+                ids = [str(stream_id) for stream_id, _, _ in batch]
+                content = '\n'.join(message for _, message, _ in batch)
+                template = MessageTemplate.join([t for _, _, t in batch])
+                key = 'streamers:{}:{}:{}'.format(platform, guild_id,
+                                                  ','.join(ids))
+
+                announcements.append((guild, channel_id, content, key, template))
+                streams_ids.append(ids)
+
+        if not announcements:
+            return
+
+        streams_count = sum(len(ids) for ids in streams_ids)
+        self.log('[{}] Announcing {} streams in {} messages'.format(
+            platform.capitalize(), streams_count, len(announcements)))
+        statsd.histogram('streamers.embeds_per_message',
+                         streams_count / len(announcements),
+                         tags=['platform:' + platform])
+
+        sent = self.send_announcements(announcements)
+        now = time()
+        failed = set()
+        for announcement, ids, was_sent in zip(announcements, streams_ids, sent):
+            if not was_sent:
+                failed.update(ids)
+                continue
+
+            storage = announcement[0].storage
+            storage.zadd(storage_key, {stream_id: now for stream_id in ids})
+            storage.zremrangebyscore(storage_key, '-inf',
+                                     now - self.ANNOUNCED_TTL)
+            storage.expire(storage_key, self.ANNOUNCED_TTL)
+            # None without expiry on redis-py 2, -1 on later versions
+            ttl = storage.ttl(legacy_key)
+            if ttl is None or ttl < 0:
+                storage.expire(legacy_key, self.ANNOUNCED_TTL)
+
+        # The guilds they were sent to have them in their announced streams
+        if failed:
+            self.log('[{}] Announcing {} streams failed, retrying them next'
+                     ' pass'.format(platform.capitalize(), len(failed)))
+            self.get_live_streams(platform).retry(failed)
 
     @Plugin.loop(sleep_time=0)
     def twitch_loop(self):
+        if time() - self.index_built_at > self.INDEX_REFRESH:
+            self.build_index()
+
+        if self.TWITCH_FULL_SCAN:
+            return self.scan_twitch_streams()
+
+        started_at = time()
         with timed('twitch_live_delay'):
+            pending = {}
+            complete = self.poll_twitch_streams(pending)
+            self.announce_pending('twitch', pending)
+            self.commit_live_streams('twitch', complete)
+
+        gevent.sleep(max(0, self.TWITCH_POLL_INTERVAL - (time() - started_at)))
+
+    def scan_twitch_streams(self):
+        """ Pages through every live stream """
+        with timed('twitch_live_delay'):
+            live = self.get_live_streams('twitch')
+            pending = {}
+            jobs = []
             offset = 0
+            complete = True
             while 1:
                 streams = self.get_twitch_streams(offset=offset)
+                if streams is None:
+                    complete = False
+                    break
                 if len(streams) == 0:
                     break
 
-                gevent.spawn(self.handle_twitch_streams, streams)
+                went_live = live.diff(streams, lambda s: s['_id'])
+                jobs.append(gevent.spawn(self.handle_twitch_streams, went_live,
+                                         pending))
 
                 offset += 100
                 gevent.sleep(1)
 
-    def handle_twitch_streams(self, streams):
-        for stream in streams:
-            gevent.spawn(self.handle_twitch_stream, stream)
+            gevent.joinall(jobs)
+            self.announce_pending('twitch', pending)
+            self.commit_live_streams('twitch', complete)
 
-    def handle_twitch_stream(self, stream):
-        streamer = stream['channel']['name']
-        key = 'plugin.{}.twitch_streamer.{}.guilds'.format(self.id, streamer)
-        guilds_ids = self.db.smembers(key)
-        for guild_id in guilds_ids:
-            if not self.check_guild(guild_id):
-                continue
+    def poll_twitch_streams(self, pending):
+        """ Looks up the followed streamers only, 100 per request. Returns
+        whether all of them were looked up. """
+        logins = list(self.twitch_followers.guilds)
+        users_ids = self.get_twitch_users_ids(logins)
+        complete = all(login in self.twitch_users for login in logins)
 
-            guild = Guild(id=guild_id, plugin=self)
-            try:
-                self.announce_twitch(guild, stream)
-            except Exception as e:
-                self.log('[Twitch] An Exception occured announcing stream {}, guild' \
-                         '{} {}'.format(stream['channel']['name'], guild.id, e))
+        pool = Pool(self.TWITCH_CONCURRENCY)
+        pages = pool.map(self.get_followed_twitch_streams, chunk(users_ids, 100))
+        complete = complete and None not in pages
+        streams = [stream for page in pages if page for stream in page]
+
+        self.log('[Twitch] {} of {} followed streamers are live'.format(
+            len(streams), len(logins)))
+        statsd.gauge('streamers.twitch_followed', len(logins))
+
+        live = self.get_live_streams('twitch')
+        went_live = live.diff(streams, lambda s: s['_id'])
+        self.handle_twitch_streams(went_live, pending)
+
+        return complete
+
+    def build_index(self):
+        """ Indexes the Twitch streamers the enabled guilds follow """
+        self.index_updates = []
+
+        followers = ReverseIndex()
+        guilds_ids = [guild.id for guild in self.get_guilds()]
+        for guild_id, config in self.get_configs(guilds_ids):
+            followers.set(guild_id, config['twitch_streamers'])
+
+        for guild_id, streamers in self.index_updates:
+            followers.set(guild_id, streamers)
+
+        self.twitch_followers = followers
+        self.index_updates = None
+        self.index_built_at = time()
+
+        # Look the unknown logins up again, they might exist by now
+        users = self.twitch_users or {}
+        self.twitch_users = {login: user_id for login, user_id in users.items()
+                             if user_id is not None}
+
+        self.log('[Twitch] Indexed {} streamers followed by {} guilds'.format(
+            len(followers), len(guilds_ids)))
 
-    def announce_twitch(self, guild, stream):
-        stream_id = stream['_id']
-        check = guild.storage.sismember('announced_twitch_streams', stream_id)
-        if check:
+    def update_index(self, guild_id, streamers):
+        if self.twitch_followers is not None:
+            self.twitch_followers.set(guild_id, streamers)
+
+        if self.index_updates is not None:
+            self.index_updates.append((guild_id, streamers))
+
+    def on_config_change(self, guild, config):
+        if self.check_guild(guild):
+            self.update_index(guild.id, config['twitch_streamers'])
+
+    def on_enable(self, guild):
+        self.update_index(guild.id, guild.config['twitch_streamers'])
+
+    def on_disable(self, guild):
+        self.update_index(guild.id, [])
+
+    @property
+    def twitch_headers(self):
+        return {'Client-ID': self.twitch_client_id,
+                'Accept': 'application/vnd.twitchtv.v5+json'}
+
+    def get_twitch_users_ids(self, logins):
+        """ Returns the user ids of the logins, the ones not seen yet are
+        looked up 100 at a time """
+        unknown = [login for login in logins if login not in self.twitch_users]
+        if unknown:
+            pool = Pool(self.TWITCH_CONCURRENCY)
+            pool.map(self.lookup_twitch_users, chunk(unknown, 100))
+
+        return [self.twitch_users[login] for login in logins
+                if self.twitch_users.get(login)]
+
+    def lookup_twitch_users(self, logins):
+        url = self.TWITCH_API_URL + '/users'
+        params = {'login': ','.join(logins)}
+        try:
+            r = requests.get(url, params=params, headers=self.twitch_headers,
+                             timeout=10)
+        except requests.RequestException as e:
+            self.log('[Twitch] Couldn\'t look users up ({})'.format(e))
             return
 
+        if r.status_code != 200:
+            self.log('[Twitch] Couldn\'t look users up (status_code: {})'.format(r.status_code))
+            return
+
+        users = {user['name']: user['_id'] for user in r.json()['users']}
+        for login in logins:
+            self.twitch_users[login] = users.get(login)
+
+    def get_followed_twitch_streams(self, users_ids):
+        """ Returns the live streams of the users, None if they couldn't be
+        fetched """
+        url = self.TWITCH_API_URL + '/streams/'
+        params = {'channel': ','.join(users_ids),
+                  'stream_type': 'live',
+                  'limit': 100}
+        try:
+            r = requests.get(url, params=params, headers=self.twitch_headers,
+                             timeout=10)
+        except requests.RequestException as e:
+            self.log('[Twitch] Couldn\'t fetch followed streams ({})'.format(e))
+            return None
+
+        if r.status_code != 200:
+            self.log('[Twitch] Couldn\'t fetch followed streams (status_code: {})'.format(r.status_code))
+            return None
+
+        return r.json()['streams']
+
+    def handle_twitch_streams(self, streams, pending):
+        jobs = [self.fanout_pool.spawn(self.handle_twitch_stream, stream, pending)
+                for stream in streams]
+        gevent.joinall(jobs)
+
+    def handle_twitch_stream(self, stream, pending):
+        guilds_ids = list(self.twitch_followers.get(stream['channel']['name']))
+        if not guilds_ids:
+            return
+
+        embed = self.make_twitch_embed(stream)
+        self.collect_stream('twitch', stream['_id'], embed, guilds_ids, pending)
+
+    def make_twitch_embed(self, stream):
         channel = stream['channel']
 
         embed = MessageEmbed()
@@ -180,31 +535,22 @@ class Streamers(Plugin):
 
         embed.add_field('Viewers', stream['viewers'], True)
 
-        message = guild.config['announcement_message']
-        message = message.replace('{streamer}', embed.author_name)
-        message = message.replace('{link}', embed.url)
-
-        self.log('[Twitch] Announcing {} to {}'.format(embed.author_name, guild.id))
-        try:
-            send_message(guild.config['announcement_channel'], message, embed=embed)
-            guild.storage.sadd('announced_twitch_streams', stream_id)
-        except APIException as e:
-            self.log('[Twitch] An error occured {} {} {}'.format(e.status_code,
-                                                                 e.error_code,
-                                                                 e.payload))
-            if e.status_code in (403, 404):
-                self.log('[Twitch] Disabling plugin for {}'.format(guild.id))
-                self.disable(guild)
+        return embed
 
     def get_twitch_streams(self, offset=0, with_count=False):
-        url = 'https://api.twitch.tv/kraken/streams/'
-        headers = {'Client-ID': self.twitch_client_id,
-                   'Accept': 'application/vnd.twitchtv.v5+json'}
+        """ Returns a page of live streams, None if it couldn't be fetched """
+        url = self.TWITCH_API_URL + '/streams/'
         params={'offset': offset,
                 'limit': 100}
 
-        r = requests.get(url, params=params, headers=headers, timeout=10)
-        if r.status_code == 200:
+        try:
+            r = requests.get(url, params=params, headers=self.twitch_headers,
+                             timeout=10)
+        except requests.RequestException as e:
+            self.log('[Twitch] Couldn\'t fetch streams (offset: {}, {})'.format(offset, e))
+            r = None
+
+        if r is not None and r.status_code == 200:
             data = r.json()
 
             self.log('[Twitch] Got {} streams [offset={}]'.format(len(data['streams']), offset))
@@ -214,8 +560,11 @@ class Streamers(Plugin):
             else:
                 return data['streams']
 
-        self.log('[Twitch] Couldn\'t fetch streams (offset: {}, status_code:{})'.format(offset, status_code))
+        if r is not None:
+            self.log('[Twitch] Couldn\'t fetch streams (offset: {}, status_code:{})'.format(offset, r.status_code))
 
+        if with_count:
+            return (None, 0)
         return None
 
     def get_default_config(self, guild_id):
@@ -226,23 +575,19 @@ class Streamers(Plugin):
                           'announcement_channel': guild_id}
         return default_config
 
-    def before_config_patch(self, guild_id, old_config, new_config):
-        for streamer in old_config['twitch_streamers']:
-            key = 'plugin.{}.twitch_streamer.{}.guilds'.format(self.id, streamer)
-            self.db.srem(key, guild_id)
-
-        for streamer in old_config['hitbox_streamers']:
-            key = 'plugin.{}.hitbox_streamer.{}.guilds'.format(self.id, streamer)
-            self.db.srem(key, guild_id)
-
-    def after_config_patch(self, guild_id, config):
+    def get_config_indexes(self, guild_id, config):
+        keys = set()
         for streamer in config['twitch_streamers']:
-            key = 'plugin.{}.twitch_streamer.{}.guilds'.format(self.id, streamer)
-            self.db.sadd(key, guild_id)
+            keys.add('plugin.{}.twitch_streamer.{}.guilds'.format(self.id, streamer))
 
         for streamer in config['hitbox_streamers']:
-            key = 'plugin.{}.hitbox_streamer.{}.guilds'.format(self.id, streamer)
-            self.db.sadd(key, guild_id)
+            keys.add('plugin.{}.hitbox_streamer.{}.guilds'.format(self.id, streamer))
+
+        return keys
+
+    def get_index_patterns(self):
+        return ['plugin.{}.twitch_streamer.*.guilds'.format(self.id),
+                'plugin.{}.hitbox_streamer.*.guilds'.format(self.id)]
 
     def validate_name(self, name):
         name = name.lower()
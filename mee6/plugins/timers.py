@@ -1,5 +1,5 @@
 from mee6 import Plugin
-from mee6.discord import get_channel_messages, send_webhook_message, send_message, get_current_user
+from mee6.discord import get_channel_messages, queue_webhook_message, get_current_user, BACKGROUND
 from time import time
 from mee6.utils import timed
 from mee6.exceptions import APIException
@@ -110,7 +110,8 @@ class Timers(Plugin):
             return next_announce
 
         with self._lock:
-            last_messages = get_channel_messages(channel, limit=1)
+            last_messages = get_channel_messages(channel, limit=1,
+                                                 priority=BACKGROUND)
 
         webhook_id = 'timers:{}'.format(channel)
 
@@ -125,7 +126,7 @@ class Timers(Plugin):
         self.db.set('plugin.timers.{}.last_post_timestamp'.format(timer_id), now)
 
         if do_post:
-            post_message = send_webhook_message(webhook_id, channel, message)
+            post_message = queue_webhook_message(webhook_id, channel, message).get()
             self.db.sadd('plugin.timers.webhooks', post_message.webhook_id)
             self.log('Announcing timer message ({} interval) in {}'.format(interval, channel))
 
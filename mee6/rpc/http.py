@@ -4,6 +4,7 @@ import os
 import re
 
 from mee6.utils import Logger, timed
+from mee6.utils.breaker import CircuitBreakers
 from mee6.exceptions import RPCException
 
 
@@ -14,6 +15,12 @@ rx = re.compile(r'^[0-9]*$')
 class HTTPClient(Logger):
 
     BASE_URL = os.getenv('SHARDS_RPC_URL')
+    TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 10))
+    # Seconds above which a response slows the routes concurrency down
+    LATENCY_TARGET = float(os.getenv('RPC_LATENCY_TARGET', 0.5))
+
+    def __init__(self, breakers=None):
+        self.breakers = breakers or CircuitBreakers('rpc', self.LATENCY_TARGET)
 
     def build_url(self, route): return self.BASE_URL + '/' + route
 
@@ -27,9 +34,21 @@ class HTTPClient(Logger):
     def __call__(self, method, route, **kwargs):
         url = self.build_url(route)
 
+        kwargs.setdefault('timeout', self.TIMEOUT)
+
         tags = {'request_type': self.build_metric_type(method, route)}
-        with timed('rpc_request_duration', tags=tags):
-            r = requests.request(method, url, **kwargs)
+        breaker = self.breakers.get(tags['request_type'])
+        probe = breaker.acquire()
+        start = self.breakers.clock.time()
+        success, latency = False, None
+        try:
+            with timed('rpc_request_duration', tags=tags):
+                r = requests.request(method, url, **kwargs)
+            success = r.status_code < 500
+            latency = self.breakers.clock.time() - start
+        finally:
+            # Also frees the slot when a timeout or a kill interrupts it
+            breaker.release(success, latency, probe=probe)
 
         if r.status_code < 400:
             return r
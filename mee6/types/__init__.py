@@ -1,3 +1,4 @@
+from mee6.types.model import Model
 from mee6.types.user import User
 from mee6.types.member import Member
 from mee6.types.channel import *
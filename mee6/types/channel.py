@@ -1,5 +1,4 @@
-from modus import Model
-from modus.fields import Snowflake, String, Integer
+from mee6.types.model import Model, Snowflake, String, Integer
 
 
 class Channel(Model):
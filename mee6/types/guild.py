@@ -1,19 +1,20 @@
-from modus import Model
-from modus.fields import Snowflake, String, Integer, List, ModelField
+from mee6.types.model import Model, Snowflake, String, Integer, List, ModelField
 from mee6.types import Channel, Role
 
 
 class Guild(Model):
+    __slots__ = ('db', 'plugin')
+
     id = Snowflake(required=True)
     name = String()
     owner_id = Snowflake()
     roles = List(ModelField(Role))
     channels = List(ModelField(Channel))
 
-    def __init__(self, **kwargs):
+    def __init__(self, strict=None, **kwargs):
         self.db = kwargs.get('db')
         self.plugin = kwargs.get('plugin')
-        super(Guild, self).__init__(**kwargs)
+        super(Guild, self).__init__(strict=strict, **kwargs)
 
     @property
     def members(self): pass
@@ -0,0 +1,249 @@
+from mee6.exceptions import ValidationError
+
+
+class Field:
+    """ Describes a model attribute.
+
+    `deserialize` is always applied to non-empty values and should stay cheap,
+    `check` is only run in strict mode and returns a list of errors.
+    """
+
+    converts = False
+
+    def __init__(self, required=False, default=None):
+        self.required = required
+        self.default = default
+
+    def deserialize(self, value):
+        return value
+
+    def serialize(self, value):
+        return value
+
+    def check(self, value):
+        return []
+
+
+class Snowflake(Field):
+
+    converts = True
+
+    def deserialize(self, value):
+        return int(value)
+
+    def check(self, value):
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return ['This is not a snowflake id']
+
+        if value.bit_length() > 64:
+            return ['This is not a snowflake id']
+
+        return []
+
+
+class Integer(Field):
+
+    converts = True
+
+    def deserialize(self, value):
+        return int(value)
+
+    def check(self, value):
+        try:
+            int(value)
+        except (TypeError, ValueError):
+            return ['This is not an integer']
+
+        return []
+
+
+class String(Field):
+
+    def check(self, value):
+        if not isinstance(value, str):
+            return ['This is not a string']
+
+        return []
+
+
+class Boolean(Field):
+
+    def check(self, value):
+        if not isinstance(value, bool):
+            return ['This is not a valid boolean']
+
+        return []
+
+
+class List(Field):
+
+    def __init__(self, field, **kwargs):
+        self.field = field
+        self.converts = field.converts
+        super(List, self).__init__(**kwargs)
+
+    def deserialize(self, values):
+        field = self.field
+        return [field.deserialize(value) for value in values]
+
+    def serialize(self, values):
+        if values is None:
+            return []
+
+        return [self.field.serialize(value) for value in values]
+
+    def check(self, values):
+        if not isinstance(values, (list, tuple)):
+            return ['This is not a list']
+
+        errors = []
+        for value in values:
+            errors += self.field.check(value)
+        return errors
+
+
+class ModelField(Field):
+
+    converts = True
+
+    def __init__(self, model, **kwargs):
+        self.model = model
+        super(ModelField, self).__init__(**kwargs)
+
+    def deserialize(self, value):
+        if isinstance(value, self.model):
+            return value
+
+        model = self.model
+        if model.__init__ is not Model.__init__:
+            return model(strict=False, **value)
+
+        instance = model.__new__(model)
+        instance._load(value)
+        return instance
+
+    def serialize(self, value):
+        if value is None:
+            return None
+
+        return value.serialize()
+
+    def check(self, value):
+        if isinstance(value, self.model):
+            value = value.serialize()
+
+        if not isinstance(value, dict):
+            return ['This is not a valid {}'.format(self.model.__name__)]
+
+        errors = self.model.get_errors(value)
+        return [errors] if errors else []
+
+
+def build_loader(fields):
+    """ Generates the function assigning a payload to an instance. Unrolling
+    the fields in straight-line code is what makes construction cheaper than
+    a generic loop over the fields. """
+    namespace = {}
+    lines = ['def _load(self, data):',
+             '    get = data.get']
+
+    for i, (name, field) in enumerate(sorted(fields.items())):
+        namespace['default_{}'.format(i)] = field.default
+        lines.append('    value = get({!r})'.format(name))
+        if field.converts:
+            namespace['deserialize_{}'.format(i)] = field.deserialize
+            lines.append('    self.{} = deserialize_{}(value) if value else '
+                         '(default_{} if value is None else value)'.format(name, i, i))
+        else:
+            lines.append('    self.{} = default_{} if value is None else '
+                         'value'.format(name, i))
+
+    if not fields:
+        lines.append('    pass')
+
+    exec('\n'.join(lines), namespace)
+    return namespace['_load']
+
+
+class MetaModel(type):
+    def __new__(mcl, name, bases, attrs):
+        fields = {}
+        for base in bases:
+            fields.update(getattr(base, '_fields', {}))
+
+        own_fields = []
+        for attr_name, value in list(attrs.items()):
+            if isinstance(value, Field):
+                fields[attr_name] = attrs.pop(attr_name)
+                own_fields.append(attr_name)
+
+        attrs['_fields'] = fields
+        attrs['_load'] = build_loader(fields)
+        attrs['__slots__'] = tuple(attrs.get('__slots__', ())) + tuple(own_fields)
+
+        return type.__new__(mcl, name, bases, attrs)
+
+
+class Model(metaclass=MetaModel):
+    """ Lightweight replacement for modus models.
+
+    Instances are slotted and only get their values converted (snowflakes to
+    int, nested payloads to models) on construction. Pass `strict=True`, or
+    set `Model.strict`, to validate every field and raise a ValidationError
+    listing the invalid ones.
+    """
+
+    __slots__ = ()
+
+    strict = False
+
+    def __init__(self, strict=None, **kwargs):
+        if strict is None:
+            strict = self.strict
+
+        if strict:
+            errors = self.get_errors(kwargs)
+            if errors:
+                raise ValidationError(errors)
+
+        # Nested payloads were already checked at this level
+        self._load(kwargs)
+
+    @classmethod
+    def get_errors(cls, data):
+        errors = {}
+        for name, field in cls._fields.items():
+            value = data.get(name)
+            if value is None:
+                value = field.default
+
+            if value is None:
+                if field.required:
+                    errors[name] = ['This field is required']
+                continue
+
+            field_errors = field.check(value)
+            if field_errors:
+                errors[name] = field_errors
+
+        return errors
+
+    @classmethod
+    def deserialize(cls, data, strict=None):
+        return cls(strict=strict, **data)
+
+    def serialize(self):
+        return {name: field.serialize(getattr(self, name))
+                for name, field in self._fields.items()}
+
+    def validate(self):
+        errors = self.get_errors(self.serialize())
+        if errors:
+            raise ValidationError(errors)
+
+    def __repr__(self):
+        values = ' '.join('{}={!r}'.format(name, getattr(self, name))
+                          for name in sorted(self._fields))
+        return '<{} {}>'.format(self.__class__.__name__, values)
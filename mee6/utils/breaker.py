@@ -0,0 +1,192 @@
+import os
+
+from collections import deque
+from gevent.event import Event
+from mee6.exceptions import CircuitOpenException
+from mee6.utils import Logger, statsd
+from mee6.utils.clock import Clock
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker(Logger):
+    """ Guards the requests of a route family.
+
+    Consecutive failures (5xx, connection errors, timeouts) open the circuit:
+    requests fail fast with CircuitOpenException for `reset_timeout` seconds,
+    then a single probe is let through and closes the circuit if it
+    succeeds.
+
+    The requests in flight are capped by a limit adapted AIMD-style: it
+    grows by one per `limit` requests answered within `latency_target` and
+    is halved, at most once per `latency_target`, when a request is slower or
+    fails. Requests wait at most `max_wait` seconds for a slot.
+    """
+
+    def __init__(self, name, metric_prefix, latency_target=1.,
+                 failure_threshold=5, reset_timeout=10., initial_limit=20,
+                 min_limit=1, max_limit=100, max_wait=5., clock=None):
+        self.name = name
+        self.metric_prefix = metric_prefix
+        self.latency_target = latency_target
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_wait = max_wait
+        self.clock = clock or Clock()
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.in_flight = 0
+        self.waiters = deque()
+        self.decreased_at = None
+
+        self.tags = ['route:' + name]
+
+    def metric(self, name):
+        return '{}.breaker.{}'.format(self.metric_prefix, name)
+
+    def set_state(self, state):
+        self.log('Breaker {} {} -> {}'.format(self.name, self.state, state))
+        self.state = state
+        statsd.increment(self.metric('transitions'),
+                         tags=self.tags + ['state:' + state])
+
+    def reject(self, reason, retry_after=None):
+        statsd.increment(self.metric('rejected'),
+                         tags=self.tags + ['reason:' + reason])
+        raise CircuitOpenException(self.name, reason, retry_after)
+
+    def acquire(self):
+        """ Takes a slot for a request, raises CircuitOpenException if the
+        circuit is open or no slot freed up in time. Returns whether the
+        request is the half-open probe, to be passed back to release. """
+        if self.state == OPEN:
+            elapsed = self.clock.time() - self.opened_at
+            if elapsed < self.reset_timeout:
+                self.reject('open', self.reset_timeout - elapsed)
+            self.set_state(HALF_OPEN)
+
+        probe = False
+        if self.state == HALF_OPEN:
+            if self.probing:
+                self.reject('open', self.reset_timeout)
+            self.probing = probe = True
+
+        if self.in_flight >= int(self.limit):
+            try:
+                self.wait_slot()
+            except BaseException:
+                if probe:
+                    self.probing = False
+                raise
+
+        self.in_flight += 1
+        return probe
+
+    def wait_slot(self):
+        deadline = self.clock.time() + self.max_wait
+        while self.in_flight >= int(self.limit):
+            remaining = deadline - self.clock.time()
+            waiter = Event()
+            self.waiters.append(waiter)
+            try:
+                woken = remaining > 0 and waiter.wait(remaining)
+            except BaseException:
+                # Killed while waiting, pass on a wakeup it got
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                elif self.waiters:
+                    self.waiters.popleft().set()
+                raise
+
+            if not woken:
+                self.waiters.remove(waiter)
+                self.reject('overloaded')
+
+    def release(self, success, latency=None, probe=False):
+        """ Frees the slot and records the outcome of the request. Call it
+        in a finally, with success=False if the request raised. """
+        self.in_flight -= 1
+        if self.waiters:
+            self.waiters.popleft().set()
+
+        if probe:
+            self.probing = False
+
+        if success:
+            self.failures = 0
+            if self.state == HALF_OPEN:
+                self.set_state(CLOSED)
+
+            if latency is not None and latency > self.latency_target:
+                self.decrease()
+            else:
+                self.increase()
+            return
+
+        self.failures += 1
+        self.decrease()
+        if self.state == HALF_OPEN or (self.state == CLOSED and
+                                       self.failures >= self.failure_threshold):
+            self.opened_at = self.clock.time()
+            self.set_state(OPEN)
+
+    def increase(self):
+        previous = int(self.limit)
+        self.limit = min(self.max_limit, self.limit + 1. / self.limit)
+        if int(self.limit) != previous:
+            self.report_limit()
+
+        # The limit might have room for the requests waiting
+        if self.waiters and self.in_flight < int(self.limit):
+            self.waiters.popleft().set()
+
+    def decrease(self):
+        now = self.clock.time()
+        if (self.decreased_at is not None and
+                now - self.decreased_at < self.latency_target):
+            return
+
+        self.decreased_at = now
+        self.limit = max(self.min_limit, self.limit / 2.)
+        self.report_limit()
+
+    def report_limit(self):
+        statsd.gauge(self.metric('limit'), int(self.limit), tags=self.tags)
+
+
+class CircuitBreakers:
+    """ One CircuitBreaker per route family, created on first use """
+
+    FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+    RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 10))
+    MAX_CONCURRENCY = int(os.getenv('BREAKER_MAX_CONCURRENCY', 100))
+    MAX_WAIT = float(os.getenv('BREAKER_MAX_WAIT', 5))
+
+    def __init__(self, metric_prefix, latency_target=1., clock=None):
+        self.metric_prefix = metric_prefix
+        self.latency_target = latency_target
+        self.clock = clock or Clock()
+        self.breakers = {}
+
+    def get(self, name):
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, self.metric_prefix,
+                                     latency_target=self.latency_target,
+                                     failure_threshold=self.FAILURE_THRESHOLD,
+                                     reset_timeout=self.RESET_TIMEOUT,
+                                     max_limit=self.MAX_CONCURRENCY,
+                                     max_wait=self.MAX_WAIT,
+                                     clock=self.clock)
+            self.breakers[name] = breaker
+        return breaker
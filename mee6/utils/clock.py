@@ -0,0 +1,65 @@
+import gevent
+import heapq
+import itertools
+import time
+
+from gevent.event import Event
+
+
+class Clock:
+    """ Wall clock, sleeping cooperatively """
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        gevent.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """ Simulated time for greenlets.
+
+    `sleep` parks the calling greenlet until `run` advances the time to its
+    deadline. `run` only moves the time forward once every greenlet is
+    blocked, so any amount of simulated time passes instantly. Greenlets
+    must not do cooperative I/O in the meantime, don't monkey patch.
+    """
+
+    def __init__(self, start=0.):
+        self.now = start
+        self.timers = []
+        self.counter = itertools.count()
+        self.slept = 0.
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds <= 0:
+            gevent.sleep(0)
+            return
+
+        self.slept += seconds
+        wake_up = Event()
+        heapq.heappush(self.timers, (self.now + seconds, next(self.counter),
+                                     wake_up))
+        wake_up.wait()
+
+    def run(self, greenlets):
+        """ Runs the simulation until all the greenlets are done """
+        while True:
+            gevent.idle()
+
+            if all(g.ready() for g in greenlets):
+                return
+
+            if not self.timers:
+                # Blocked on something else than the clock
+                gevent.sleep(0)
+                continue
+
+            deadline = self.timers[0][0]
+            self.now = max(self.now, deadline)
+            while self.timers and self.timers[0][0] <= self.now:
+                _, _, wake_up = heapq.heappop(self.timers)
+                wake_up.set()
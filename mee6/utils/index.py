@@ -0,0 +1,47 @@
+class ReverseIndex:
+    """ In-memory map of the keys guilds follow (subreddits, streamers...)
+    to these guilds, with a value per guild like its announcement channel """
+
+    def __init__(self):
+        self.guilds = {}
+        self.keys = {}
+
+    def set(self, guild_id, keys, value=None):
+        """ Replaces the keys `guild_id` follows """
+        self.remove(guild_id)
+
+        keys = set(keys)
+        if not keys:
+            return
+
+        self.keys[guild_id] = keys
+        for key in keys:
+            self.guilds.setdefault(key, {})[guild_id] = value
+
+    def remove(self, guild_id):
+        for key in self.keys.pop(guild_id, ()):
+            guilds = self.guilds[key]
+            guilds.pop(guild_id, None)
+            if not guilds:
+                del self.guilds[key]
+
+    def remove_key(self, key):
+        """ Drops `key` from the guilds following it """
+        for guild_id in self.guilds.pop(key, {}):
+            keys = self.keys[guild_id]
+            keys.discard(key)
+            if not keys:
+                del self.keys[guild_id]
+
+    def get(self, key):
+        """ Returns the {guild_id: value} of the guilds following `key` """
+        return self.guilds.get(key, {})
+
+    def __contains__(self, key):
+        return key in self.guilds
+
+    def __iter__(self):
+        return iter(self.guilds)
+
+    def __len__(self):
+        return len(self.guilds)
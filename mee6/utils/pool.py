@@ -0,0 +1,55 @@
+from gevent.pool import Pool
+from mee6.utils import statsd
+from time import time
+
+
+class InstrumentedPool(Pool):
+    """ gevent Pool running at most `size` tasks, spawn blocks while it's
+    full. Reports under `metric`:
+
+    - .queued: spawns waiting for a free slot
+    - .active: tasks running
+    - .wait: time a spawn waited for a slot
+    - .duration: time a task ran
+    """
+
+    def __init__(self, size, metric, tags=None):
+        super(InstrumentedPool, self).__init__(size)
+        self.metric = metric
+        self.tags = tags or []
+        self.queued = 0
+
+    def report(self, finished=0):
+        """ `finished` tasks are still in the pool but done """
+        statsd.gauge(self.metric + '.queued', self.queued, tags=self.tags)
+        statsd.gauge(self.metric + '.active', len(self) - finished,
+                     tags=self.tags)
+
+    def spawn(self, func, *args, **kwargs):
+        queued_at = time()
+        self.queued += 1
+        try:
+            if self.full():
+                self.report()
+            self.wait_available()
+        finally:
+            self.queued -= 1
+
+        wait = time() - queued_at
+        statsd.timing(self.metric + '.wait', wait * 1000, tags=self.tags)
+
+        greenlet = super(InstrumentedPool, self).spawn(self.run_task, func,
+                                                       args, kwargs)
+        self.report()
+        return greenlet
+
+    def run_task(self, func, args, kwargs):
+        started_at = time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            duration = time() - started_at
+            statsd.timing(self.metric + '.duration', duration * 1000,
+                          tags=self.tags)
+            # The greenlet leaves the pool once it returns
+            self.report(finished=1)
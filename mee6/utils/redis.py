@@ -4,6 +4,9 @@ import json
 from gevent.lock import Semaphore
 
 
+MISSING = object()
+
+
 class GroupKeys:
 
     def __init__(self, channel_name, redis=None, cache=True, callback=None):
@@ -18,6 +21,10 @@ class GroupKeys:
 
         self.callback = callback
 
+        # Sets and deletes received per key, a read that raced with one of
+        # them isn't cached
+        self.versions = {}
+
         if cache:
             self.cache = {}
             self.watcher = gevent.spawn(self.watch)
@@ -38,27 +45,33 @@ class GroupKeys:
     def get(self, key):
         if self.cache_enable:
             value = self.cache.get(key)
+            if value is MISSING:
+                return None
             if value:
                 return value
 
+        version = self.versions.get(key, 0)
         value = self.redis.get(key)
-        if self.cache_enable and value:
-            self.cache[key] = value
+        if self.cache_enable and self.versions.get(key, 0) == version:
+            # Missing keys are cached too, sets and deletes are published
+            # so the cache never goes stale
+            self.cache[key] = value if value is not None else MISSING
 
         return value
 
+    def publish(self, payload):
+        """ Sends `payload` to the callbacks of every process watching the
+        group """
+        packet = json.dumps(payload)
+        return self._publish(packet)
+
     def set(self, key, value):
         self.redis.set(key, value)
-
-        payload = ['s', key, value]
-        packet = json.dumps(payload)
-        self._publish(packet)
+        self.publish(['s', key, value])
 
     def delete(self, key):
         self.redis.delete(key)
-        payload = ['d', key]
-        packet = json.dumps(payload)
-        self._publish(packet)
+        self.publish(['d', key])
 
     def watch(self):
         for frame in self.pubsub.listen():
@@ -70,6 +83,10 @@ class GroupKeys:
                 payload = json.loads(data)
                 op = payload[0]
 
+                if op in ('s', 'd'):
+                    key = payload[1]
+                    self.versions[key] = self.versions.get(key, 0) + 1
+
                 if op == 's':
                     key = payload[1]
                     value = payload[2]
@@ -77,8 +94,7 @@ class GroupKeys:
 
                 if op == 'd':
                     key = payload[1]
-                    if self.cache.get(key):
-                        del self.cache[key]
+                    self.cache[key] = MISSING
 
                 if self.callback:
                     gevent.spawn(self.callback, payload)
@@ -109,6 +125,23 @@ class PrefixedRedis:
     def sadd(self, key, *values):
         return self.rdb.sadd(self.pre + key, *values)
 
+    def zadd(self, key, mapping):
+        args = [item for member, score in mapping.items()
+                for item in (score, member)]
+        return self.rdb.execute_command('ZADD', self.pre + key, *args)
+
+    def zscore(self, key, member):
+        return self.rdb.zscore(self.pre + key, member)
+
+    def zremrangebyscore(self, key, min, max):
+        return self.rdb.zremrangebyscore(self.pre + key, min, max)
+
+    def expire(self, key, time):
+        return self.rdb.expire(self.pre + key, time)
+
+    def ttl(self, key):
+        return self.rdb.ttl(self.pre + key)
+
     def delete(self, key):
         return self.rdb.delete(self.pre + key)
 
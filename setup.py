@@ -8,9 +8,12 @@ setup(
     author='cookkkie',
     url='https://github.com/mee6/mee6',
     version='0.0.1',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*',
+                                    'tests', 'tests.*']),
     license='MIT',
     description='',
     include_package_data=True,
-    install_requires=requirements
+    python_requires='>=3.7',
+    install_requires=requirements,
+    extras_require={'aio': ['aiohttp']}
 )
@@ -0,0 +1,17 @@
+import pytest
+import redis
+
+from mee6.plugin import Plugin
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """ In-memory redis with Lua scripting, returned by redis.from_url and
+    used by the plugins """
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+
+    db = fakeredis.FakeStrictRedis(decode_responses=True)
+    monkeypatch.setattr(redis, 'from_url', lambda *args, **kwargs: db)
+    monkeypatch.setattr(Plugin, 'db', db)
+    return db
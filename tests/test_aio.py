@@ -0,0 +1,73 @@
+import asyncio
+
+from mee6.aio.singleflight import SingleFlight
+
+
+def run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+def test_calls_collapsed():
+    flights = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    async def main():
+        return await asyncio.gather(*[flights.do('key', fetch)
+                                      for _ in range(3)])
+
+    assert run(main()) == ['result'] * 3
+    assert len(calls) == 1
+    assert flights.calls == {}
+
+
+def test_cancelled_caller_doesnt_fail_the_others():
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    async def main():
+        first = asyncio.ensure_future(flights.do('key', fetch))
+        second = asyncio.ensure_future(flights.do('key', fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert run(main()) == ('result', True)
+
+
+def test_failure_raised_to_every_caller():
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise ValueError('failed')
+
+    async def main():
+        return await asyncio.gather(*[flights.do('key', fetch)
+                                      for _ in range(2)],
+                                    return_exceptions=True)
+
+    results = run(main())
+    assert [type(result) for result in results] == [ValueError] * 2
+    assert flights.calls == {}
+
+
+def test_result_cached():
+    flights = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        return [await flights.do('key', fetch, ttl=60) for _ in range(2)]
+
+    assert run(main()) == [1, 1]
@@ -0,0 +1,49 @@
+import json
+import pytest
+
+from mee6.announcements import AnnouncementQueue, Sender
+
+
+class Plugin:
+    id = 'streamers'
+
+
+def test_put_dedup(db):
+    queue = AnnouncementQueue()
+
+    assert queue.put(Plugin, 1, 2, 'live!', key='twitch:1:42')
+    assert not queue.put(Plugin, 1, 2, 'live!', key='twitch:1:42')
+    assert queue.put(Plugin, 1, 2, 'live!')
+
+    assert db.llen(queue.QUEUE) == 2
+    assert 0 < db.ttl('announcements.dedup.twitch:1:42') <= queue.DEDUP_TTL
+    announcement = json.loads(db.lindex(queue.QUEUE, -1))
+    assert announcement['key'] == 'twitch:1:42'
+    assert announcement['content'] == 'live!'
+
+
+class Stop(BaseException):
+    pass
+
+
+def test_consume_fails_bad_entries(db):
+    queue = AnnouncementQueue()
+    db.lpush(queue.QUEUE, 'not json', '{"id": "1"}')
+
+    # Times out once, then pops until the queue is empty
+    popped = [None]
+    pop = queue.pop
+    def pop_once(sender_id):
+        if popped:
+            return popped.pop()
+        if not db.llen(queue.QUEUE):
+            raise Stop()
+        return pop(sender_id, timeout=1)
+    queue.pop = pop_once
+
+    sender = Sender(queue)
+    with pytest.raises(Stop):
+        sender.consume()
+
+    assert db.lrange(queue.FAILED, 0, -1) == ['{"id": "1"}', 'not json']
+    assert db.llen(queue.processing_key(sender.id)) == 0
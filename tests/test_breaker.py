@@ -0,0 +1,117 @@
+import gevent
+import pytest
+
+from mee6.exceptions import CircuitOpenException
+from mee6.utils.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from mee6.utils.clock import VirtualClock
+
+
+@pytest.fixture
+def clock():
+    return VirtualClock()
+
+
+def make_breaker(clock, **kwargs):
+    return CircuitBreaker('channels', 'api', clock=clock, **kwargs)
+
+
+def request(breaker, success=True, latency=0.1):
+    probe = breaker.acquire()
+    breaker.release(success, latency, probe)
+
+
+def test_opened_by_consecutive_failures(clock):
+    breaker = make_breaker(clock, failure_threshold=3, reset_timeout=10)
+
+    request(breaker, success=False)
+    request(breaker, success=False)
+    request(breaker)
+    request(breaker, success=False)
+    request(breaker, success=False)
+    assert breaker.state == CLOSED
+
+    request(breaker, success=False)
+    assert breaker.state == OPEN
+
+    clock.now += 4
+    with pytest.raises(CircuitOpenException) as e:
+        breaker.acquire()
+    assert (e.value.reason, e.value.retry_after) == ('open', 6)
+
+
+def test_half_open_probe(clock):
+    breaker = make_breaker(clock, failure_threshold=1, reset_timeout=10)
+    request(breaker, success=False)
+
+    # A single probe once the timeout is over
+    clock.now += 10
+    assert breaker.acquire() is True
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenException):
+        breaker.acquire()
+
+    # Failed, open again for another timeout
+    breaker.release(False, probe=True)
+    assert breaker.state == OPEN
+    clock.now += 9
+    with pytest.raises(CircuitOpenException):
+        breaker.acquire()
+
+    clock.now += 1
+    request(breaker)
+    assert breaker.state == CLOSED
+    assert breaker.acquire() is False
+
+
+def test_limit_halved(clock):
+    breaker = make_breaker(clock, latency_target=1., initial_limit=20,
+                           min_limit=2)
+
+    request(breaker, success=False)
+    assert breaker.limit == 10
+
+    # At most once per latency target
+    request(breaker, latency=2.)
+    assert breaker.limit == 10
+
+    clock.now += 1
+    request(breaker, latency=2.)
+    assert breaker.limit == 5
+
+    for _ in range(3):
+        clock.now += 1
+        request(breaker, success=False)
+    assert breaker.limit == 2
+
+
+def test_limit_increased(clock):
+    breaker = make_breaker(clock, initial_limit=10, max_limit=11)
+
+    # By one per `limit` fast requests
+    for _ in range(10):
+        request(breaker)
+    assert int(breaker.limit) == 10
+    request(breaker)
+    assert int(breaker.limit) == 11
+
+    for _ in range(20):
+        request(breaker)
+    assert breaker.limit == 11
+
+
+def test_waits_for_a_slot(clock):
+    breaker = make_breaker(clock, initial_limit=1, max_limit=1,
+                           max_wait=0.01)
+    breaker.acquire()
+
+    waiting = gevent.spawn(breaker.acquire)
+    gevent.sleep(0)
+    breaker.release(True, 0.1)
+    assert waiting.get(timeout=1) is False
+    assert breaker.in_flight == 1
+
+    # No slot freed up in time
+    with pytest.raises(CircuitOpenException) as e:
+        breaker.acquire()
+    assert e.value.reason == 'overloaded'
+    assert not breaker.waiters
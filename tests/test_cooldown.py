@@ -0,0 +1,70 @@
+import pytest
+
+from mee6.command.cooldown import CooldownEngine
+from mee6.utils.redis import PrefixedRedis
+from time import time
+
+
+@pytest.fixture
+def engine(db):
+    return CooldownEngine(PrefixedRedis(db, 'cooldown.'))
+
+
+def test_all_keys_armed(engine, db):
+    assert engine.acquire([('a', 10), ('b', 20)])
+
+    assert 0 < db.ttl('cooldown.a') <= 10
+    assert 10 < db.ttl('cooldown.b') <= 20
+
+    # Rejected by redis in another process
+    other = CooldownEngine(PrefixedRedis(db, 'cooldown.'))
+    assert not other.acquire([('b', 20)])
+
+
+def test_none_armed_if_one_cooling(engine, db):
+    db.set('cooldown.b', 1, ex=30)
+
+    assert not engine.acquire([('a', 10), ('b', 10), ('c', 10)])
+
+    assert db.get('cooldown.a') is None
+    assert db.get('cooldown.c') is None
+    assert 20 < db.ttl('cooldown.b') <= 30
+
+
+def test_cooling_keys_rejected_locally(engine, db):
+    assert engine.acquire([('a', 10)])
+
+    def script(*args, **kwargs):
+        raise AssertionError('redis was called')
+    engine._script = script
+
+    assert not engine.acquire([('a', 10)])
+    assert not engine.acquire([('b', 10), ('a', 10)])
+
+    # Expired locally, redis is asked again
+    engine._cooling['a'] = time() - 1
+    with pytest.raises(AssertionError):
+        engine.acquire([('a', 10)])
+    assert 'a' not in engine._cooling
+
+
+def test_redis_rejection_remembered(engine, db):
+    db.set('cooldown.a', 1, ex=30)
+
+    assert not engine.acquire([('a', 10)])
+
+    assert 20 < engine._cooling['a'] - time() <= 30
+
+
+def test_cache_pruned(db):
+    engine = CooldownEngine(PrefixedRedis(db, 'cooldown.'), max_cached_keys=3)
+    engine._cooling = {'expired': time() - 1, 'a': time() + 10,
+                       'b': time() + 10}
+
+    # The expired keys make room
+    assert engine.acquire([('c', 10)])
+    assert sorted(engine._cooling) == ['a', 'b', 'c']
+
+    # Full of live keys, started over
+    assert engine.acquire([('d', 10)])
+    assert sorted(engine._cooling) == ['d']
@@ -0,0 +1,63 @@
+import pytest
+
+from mee6.discord.api import destinations
+from mee6.discord.api.destinations import DeadDestinations
+from mee6.exceptions import DeadDestinationException
+
+
+class Error:
+
+    def __init__(self, status_code, error_code=None):
+        self.status_code = status_code
+        self.error_code = error_code
+
+
+@pytest.fixture
+def now(monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr(destinations, 'time', lambda: now[0])
+    return now
+
+
+def is_dead(dead, kind, destination_id):
+    try:
+        dead.check(kind, destination_id)
+    except DeadDestinationException:
+        return True
+    return False
+
+
+@pytest.mark.parametrize('status_code, error_code, marked', [
+    (404, 10003, True),
+    # Missing Access
+    (403, 50001, True),
+    # Missing Permissions, Cannot send an empty message
+    (403, 50013, False),
+    (400, 50006, False),
+    (500, None, False),
+])
+def test_mark_channel(now, status_code, error_code, marked):
+    dead = DeadDestinations(ttl=600)
+    dead.mark_channel(42, Error(status_code, error_code))
+
+    assert is_dead(dead, 'channel', '42') == marked
+
+
+def test_ttl_and_revive(now):
+    dead = DeadDestinations(ttl=600)
+    dead.mark('channel', 1, 404)
+    dead.mark('webhooks', 1, 403)
+    dead.mark('channel', 2, 404)
+
+    now[0] += 599
+    assert is_dead(dead, 'channel', 1)
+    assert is_dead(dead, 'webhooks', 1)
+
+    dead.revive('channel', 1)
+    assert not is_dead(dead, 'channel', 1)
+    assert is_dead(dead, 'webhooks', 1)
+
+    now[0] += 1
+    assert not is_dead(dead, 'channel', 2)
+    assert not is_dead(dead, 'webhooks', 1)
+    assert dead.dead == {}
@@ -0,0 +1,102 @@
+import json
+
+from mee6.indexes import IndexVerifier
+from mee6.plugin import Plugin
+
+
+class Follows(Plugin):
+    id = 'follows'
+    name = 'Follows'
+
+    def get_default_config(self, guild_id):
+        return {'names': []}
+
+    def get_config_indexes(self, guild_id, config):
+        return {self.index_key(name) for name in config['names']}
+
+    def get_index_patterns(self):
+        return [self.index_key('*')]
+
+    def index_key(self, name):
+        return 'plugin.follows.name.{}.guilds'.format(name)
+
+
+def setup_guild(db, guild_id, names, enabled=True):
+    db.set('plugin.follows.config.{}'.format(guild_id),
+           json.dumps({'names': names}))
+    if enabled:
+        db.sadd('plugin.Follows.guilds', guild_id)
+
+
+def test_verify_and_fix(db):
+    plugin = Follows(in_bot=False)
+    setup_guild(db, '1', ['a', 'b'])
+    setup_guild(db, '2', ['a'], enabled=False)
+    setup_guild(db, '3', ['d'], enabled=False)
+    # b is missing, c is stale, 2 is disabled
+    db.sadd(plugin.index_key('a'), '1', '2')
+    db.sadd(plugin.index_key('c'), '1')
+
+    stats = IndexVerifier(plugin, batch_size=2).run()
+    assert (stats['missing'], stats['stale'], stats['disabled']) == (1, 1, 1)
+    assert db.smembers(plugin.index_key('a')) == {'1', '2'}
+
+    IndexVerifier(plugin, fix=True).run()
+    assert db.smembers(plugin.index_key('a')) == {'1'}
+    assert db.smembers(plugin.index_key('b')) == {'1'}
+    assert not db.exists(plugin.index_key('c'))
+    assert not db.exists(plugin.index_key('d'))
+
+    stats = IndexVerifier(plugin).run()
+    assert (stats['missing'], stats['stale'], stats['disabled']) == (0, 0, 0)
+
+
+def test_enable_indexes_guild(db):
+    plugin = Follows(in_bot=False)
+    setup_guild(db, '1', ['a', 'b'], enabled=False)
+
+    plugin.enable('1')
+    assert db.smembers(plugin.index_key('a')) == {'1'}
+    assert db.smembers(plugin.index_key('b')) == {'1'}
+
+    plugin.disable('1')
+    assert not db.exists(plugin.index_key('a'))
+    assert not db.exists(plugin.index_key('b'))
+
+
+def test_patch_writes_index_diff(db):
+    plugin = Follows(in_bot=False)
+    setup_guild(db, '1', ['a', 'b'])
+    db.sadd(plugin.index_key('a'), '1')
+
+    config = plugin.patch_config('1', {'names': ['b', 'c']})
+
+    assert config == {'names': ['b', 'c']}
+    assert not db.exists(plugin.index_key('a'))
+    assert db.smembers(plugin.index_key('c')) == {'1'}
+    # b was followed before already, it isn't written
+    assert not db.exists(plugin.index_key('b'))
+
+
+def test_patch_retried_on_concurrent_change(db):
+    plugin = Follows(in_bot=False)
+    setup_guild(db, '1', ['a'])
+    db.sadd(plugin.index_key('a'), '1')
+
+    seen = []
+    def before_config_patch(guild_id, old_config, new_config):
+        seen.append(old_config['names'])
+        if len(seen) == 1:
+            # Another patch lands during the transaction
+            setup_guild(db, '1', ['b'])
+            db.srem(plugin.index_key('a'), '1')
+            db.sadd(plugin.index_key('b'), '1')
+    plugin.before_config_patch = before_config_patch
+
+    plugin.patch_config('1', {'names': ['c']})
+
+    assert seen == [['a'], ['b']]
+    assert json.loads(db.get('plugin.follows.config.1')) == {'names': ['c']}
+    assert not db.exists(plugin.index_key('a'))
+    assert not db.exists(plugin.index_key('b'))
+    assert db.smembers(plugin.index_key('c')) == {'1'}
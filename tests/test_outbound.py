@@ -0,0 +1,82 @@
+import gevent
+import pytest
+
+from mee6.discord.api.outbound import OutboundMessage, OutboundQueue
+
+
+class Client:
+    """ Records the messages sent, fails if `error` is set """
+
+    def __init__(self):
+        self.sent = []
+        self.error = None
+
+    def send_message(self, channel_id, content, embeds=None, priority=None):
+        if self.error:
+            raise self.error
+        self.sent.append(('channel', channel_id, content, embeds))
+        return len(self.sent)
+
+    def send_webhook_message(self, webhook_id, channel_id, content,
+                             embeds=None, priority=None):
+        self.sent.append(('webhook', channel_id, content, embeds))
+        return len(self.sent)
+
+
+def pack(contents, embeds=0):
+    queue = OutboundQueue(Client(), 0)
+    messages = ([OutboundMessage(content) for content in contents] +
+                [OutboundMessage(None, embed='embed{}'.format(i))
+                 for i in range(embeds)])
+    return [[m.content or m.embed for m in batch]
+            for batch in queue.pack(messages)]
+
+
+def test_contents_packed_up_to_2000_characters():
+    a, b, c = 'a' * 1000, 'b' * 999, 'c' * 1000
+
+    # 1000 + the separator + 999
+    assert pack([a, b, c]) == [[a, b], [c]]
+    assert pack([a, c]) == [[a], [c]]
+    assert pack(['x' * 2500, 'y']) == [['x' * 2500], ['y']]
+
+
+def test_embeds_packed_up_to_10():
+    embeds = ['embed{}'.format(i) for i in range(12)]
+
+    assert pack(['content'], embeds=12) == [['content'] + embeds[:10],
+                                            embeds[10:]]
+
+
+def test_embeds_dont_add_separators():
+    a = 'a' * 2000
+
+    assert pack([a], embeds=2) == [[a, 'embed0', 'embed1']]
+
+
+def test_messages_coalesced():
+    client = Client()
+    queue = OutboundQueue(client, 0.01)
+
+    destination = ('channel', 1, None)
+    results = [queue.put(destination, content) for content in 'abc']
+    webhook = queue.put(('webhook', 'w', 2, None), 'd', embed='embed')
+    gevent.sleep(0.05)
+
+    assert sorted(client.sent) == [('channel', 1, 'a\nb\nc', []),
+                                   ('webhook', 2, 'd', ['embed'])]
+    assert len({result.get() for result in results}) == 1
+    assert webhook.get() in (1, 2)
+
+
+def test_failure_raised_to_every_message():
+    client = Client()
+    client.error = ValueError('failed')
+    queue = OutboundQueue(client, 0.01)
+
+    results = [queue.put(('channel', 1, None), content) for content in 'ab']
+    gevent.sleep(0.05)
+
+    for result in results:
+        with pytest.raises(ValueError):
+            result.get()
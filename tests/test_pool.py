@@ -0,0 +1,62 @@
+import gevent
+import pytest
+
+from gevent.event import Event
+from mee6.utils import pool as pool_module
+from mee6.utils.pool import InstrumentedPool
+
+
+class Stats:
+    """ Records the metrics reported """
+
+    def __init__(self):
+        self.gauges = []
+        self.timings = []
+
+    def gauge(self, metric, value, tags=None):
+        self.gauges.append((metric, value))
+
+    def timing(self, metric, value, tags=None):
+        self.timings.append(metric)
+
+    def last(self, metric):
+        return [value for name, value in self.gauges if name == metric][-1]
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    stats = Stats()
+    monkeypatch.setattr(pool_module, 'statsd', stats)
+    return stats
+
+
+def test_gauges_reported_after_failed_task(stats):
+    pool = InstrumentedPool(2, 'tasks')
+
+    def fail():
+        raise ValueError('failed')
+
+    greenlet = pool.spawn(fail)
+    assert stats.last('tasks.active') == 1
+    greenlet.join()
+
+    assert isinstance(greenlet.exception, ValueError)
+    assert stats.last('tasks.active') == 0
+    assert stats.last('tasks.queued') == 0
+    assert stats.timings == ['tasks.wait', 'tasks.duration']
+
+
+def test_queued_spawns_reported(stats):
+    pool = InstrumentedPool(1, 'tasks')
+    done = Event()
+    pool.spawn(done.wait)
+
+    waiting = gevent.spawn(pool.spawn, lambda: None)
+    gevent.sleep(0)
+    assert stats.last('tasks.queued') == 1
+    assert stats.last('tasks.active') == 1
+
+    done.set()
+    waiting.get().join()
+    assert stats.last('tasks.queued') == 0
+    assert stats.last('tasks.active') == 0
@@ -0,0 +1,39 @@
+import pytest
+
+from benchmarks.ratelimit_sim import SCENARIOS, simulate
+from mee6.discord.api.ratelimit import LocalRatelimit
+
+
+def local_ratelimit(clock):
+    return LocalRatelimit(clock=clock)
+
+
+def run(scenario):
+    stats = simulate(SCENARIOS[scenario](), local_ratelimit)
+    ok = sum(s['ok'] for s in stats.values())
+    rejected = sum(s['429s'] for s in stats.values())
+    duration = (max(s['last_ok'] for s in stats.values()) -
+                min(s['first'] for s in stats.values()))
+    return ok, rejected, ok / duration
+
+
+@pytest.mark.parametrize('scenario, requests, max_429s, rate', [
+    # 50 requests at once on a bucket of 5 requests per 5 seconds
+    ('burst', 50, 219, 1.),
+    # 10 requests/s on the same bucket
+    ('overload', 300, 5131, 1.),
+])
+def test_saturated_bucket(scenario, requests, max_429s, rate):
+    ok, rejected, throughput = run(scenario)
+
+    assert ok == requests
+    assert rejected <= max_429s
+    assert throughput == pytest.approx(rate, rel=0.1)
+
+
+def test_steady_traffic_is_never_limited():
+    ok, rejected, throughput = run('steady')
+
+    assert ok == 120
+    assert rejected == 0
+    assert throughput == pytest.approx(2., rel=0.05)
@@ -0,0 +1,275 @@
+import gevent
+import pytest
+
+from gevent.event import Event
+from mee6.plugins.reddit import Reddit, ShardAnnouncer, get_shard, shard_key
+from mee6.utils import int2base, json
+from mee6.utils.index import ReverseIndex
+from time import time
+
+
+START = int('5abcd', 36)
+
+
+def post(post_id, subreddit='python'):
+    return {'id': post_id, 'subreddit': subreddit, 'title': 'Post ' + post_id,
+            'author': 'someone', 'url': 'https://example.com/' + post_id,
+            'permalink': '/r/{}/{}'.format(subreddit, post_id)}
+
+
+class Feed(Reddit):
+    """ Serves the posts of every id up to `head`, but the `missing` ones,
+    from memory. Records the ids of the posts it announces. """
+
+    def __init__(self, head, missing=()):
+        super(Feed, self).__init__(in_bot=False)
+        self.followers = ReverseIndex()
+        self.followers.set('1', ['python'])
+        self.head = head
+        self.missing = set(missing)
+        self.announced = []
+        # Announcements wait for it to be set, if any
+        self.blocked = None
+
+        # The head is only read from `head`
+        self.HEAD_INTERVAL = float('inf')
+        self.head_checked_at = time()
+        self.head_post_id = self.get_last_post_id()
+
+    def get_window(self, start):
+        end = min(start + self.WINDOW_SIZE, self.head + 1)
+        return [post(int2base(i, 36)) for i in range(start, end)
+                if i not in self.missing]
+
+    def get_last_post_id(self):
+        return int2base(self.head, 36)
+
+    def move_head(self, head):
+        self.head = head
+        self.head_post_id = self.get_last_post_id()
+
+    def announce(self, subreddit, subreddit_posts, guilds_ids=None):
+        if self.blocked is not None:
+            self.blocked.wait()
+        self.announced += [int(p['id'], 36) for p in subreddit_posts]
+        return []
+
+
+class Announcing(Reddit):
+    """ Records the announcements, the guilds of `failing` refuse them """
+
+    def __init__(self):
+        super(Announcing, self).__init__(in_bot=False)
+        self.followers = ReverseIndex()
+        self.sent = []
+        self.failing = set()
+
+    def send_announcement(self, guild, channel_id, content, embeds=None,
+                          webhook_id=None, key=None):
+        if str(guild.id) in self.failing:
+            return False
+        self.sent.append((str(guild.id), key))
+        return True
+
+
+@pytest.fixture
+def announcer(db):
+    announcer = ShardAnnouncer(Announcing())
+    announcer.RETRY_DELAY = 0
+    announcer.plugin.followers.set('1', ['python'], 'c1')
+    announcer.plugin.followers.set('2', ['python'], 'c2')
+    return announcer
+
+
+@pytest.fixture
+def few_shards(monkeypatch):
+    from mee6.plugins import reddit
+    monkeypatch.setattr(reddit, 'SHARDS', 4)
+
+
+def process(announcer, batch):
+    """ Pops the batch like consume """
+    shard = get_shard(batch['subreddit'])
+    data = json.dumps(batch)
+    announcer.db.lpush(announcer.processing_key(shard), data)
+    return shard, data
+
+
+def test_announced_batch_acked(announcer):
+    shard, data = process(announcer, {'subreddit': 'python',
+                                      'posts': [post('a1')]})
+
+    announcer.announce(shard, data)
+
+    assert sorted(announcer.plugin.sent) == [('1', 'reddit:1:a1'),
+                                             ('2', 'reddit:2:a1')]
+    assert announcer.db.llen(announcer.processing_key(shard)) == 0
+
+
+def test_failed_guilds_retried(announcer):
+    announcer.plugin.failing = {'2'}
+    shard, data = process(announcer, {'subreddit': 'python',
+                                      'posts': [post('a1')]})
+
+    announcer.announce(shard, data)
+    gevent.sleep(0.01)
+
+    # Queued again for the failed guild only
+    assert announcer.db.llen(announcer.processing_key(shard)) == 0
+    retry = json.loads(announcer.db.rpop(shard_key(shard)))
+    assert (retry['guilds'], retry['attempts']) == (['2'], 1)
+
+    announcer.plugin.failing = set()
+    announcer.plugin.sent = []
+    shard, data = process(announcer, retry)
+    announcer.announce(shard, data)
+    assert announcer.plugin.sent == [('2', 'reddit:2:a1')]
+
+
+def test_failed_batch_dead_lettered(announcer):
+    announcer.plugin.failing = {'1', '2'}
+    batch = {'subreddit': 'python', 'posts': [post('a1')],
+             'attempts': announcer.MAX_ATTEMPTS - 1}
+    shard, data = process(announcer, batch)
+
+    announcer.announce(shard, data)
+
+    assert announcer.db.llen(announcer.processing_key(shard)) == 0
+    assert announcer.db.lrange(announcer.FAILED, 0, -1) == [data]
+
+    shard, data = process(announcer, {'subreddit': 'python'})
+    announcer.announce(shard, data)
+    assert announcer.db.lindex(announcer.FAILED, 0) == data
+
+
+def test_shards_shared(announcer, few_shards):
+    assert announcer.balance()
+    assert announcer.shards == {0, 1, 2, 3}
+
+    # None are free until the first one releases its extra shards
+    other = ShardAnnouncer(Announcing())
+    assert not other.balance()
+    assert announcer.balance()
+    assert other.balance()
+
+    assert len(announcer.shards) == len(other.shards) == 2
+    assert announcer.shards | other.shards == {0, 1, 2, 3}
+
+
+def test_dead_announcer_batches_recovered(announcer, few_shards):
+    announcer.balance()
+    announcer.update_shards()
+    announcer.plugin.publish({'python': [post('a1')]})
+    shard, data = announcer.pop()
+    assert shard == get_shard('python')
+
+    # Dies before announcing it, its heartbeat and leases expire
+    announcer.db.zrem(announcer.ANNOUNCERS, announcer.id)
+    for lease in range(4):
+        announcer.db.delete(announcer.lease_key(lease))
+
+    other = ShardAnnouncer(Announcing())
+    other.plugin.followers.set('1', ['python'], 'c1')
+    assert other.balance()
+    other.update_shards()
+    assert other.shards == {0, 1, 2, 3}
+
+    # Queued back and announced by the new owner
+    assert other.pop() == (shard, data)
+    other.announce(shard, data)
+    assert other.plugin.sent == [('1', 'reddit:1:a1')]
+    assert other.db.llen(other.processing_key(shard)) == 0
+
+    # Back, the former owner finds its leases taken
+    assert announcer.balance()
+    announcer.update_shards()
+    assert announcer.shards == set()
+    assert announcer.pop() == (None, None)
+
+
+def test_publish_trims_backlog(db, monkeypatch):
+    from mee6.plugins import reddit
+    stats = []
+    monkeypatch.setattr(reddit.statsd, 'increment',
+                        lambda metric, value=1, **kwargs: stats.append((metric,
+                                                                       value)))
+    plugin = Reddit(in_bot=False)
+    plugin.MAX_SHARD_BACKLOG = 2
+
+    for i in range(3):
+        plugin.publish({'python': [post(str(i))]})
+
+    key = shard_key(get_shard('python'))
+    assert [json.loads(data)['posts'][0]['id']
+            for data in db.lrange(key, 0, -1)] == ['2', '1']
+    assert ('reddit.trimmed_batches', 1) in stats
+
+
+def run_ticks(feed, count=None):
+    """ Ticks like loop until caught up, or `count` times, returns the
+    windows after each tick """
+    windows = []
+    while feed.get_lag() > 0 if count is None else len(windows) < count:
+        feed.adapt_windows(feed.tick(feed.windows))
+        windows.append(feed.windows)
+    gevent.sleep(0)
+    return windows
+
+
+def test_windows_grow_while_behind(db):
+    feed = Feed(head=START + 2000)
+    feed.last_post_id = int2base(START, 36)
+
+    assert run_ticks(feed) == [2, 4, 8, 8, 7]
+    assert feed.announced == list(range(START + 1, START + 2001))
+
+    # Shrink one at a time once caught up
+    assert run_ticks(feed, 7) == [6, 5, 4, 3, 2, 1, 1]
+
+
+def test_empty_windows_skipped(db):
+    # Deleted or private posts leave ids without posts
+    feed = Feed(head=START + 1000, missing=range(START + 1, START + 301))
+    feed.last_post_id = int2base(START, 36)
+
+    run_ticks(feed)
+
+    assert feed.announced == list(range(START + 301, START + 1001))
+
+
+def test_resume_from_checkpoint(db):
+    feed = Feed(head=START)
+    feed.resume()
+    assert feed.last_post_id == int2base(START, 36)
+
+    feed.move_head(START + 300)
+    run_ticks(feed, 1)
+    feed.checkpoint()
+    assert db.get('plugin.reddit.last_post_id') == int2base(START + 100, 36)
+
+    # A tick still announcing holds the checkpoint back, as do the ticks
+    # after it
+    blocked = feed.blocked = Event()
+    run_ticks(feed, 1)
+    feed.blocked = None
+    run_ticks(feed, 1)
+    assert feed.last_post_id == int2base(START + 300, 36)
+    assert db.get('plugin.reddit.last_post_id') == int2base(START + 100, 36)
+
+    # Restarted before those announcements were sent, they aren't missed
+    restarted = Feed(head=START + 300)
+    restarted.resume()
+    assert restarted.last_post_id == int2base(START + 100, 36)
+    run_ticks(restarted)
+    assert restarted.announced == list(range(START + 101, START + 301))
+    blocked.set()
+
+
+def test_resume_catch_up_capped(db):
+    db.set('plugin.reddit.last_post_id', int2base(START, 36))
+
+    feed = Feed(head=START + 5000)
+    feed.MAX_CATCH_UP = 1000
+    feed.resume()
+
+    assert feed.last_post_id == int2base(START + 4000, 36)
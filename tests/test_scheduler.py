@@ -0,0 +1,91 @@
+import gevent
+import pytest
+
+from mee6.discord.api.scheduler import (ANNOUNCEMENT, BACKGROUND, INTERACTIVE,
+                                        PriorityScheduler)
+from mee6.utils.clock import VirtualClock
+
+
+@pytest.fixture
+def clock():
+    return VirtualClock()
+
+
+def drain(scheduler, priority):
+    """ Takes tokens until the class has to wait, returns how many """
+    taken = 0
+    while scheduler.try_acquire(priority) == 0:
+        taken += 1
+    return taken
+
+
+def test_reserves(clock):
+    scheduler = PriorityScheduler(rate=10, clock=clock)
+
+    # Half the bucket is left to the others, a fifth to interactive traffic
+    assert drain(scheduler, BACKGROUND) == 5
+    assert drain(scheduler, ANNOUNCEMENT) == 3
+    assert drain(scheduler, INTERACTIVE) == 2
+
+    # Waits until the reserve is refilled, at `rate` tokens per second
+    assert scheduler.try_acquire(BACKGROUND) == pytest.approx(0.6)
+    clock.now += 0.6
+    assert drain(scheduler, BACKGROUND) == 1
+    assert drain(scheduler, ANNOUNCEMENT) == 3
+
+    # Never more than the bucket
+    clock.now += 60
+    assert drain(scheduler, INTERACTIVE) == 10
+
+
+def test_more_urgent_waiting(clock):
+    scheduler = PriorityScheduler(rate=10, clock=clock)
+    scheduler.waiting[INTERACTIVE] = 1
+
+    assert scheduler.try_acquire(ANNOUNCEMENT) > 0
+    assert scheduler.try_acquire(BACKGROUND) > 0
+    assert scheduler.try_acquire(INTERACTIVE) == 0
+
+
+def test_promotion():
+    scheduler = PriorityScheduler(rate=10, clock=VirtualClock())
+    scheduler.AGING = 5
+
+    assert scheduler.promote(BACKGROUND, 4) == BACKGROUND
+    assert scheduler.promote(BACKGROUND, 5) == ANNOUNCEMENT
+    assert scheduler.promote(BACKGROUND, 60) == ANNOUNCEMENT
+    assert scheduler.promote(ANNOUNCEMENT, 60) == ANNOUNCEMENT
+    assert scheduler.promote(INTERACTIVE, 60) == INTERACTIVE
+
+
+def background_wait(clock, aging):
+    """ Returns how long a background request waits behind a flow of
+    announcements lasting 30 seconds """
+    scheduler = PriorityScheduler(rate=10, clock=clock)
+    scheduler.AGING = aging
+
+    def announce():
+        while clock.time() < 30:
+            scheduler.acquire(ANNOUNCEMENT)
+
+    waits = []
+
+    def background():
+        clock.sleep(1)
+        start = clock.time()
+        scheduler.acquire(BACKGROUND)
+        waits.append(clock.time() - start)
+
+    greenlets = [gevent.spawn(announce), gevent.spawn(background)]
+    clock.run(greenlets)
+    assert scheduler.waiting == {INTERACTIVE: 0, ANNOUNCEMENT: 0,
+                                 BACKGROUND: 0}
+    return waits[0]
+
+
+def test_background_not_starved(clock):
+    assert background_wait(clock, aging=5) == pytest.approx(5, abs=0.5)
+
+
+def test_background_starved_without_aging(clock):
+    assert background_wait(clock, aging=float('inf')) >= 29
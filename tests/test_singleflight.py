@@ -0,0 +1,74 @@
+import gevent
+
+from gevent.event import Event
+from mee6.discord.api.singleflight import InterruptedCall, SingleFlight
+
+
+def spawn_callers(flights, fn, count=3, ttl=0):
+    greenlets = [gevent.spawn(flights.do, 'key', fn, ttl=ttl)
+                 for _ in range(count)]
+    gevent.sleep(0)
+    return greenlets
+
+
+def test_calls_collapsed():
+    flights = SingleFlight()
+    done = Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        done.wait()
+        return 'result'
+
+    greenlets = spawn_callers(flights, fetch)
+    done.set()
+    gevent.joinall(greenlets)
+
+    assert [g.value for g in greenlets] == ['result'] * 3
+    assert len(calls) == 1
+    assert flights.calls == {}
+
+
+def test_failure_raised_to_waiters():
+    flights = SingleFlight()
+    done = Event()
+
+    def fetch():
+        done.wait()
+        raise ValueError('failed')
+
+    greenlets = spawn_callers(flights, fetch)
+    done.set()
+    gevent.joinall(greenlets)
+
+    assert [type(g.exception) for g in greenlets] == [ValueError] * 3
+    assert flights.calls == {}
+
+    # Not remembered, the next call is done again
+    assert flights.do('key', lambda: 'result') == 'result'
+
+
+def test_killed_call_interrupts_waiters():
+    flights = SingleFlight()
+
+    greenlets = spawn_callers(flights, Event().wait)
+    greenlets[0].kill()
+    gevent.joinall(greenlets)
+
+    assert [type(g.exception) for g in greenlets[1:]] == [InterruptedCall] * 2
+    assert flights.calls == {}
+
+
+def test_result_cached():
+    flights = SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return len(calls)
+
+    assert flights.do('key', fetch, ttl=60) == 1
+    assert flights.do('key', fetch, ttl=60) == 1
+    assert flights.do('other', fetch) == 2
+    assert flights.do('other', fetch) == 3
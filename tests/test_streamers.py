@@ -0,0 +1,177 @@
+import pytest
+import threading
+
+from benchmarks.standins.twitch import TwitchStandin
+from mee6.discord import MessageTemplate
+from mee6.plugins.streamers import LiveStreams, Streamers
+from mee6.utils.index import ReverseIndex
+
+
+FOLLOWED = 250
+
+
+class Storage(dict):
+    """ Keeps the live streams checkpoint in memory """
+
+    def set(self, key, value):
+        self[key] = value
+
+
+class GuildStorage:
+    """ Records the streams announced to a guild """
+
+    def __init__(self):
+        self.announced = {}
+
+    def zadd(self, key, mapping):
+        self.announced.update(mapping)
+
+    def zremrangebyscore(self, key, min, max): pass
+
+    def expire(self, key, ttl): pass
+
+    def ttl(self, key):
+        return -2
+
+
+class Guild:
+
+    def __init__(self, id):
+        self.id = id
+        self.storage = GuildStorage()
+
+
+class PollingStreamers(Streamers):
+    """ Polls the stand-in for the streamers guild `i` follows, `streamer<i>`,
+    and records the streams it would announce. Sends fail if `sends_fail`.
+    """
+
+    def __init__(self, api_url):
+        self.TWITCH_API_URL = api_url
+        self.twitch_users = {}
+        self.twitch_followers = ReverseIndex()
+        for i in range(FOLLOWED):
+            self.twitch_followers.set(str(i), ['streamer{}'.format(i)])
+        self.twitch_followers.set('unknown', ['nobody_streams'])
+
+        self.live_streams = {'twitch': LiveStreams(Storage(), 'live_streams')}
+        self.collected = []
+        self.guilds = {}
+        self.sends_fail = False
+
+    def collect_stream(self, platform, stream_id, embed, guilds_ids, pending):
+        self.collected.append((embed.author_name, sorted(guilds_ids)))
+
+        template = MessageTemplate([embed])
+        for guild_id in guilds_ids:
+            guild = self.guilds.setdefault(guild_id, Guild(guild_id))
+            _, items = pending.setdefault((guild_id, guild_id), (guild, []))
+            items.append((stream_id, embed.author_name, template))
+
+    def send_announcements(self, announcements):
+        return [not self.sends_fail] * len(announcements)
+
+    def run_pass(self):
+        """ twitch_loop's pass """
+        self.collected = []
+        pending = {}
+        complete = self.poll_twitch_streams(pending)
+        self.announce_pending('twitch', pending)
+        self.commit_live_streams('twitch', complete)
+
+
+@pytest.fixture(scope='module')
+def standin():
+    # Who is live doesn't change during the tests
+    standin = TwitchStandin(latency=0, users=1000, live_ratio=0.2,
+                            period=10 ** 9)
+    servers = []
+    started = threading.Event()
+
+    # The stand-in runs on the hub of its own thread, the plugin's requests
+    # block the main one
+    def serve():
+        servers.append(standin.serve(port=0))
+        started.set()
+        servers[0].serve_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    started.wait(5)
+    standin.url = 'http://127.0.0.1:{}/kraken'.format(servers[0].server_port)
+    return standin
+
+
+def test_poll_pass(standin):
+    streamers = PollingStreamers(standin.url)
+
+    streamers.poll_twitch_streams({})
+    streamers.commit_live_streams('twitch')
+
+    live = [i for i in range(FOLLOWED) if standin.is_live(i)]
+    assert live
+    assert sorted(streamers.collected) == sorted(
+        ('Streamer{}'.format(i), [str(i)]) for i in live)
+    assert streamers.twitch_users['nobody_streams'] is None
+
+    # Still live at the next pass, nothing to announce
+    streamers.collected = []
+    streamers.poll_twitch_streams({})
+    streamers.commit_live_streams('twitch')
+    assert streamers.collected == []
+
+
+def test_incomplete_pass(standin):
+    streamers = PollingStreamers(standin.url)
+    streamers.poll_twitch_streams({})
+    streamers.commit_live_streams('twitch')
+
+    live = streamers.get_live_streams('twitch')
+    announced = set(live.previous)
+
+    # The chunk of streamer0..99 fails, their streams didn't go offline
+    fetch = streamers.get_followed_twitch_streams
+    streamers.get_followed_twitch_streams = lambda users_ids: (
+        None if '1000' in users_ids else fetch(users_ids))
+    assert not streamers.poll_twitch_streams({})
+    streamers.commit_live_streams('twitch', complete=False)
+    assert live.previous == announced
+
+    # Nor did they go live again once the chunk is back
+    streamers.get_followed_twitch_streams = fetch
+    streamers.collected = []
+    assert streamers.poll_twitch_streams({})
+    streamers.commit_live_streams('twitch')
+    assert streamers.collected == []
+
+
+def test_fanout_from_index(standin):
+    streamers = PollingStreamers(standin.url)
+    i = next(i for i in range(FOLLOWED) if standin.is_live(i))
+    login = 'streamer{}'.format(i)
+    streamers.twitch_followers.set('other', [login, 'streamer_offline'])
+    streamers.twitch_followers.set('disabled', [login])
+    streamers.update_index('disabled', [])
+
+    streamers.poll_twitch_streams({})
+
+    assert ('Streamer{}'.format(i), [str(i), 'other']) in streamers.collected
+    assert not any('disabled' in guilds for _, guilds in streamers.collected)
+
+
+def test_failed_announcements_retried(standin):
+    streamers = PollingStreamers(standin.url)
+    streamers.sends_fail = True
+    streamers.run_pass()
+    failed = sorted(streamers.collected)
+    assert failed
+    assert not any(guild.storage.announced
+                   for guild in streamers.guilds.values())
+
+    # Announced again at the next pass, then remembered
+    streamers.sends_fail = False
+    streamers.run_pass()
+    assert sorted(streamers.collected) == failed
+    assert all(guild.storage.announced for guild in streamers.guilds.values())
+
+    streamers.run_pass()
+    assert streamers.collected == []
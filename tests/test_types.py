@@ -0,0 +1,143 @@
+import pytest
+
+from mee6.exceptions import ValidationError
+from mee6.types.model import (Boolean, Integer, List, Model, ModelField,
+                              Snowflake, String)
+
+
+class Author(Model):
+    id = Snowflake(required=True)
+    name = String()
+
+
+class Post(Model):
+    id = Snowflake(required=True)
+    score = Integer(default=0)
+    title = String()
+    pinned = Boolean(default=False)
+    author = ModelField(Author)
+    editors = List(ModelField(Author), default=[])
+    tags_ids = List(Snowflake())
+
+
+def test_fields_coerced():
+    post = Post(id='123', score='5', title='Hello', pinned=True,
+                tags_ids=['1', '2'])
+
+    assert post.id == 123
+    assert post.score == 5
+    assert post.title == 'Hello'
+    assert post.pinned is True
+    assert post.tags_ids == [1, 2]
+
+
+def test_defaults():
+    post = Post(id='1')
+
+    assert post.score == 0
+    assert post.pinned is False
+    assert post.editors == []
+    assert post.title is None
+    assert post.author is None
+
+    # Empty values are kept as they are
+    assert Post(id='1', score=0, title='').score == 0
+    assert Post(id='1', title='').title == ''
+
+
+def test_strict_errors():
+    with pytest.raises(ValidationError) as e:
+        Post(strict=True, score='many', title=5, pinned='yes',
+             tags_ids=['1', 'x', str(2 ** 64)])
+
+    assert e.value.errors == {'id': ['This field is required'],
+                              'score': ['This is not an integer'],
+                              'title': ['This is not a string'],
+                              'pinned': ['This is not a valid boolean'],
+                              'tags_ids': ['This is not a snowflake id',
+                                           'This is not a snowflake id']}
+
+
+def test_lenient_not_checked():
+    post = Post(id='1', title=5, pinned='yes')
+
+    assert (post.title, post.pinned) == (5, 'yes')
+
+
+def test_strict_default(monkeypatch):
+    monkeypatch.setattr(Model, 'strict', True)
+
+    with pytest.raises(ValidationError):
+        Post(title='Hello')
+    assert Post(strict=False, title='Hello').title == 'Hello'
+
+
+@pytest.mark.parametrize('strict', [True, False])
+def test_unknown_keys_ignored(strict):
+    post = Post(strict=strict, id='1', flags=3)
+
+    assert post.id == 1
+    assert not hasattr(post, 'flags')
+    assert 'flags' not in post.serialize()
+
+
+def test_nested_models():
+    post = Post(id='1', author={'id': '2', 'name': 'Alice'},
+                editors=[{'id': '3'}, Author(id='4')])
+
+    assert isinstance(post.author, Author)
+    assert (post.author.id, post.author.name) == (2, 'Alice')
+    assert [editor.id for editor in post.editors] == [3, 4]
+    assert post.serialize()['editors'] == [{'id': 3, 'name': None},
+                                           {'id': 4, 'name': None}]
+
+
+def test_nested_strict_errors():
+    with pytest.raises(ValidationError) as e:
+        Post(strict=True, id='1', author={'name': 'Alice'},
+             editors=[{'id': '3'}, {'id': 'x'}, 'Bob'])
+
+    assert e.value.errors == {
+        'author': [{'id': ['This field is required']}],
+        'editors': [{'id': ['This is not a snowflake id']},
+                    'This is not a valid Author']}
+
+
+def test_validate():
+    post = Post(id='1')
+    post.title = 5
+
+    with pytest.raises(ValidationError) as e:
+        post.validate()
+    assert e.value.errors == {'title': ['This is not a string']}
+
+
+def test_api_validation_error(db, monkeypatch):
+    import mee6.utils
+    from mee6.plugins.reddit import Reddit
+
+    # The API turns strict mode on, for the dashboard payloads, and loads
+    # every plugin on import
+    reddit = Reddit(in_bot=False)
+    monkeypatch.setattr(Model, 'strict', Model.strict)
+    monkeypatch.setattr(mee6.utils, 'get_plugins', lambda **kwargs: [reddit])
+    from mee6.api import api
+    monkeypatch.setattr(api, 'plugins', [reddit])
+
+    class Config(Model):
+        subreddits = List(String(), required=True)
+
+    monkeypatch.setattr(reddit, 'validate_config',
+                        lambda guild_id, config: Config(**config).serialize())
+
+    client = api.app.test_client()
+    r = client.patch('/guilds/1/plugins/reddit/config',
+                     json={'subreddits': ['python', 5]})
+
+    assert r.status_code == 400
+    assert r.get_json() == {'errors': {'subreddits': ['This is not a string']}}
+
+    r = client.patch('/guilds/1/plugins/reddit/config',
+                     json={'subreddits': ['python']})
+    assert r.status_code == 200
+    assert r.get_json()['subreddits'] == ['python']
@@ -0,0 +1,123 @@
+from mee6.discord.api.client import APIClient
+from mee6.discord.api.webhooks import WebhookRegistry
+from mee6.types import Webhook
+
+
+class Ratelimit:
+    """ Buckets reset at `resets[route]`, None if not exhausted """
+
+    def __init__(self, resets=None):
+        self.resets = resets or {}
+        self.lookups = []
+
+    def get_reset(self, route):
+        self.lookups.append(route)
+        return self.resets.get(route)
+
+
+def make_client(db, pool_size, resets=None):
+    api = APIClient()
+    api.webhooks = WebhookRegistry(db, pool_size)
+    api.http.ratelimit = Ratelimit(resets)
+
+    created = api.created = []
+    def create_webhook(webhook_id, channel_id, slot, priority=None):
+        webhook = Webhook(id=str(100 + slot), token='new')
+        created.append(slot)
+        return api.webhooks.add(webhook_id, slot, webhook)
+    api.create_webhook = create_webhook
+    return api
+
+
+def route(webhook_id, token):
+    return 'webhooks/{}/{}?wait=true'.format(webhook_id, token)
+
+
+def test_single_webhook_skips_ratelimit(db):
+    db.set('webhooks.timers:1', '10.token')
+    api = make_client(db, 1, {route(10, 'token'): 5.})
+
+    slot, webhook = api.pick_webhook('timers:1', 1)
+
+    assert (slot, webhook.id, api.http.ratelimit.lookups) == (0, 10, [])
+
+
+def test_single_webhook_created(db):
+    api = make_client(db, 1)
+
+    slot, webhook = api.pick_webhook('timers:1', 1)
+
+    assert (slot, webhook.id, api.created) == (0, 100, [0])
+    assert db.get('webhooks.timers:1') == '100.new'
+
+
+def test_pool_grows_when_limited(db):
+    db.set('webhooks.timers:1', '10.token')
+    api = make_client(db, 3, {route(10, 'token'): 5.})
+
+    slot, webhook = api.pick_webhook('timers:1', 1)
+
+    # Only the known webhook's bucket is looked up
+    assert (slot, webhook.id, api.created) == (1, 101, [1])
+    assert api.http.ratelimit.lookups == [route(10, 'token')]
+
+
+def test_pool_picks_earliest_reset(db):
+    db.set('webhooks.timers:1', '10.token')
+    db.set('webhooks.timers:1.1', '11.token')
+    api = make_client(db, 2, {route(10, 'token'): 5., route(11, 'token'): 3.})
+
+    slot, webhook = api.pick_webhook('timers:1', 1)
+
+    assert (slot, webhook.id, api.created) == (1, 11, [])
+
+
+class Response:
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+def test_concurrent_add_keeps_first(db):
+    first, second = WebhookRegistry(db), WebhookRegistry(db)
+    assert first.get('timers:1') is second.get('timers:1') is None
+
+    assert first.add('timers:1', 0, Webhook(id='1', token='a')).id == 1
+    assert second.add('timers:1', 0, Webhook(id='2', token='b')).id == 1
+
+    assert db.get('webhooks.timers:1') == '1.a'
+    assert second.get('timers:1').id == 1
+
+
+def test_losing_webhook_deleted(db):
+    api = APIClient()
+    api.webhooks = WebhookRegistry(db)
+    db.set('webhooks.timers:1', '1.a')
+
+    api.http.post = lambda path, json=None, priority=None: Response(
+        {'id': '2', 'token': 'b'})
+    deleted = []
+    api.delete_webhook = lambda webhook, priority=None: deleted.append(
+        webhook.id)
+
+    assert api.create_webhook('timers:1', 1).id == 1
+    assert deleted == [2]
+
+
+def test_invalidate_compares_and_deletes(db):
+    db.set('webhooks.timers:1', '1.a')
+    stale = WebhookRegistry(db)
+    webhook = stale.get('timers:1')
+
+    # Already replaced by another process
+    db.set('webhooks.timers:1', '2.b')
+    stale.invalidate('timers:1', 0, webhook)
+    assert db.get('webhooks.timers:1') == '2.b'
+
+    fresh = WebhookRegistry(db)
+    fresh.invalidate('timers:1', 0, fresh.get('timers:1'))
+    assert db.get('webhooks.timers:1') is None
+    assert fresh.get('timers:1') is None